@@ -0,0 +1,28 @@
+"""Add synthetic transfers flag
+
+Revision ID: 4567a2d811f2
+Revises: f4f131965030
+Create Date: 2026-10-19 11:04:27.318904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4567a2d811f2'
+down_revision: Union[str, None] = 'f4f131965030'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('transfers', sa.Column('is_synthetic', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('transfers', 'is_synthetic')
@@ -0,0 +1,211 @@
+"""Partition GTFS tables by feed
+
+Revision ID: 9c1e7a4b2d3f
+Revises: 4567a2d811f2
+Create Date: 2026-10-19 16:22:05.114382
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from feeds import DEFAULT_FEED_ID, partition_name
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c1e7a4b2d3f'
+down_revision: Union[str, None] = '4567a2d811f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Les données déjà chargées deviennent le flux "default" : chaque table est renommée en
+# "<table>__default" puis attachée comme partition de la nouvelle table partitionnée.
+
+# Table -> clé primaire (sans feed_id), dans l'ordre des dépendances
+PRIMARY_KEYS = [
+    ('agencies', ['agency_id'], None),
+    ('calendar', ['service_id'], None),
+    ('feed_info', [], None),
+    ('levels', ['level_id'], None),
+    ('shapes', ['shape_id', 'shape_pt_sequence'], 'pk_shapes'),
+    ('calendar_dates', ['service_id', 'date'], None),
+    ('fare_attributes', ['fare_id'], None),
+    ('routes', ['route_id'], None),
+    ('stops', ['stop_id'], None),
+    ('fare_rules', ['id'], None),
+    ('pathways', ['pathway_id'], None),
+    ('patterns', ['pattern_id'], None),
+    ('transfers', ['from_stop_id', 'to_stop_id'], None),
+    ('trips', ['trip_id'], None),
+    ('frequencies', ['trip_id', 'start_time'], None),
+    ('pattern_stops', ['pattern_id', 'stop_sequence'], 'pk_pattern_stops'),
+    ('pattern_trips', ['trip_id'], None),
+    ('stop_times', ['trip_id', 'stop_sequence'], None),
+]
+# Clés artificielles remplacées par la clé GTFS
+DROPPED_ID_TABLES = ['calendar_dates', 'frequencies', 'stop_times', 'transfers']
+
+# (table, colonne, table référencée, colonne référencée), toutes préfixées par feed_id
+FOREIGN_KEYS = [
+    ('calendar_dates', 'service_id', 'calendar', 'service_id'),
+    ('fare_attributes', 'agency_id', 'agencies', 'agency_id'),
+    ('routes', 'agency_id', 'agencies', 'agency_id'),
+    ('stops', 'level_id', 'levels', 'level_id'),
+    ('stops', 'parent_station', 'stops', 'stop_id'),
+    ('fare_rules', 'fare_id', 'fare_attributes', 'fare_id'),
+    ('fare_rules', 'route_id', 'routes', 'route_id'),
+    ('fare_rules', 'origin_id', 'stops', 'stop_id'),
+    ('fare_rules', 'destination_id', 'stops', 'stop_id'),
+    ('fare_rules', 'contains_id', 'stops', 'stop_id'),
+    ('pathways', 'from_stop_id', 'stops', 'stop_id'),
+    ('pathways', 'to_stop_id', 'stops', 'stop_id'),
+    ('patterns', 'route_id', 'routes', 'route_id'),
+    ('transfers', 'from_stop_id', 'stops', 'stop_id'),
+    ('transfers', 'to_stop_id', 'stops', 'stop_id'),
+    ('trips', 'route_id', 'routes', 'route_id'),
+    ('trips', 'service_id', 'calendar', 'service_id'),
+    ('frequencies', 'trip_id', 'trips', 'trip_id'),
+    ('pattern_stops', 'pattern_id', 'patterns', 'pattern_id'),
+    ('pattern_stops', 'stop_id', 'stops', 'stop_id'),
+    ('pattern_trips', 'trip_id', 'trips', 'trip_id'),
+    ('pattern_trips', 'pattern_id', 'patterns', 'pattern_id'),
+    ('stop_times', 'trip_id', 'trips', 'trip_id'),
+    ('stop_times', 'stop_id', 'stops', 'stop_id'),
+]
+
+# Schéma d'avant la migration, rétabli par downgrade : clés primaires (noms par défaut de
+# PostgreSQL sauf pk_shapes / pk_pattern_stops) et index créés par les migrations précédentes
+OLD_PRIMARY_KEYS = {'feed_info': ['feed_publisher_name'], **{table: ['id'] for table in DROPPED_ID_TABLES}}
+OLD_INDEXES = [
+    ('agencies', 'agency_id'),
+    ('calendar', 'service_id'),
+    ('feed_info', 'feed_publisher_name'),
+    ('levels', 'level_id'),
+    ('shapes', 'shape_id'),
+    ('calendar_dates', 'service_id'),
+    ('fare_attributes', 'fare_id'),
+    ('routes', 'route_id'),
+    ('stops', 'stop_id'),
+    ('fare_rules', 'fare_id'),
+    ('pathways', 'pathway_id'),
+    ('patterns', 'pattern_id'),
+    ('patterns', 'route_id'),
+    ('trips', 'route_id'),
+    ('trips', 'service_id'),
+    ('trips', 'shape_id'),
+    ('trips', 'trip_id'),
+    ('frequencies', 'trip_id'),
+    ('pattern_stops', 'stop_id'),
+    ('pattern_trips', 'pattern_id'),
+    ('pattern_trips', 'trip_id'),
+    ('stop_times', 'stop_id'),
+    ('stop_times', 'trip_id'),
+]
+
+INDEXES = [
+    ('shapes', 'shape_id'),
+    ('fare_rules', 'fare_id'),
+    ('patterns', 'route_id'),
+    ('trips', 'route_id'),
+    ('trips', 'service_id'),
+    ('trips', 'shape_id'),
+    ('pattern_stops', 'stop_id'),
+    ('pattern_trips', 'pattern_id'),
+    ('stop_times', 'stop_id'),
+]
+
+
+def _drop_constraints_and_indexes(tables) -> None:
+    # Les anciennes contraintes et index ne portent pas feed_id : clés étrangères d'abord,
+    # puis clés primaires, puis index restants (noms générés par PostgreSQL, lus dans le catalogue)
+    names = ", ".join(f"'{table}'::regclass" for table in tables)
+    op.execute(f"""
+    DO $$
+    DECLARE r record;
+    BEGIN
+        FOR r IN SELECT conrelid::regclass AS tbl, conname FROM pg_constraint
+                 WHERE contype = 'f' AND conrelid IN ({names}) LOOP
+            EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', r.tbl, r.conname);
+        END LOOP;
+        FOR r IN SELECT conrelid::regclass AS tbl, conname FROM pg_constraint
+                 WHERE contype = 'p' AND conrelid IN ({names}) LOOP
+            EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', r.tbl, r.conname);
+        END LOOP;
+        FOR r IN SELECT indexrelid::regclass AS idx FROM pg_index WHERE indrelid IN ({names}) LOOP
+            EXECUTE format('DROP INDEX %s', r.idx);
+        END LOOP;
+    END $$;
+    """)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('feeds',
+    sa.Column('feed_id', sa.String(), nullable=False),
+    sa.Column('loaded_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('feed_id')
+    )
+
+    tables = [table for table, _, _ in PRIMARY_KEYS]
+    _drop_constraints_and_indexes(tables)
+
+    for table, key, pk_name in PRIMARY_KEYS:
+        partition = f'{table}__default'
+        op.add_column(table, sa.Column('feed_id', sa.String(), nullable=False, server_default='default'))
+        op.alter_column(table, 'feed_id', server_default=None)
+        if table in DROPPED_ID_TABLES:
+            op.drop_column(table, 'id')
+        op.rename_table(table, partition)
+        op.execute(f'CREATE TABLE {table} (LIKE {partition} INCLUDING DEFAULTS) PARTITION BY LIST (feed_id)')
+        op.create_primary_key(pk_name or f'{table}_pkey', table, ['feed_id'] + key)
+        # La clé primaire de la partition est créée à l'attachement
+        op.execute(f"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES IN ('default')")
+
+    for table, column in INDEXES:
+        op.create_index(f'ix_{table}_{column}', table, [column], unique=False)
+    for table, column, referred, referred_column in FOREIGN_KEYS:
+        op.create_foreign_key(f'fk_{table}_{column}', table, referred, ['feed_id', column], ['feed_id', referred_column])
+
+    op.execute("INSERT INTO feeds (feed_id, loaded_at) SELECT 'default', now() WHERE EXISTS (SELECT 1 FROM stops)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # L'ancien schéma n'a qu'un flux : on garde celui servi par l'API (GTFS_FEED_ID), les
+    # partitions des autres flux sont supprimées avec les tables partitionnées. Les clés
+    # artificielles (id) sont renumérotées ; les colonnes id et feed_id changent de position.
+    connection = op.get_bind()
+    feed_ids = [feed_id for (feed_id,) in connection.execute(sa.text("SELECT feed_id FROM feeds"))]
+    if feed_ids and DEFAULT_FEED_ID not in feed_ids:
+        raise RuntimeError(f"Feed {DEFAULT_FEED_ID} is not loaded: set GTFS_FEED_ID to the feed to keep ({', '.join(feed_ids)}).")
+
+    for table, column, _, _ in FOREIGN_KEYS:
+        op.drop_constraint(f'fk_{table}_{column}', table, type_='foreignkey')
+    for table, column in INDEXES:
+        op.drop_index(f'ix_{table}_{column}', table_name=table)
+
+    tables = [table for table, _, _ in PRIMARY_KEYS]
+    for table in tables:
+        partition = partition_name(table, DEFAULT_FEED_ID)
+        if connection.execute(sa.text("SELECT to_regclass(:name)"), {"name": f'"{partition}"'}).scalar() is None:
+            op.execute(f'CREATE TABLE "{partition}" (LIKE {table} INCLUDING DEFAULTS)')
+        else:
+            op.execute(f'ALTER TABLE {table} DETACH PARTITION "{partition}"')
+        op.drop_table(table)  # Avec les partitions des autres flux
+        op.rename_table(partition, table)
+    # Clés primaires héritées des tables partitionnées (noms propres à chaque partition)
+    _drop_constraints_and_indexes(tables)
+
+    for table, key, pk_name in PRIMARY_KEYS:
+        op.drop_column(table, 'feed_id')
+        if table in DROPPED_ID_TABLES:
+            op.execute(f'ALTER TABLE {table} ADD COLUMN id SERIAL')
+        op.create_primary_key(pk_name or f'{table}_pkey', table, OLD_PRIMARY_KEYS.get(table, key))
+
+    for table, column in OLD_INDEXES:
+        op.create_index(op.f(f'ix_{table}_{column}'), table, [column], unique=False)
+    for table, column, referred, referred_column in FOREIGN_KEYS:
+        op.create_foreign_key(f'{table}_{column}_fkey', table, referred, [column], [referred_column])
+
+    op.drop_table('feeds')
@@ -0,0 +1,53 @@
+"""Add stop_routes inverted index
+
+Revision ID: b7d2e5f1a8c4
+Revises: 9c1e7a4b2d3f
+Create Date: 2026-10-19 18:47:30.285116
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from feeds import partition_name
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d2e5f1a8c4'
+down_revision: Union[str, None] = '9c1e7a4b2d3f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('stop_routes',
+    sa.Column('feed_id', sa.String(), nullable=False),
+    sa.Column('stop_id', sa.String(), nullable=False),
+    sa.Column('route_id', sa.String(), nullable=False),
+    sa.Column('pattern_count', sa.Integer(), nullable=False),
+    sa.Column('trip_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['feed_id', 'route_id'], ['routes.feed_id', 'routes.route_id'], ),
+    sa.ForeignKeyConstraint(['feed_id', 'stop_id'], ['stops.feed_id', 'stops.stop_id'], ),
+    sa.PrimaryKeyConstraint('feed_id', 'stop_id', 'route_id'),
+    postgresql_partition_by='LIST (feed_id)'
+    )
+
+    # Une partition par flux déjà inscrit, remplie à partir de ses patterns
+    connection = op.get_bind()
+    for (feed_id,) in connection.execute(sa.text("SELECT feed_id FROM feeds")):
+        literal = "'" + feed_id.replace("'", "''") + "'"
+        op.execute(f'CREATE TABLE "{partition_name("stop_routes", feed_id)}" PARTITION OF stop_routes FOR VALUES IN ({literal})')
+    op.execute("""
+    INSERT INTO stop_routes (feed_id, stop_id, route_id, pattern_count, trip_count)
+    SELECT p.feed_id, ps.stop_id, p.route_id, count(*), sum(p.trip_count)
+    FROM (SELECT DISTINCT feed_id, pattern_id, stop_id FROM pattern_stops) ps
+    JOIN patterns p ON p.feed_id = ps.feed_id AND p.pattern_id = ps.pattern_id
+    GROUP BY p.feed_id, ps.stop_id, p.route_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('stop_routes')
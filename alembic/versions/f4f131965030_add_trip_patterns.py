@@ -0,0 +1,69 @@
+"""Add trip patterns
+
+Revision ID: f4f131965030
+Revises: 0f12dac20d0d
+Create Date: 2026-10-19 09:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4f131965030'
+down_revision: Union[str, None] = '0f12dac20d0d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('patterns',
+    sa.Column('pattern_id', sa.String(), nullable=False),
+    sa.Column('route_id', sa.String(), nullable=False),
+    sa.Column('direction_id', sa.Integer(), nullable=True),
+    sa.Column('shape_id', sa.String(), nullable=True),
+    sa.Column('trip_headsign', sa.String(), nullable=True),
+    sa.Column('stop_count', sa.Integer(), nullable=False),
+    sa.Column('trip_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['route_id'], ['routes.route_id'], ),
+    sa.PrimaryKeyConstraint('pattern_id')
+    )
+    op.create_index(op.f('ix_patterns_pattern_id'), 'patterns', ['pattern_id'], unique=False)
+    op.create_index(op.f('ix_patterns_route_id'), 'patterns', ['route_id'], unique=False)
+    op.create_table('pattern_stops',
+    sa.Column('pattern_id', sa.String(), nullable=False),
+    sa.Column('stop_sequence', sa.Integer(), nullable=False),
+    sa.Column('stop_id', sa.String(), nullable=False),
+    sa.Column('arrival_offset', sa.Integer(), nullable=True),
+    sa.Column('departure_offset', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['pattern_id'], ['patterns.pattern_id'], ),
+    sa.ForeignKeyConstraint(['stop_id'], ['stops.stop_id'], ),
+    sa.PrimaryKeyConstraint('pattern_id', 'stop_sequence', name='pk_pattern_stops')
+    )
+    op.create_index(op.f('ix_pattern_stops_stop_id'), 'pattern_stops', ['stop_id'], unique=False)
+    op.create_table('pattern_trips',
+    sa.Column('trip_id', sa.String(), nullable=False),
+    sa.Column('pattern_id', sa.String(), nullable=False),
+    sa.Column('start_time', sa.Integer(), nullable=False),
+    sa.Column('time_vector', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['pattern_id'], ['patterns.pattern_id'], ),
+    sa.ForeignKeyConstraint(['trip_id'], ['trips.trip_id'], ),
+    sa.PrimaryKeyConstraint('trip_id')
+    )
+    op.create_index(op.f('ix_pattern_trips_pattern_id'), 'pattern_trips', ['pattern_id'], unique=False)
+    op.create_index(op.f('ix_pattern_trips_trip_id'), 'pattern_trips', ['trip_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_pattern_trips_trip_id'), table_name='pattern_trips')
+    op.drop_index(op.f('ix_pattern_trips_pattern_id'), table_name='pattern_trips')
+    op.drop_table('pattern_trips')
+    op.drop_index(op.f('ix_pattern_stops_stop_id'), table_name='pattern_stops')
+    op.drop_table('pattern_stops')
+    op.drop_index(op.f('ix_patterns_route_id'), table_name='patterns')
+    op.drop_index(op.f('ix_patterns_pattern_id'), table_name='patterns')
+    op.drop_table('patterns')
@@ -0,0 +1,337 @@
+# benchmark.py
+# Banc d'essai HTTP de l'API : démarre l'application (uvicorn) sur la base locale, lui
+# envoie un trafic mixte réaliste (fiches d'arrêts, listes de routes, pages d'horaires...)
+# à plusieurs niveaux de concurrence, puis rapporte le débit (req/s) et les latences
+# p50/p95/p99 par endpoint. Les résultats sont comparés à une référence enregistrée :
+# le script sort en erreur (code 1) si un p95 ou un débit se dégrade au-delà du seuil.
+#
+# Utilisation :
+#   python benchmark.py --save-baseline                 # mesure et enregistre la référence
+#   python benchmark.py                                 # mesure et compare à la référence
+#   python benchmark.py --seed                          # charge d'abord data/ dans la base (vide)
+#   python benchmark.py --seed --synthetic 10           # ... ou un flux synthétique 10 fois plus gros
+#   python benchmark.py --url http://localhost:8000     # API déjà lancée, sans démarrage ni seed
+#
+# La base est celle des variables DB_* (comme l'API) : --seed y écrit, à réserver à une
+# base locale dédiée au banc d'essai.
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import httpx
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+BASELINE_FILE = os.path.join(BASE_DIR, "benchmark_baseline.json")
+
+DEFAULT_CONCURRENCY = (1, 8, 32)
+DEFAULT_THRESHOLD = 0.20  # Dégradation tolérée : +20 % sur un p95, -20 % sur le débit
+MIN_REGRESSION_MS = 1.0  # En dessous, un écart de p95 relève du bruit de mesure
+STARTUP_TIMEOUT = 300  # Le démarrage construit l'index horaire et le routeur
+
+# Trafic mixte : endpoint (gabarit de route) -> poids relatif
+TRAFFIC_MIX = {
+    "GET /stops/{stop_id}": 30,
+    "GET /stops/": 10,
+    "GET /routes/": 10,
+    "GET /routes/{route_id}": 10,
+    "GET /routes/{route_id}/trips/": 10,
+    "GET /trips/{trip_id}/stop_times/": 20,
+    "GET /stops/{stop_id}/departures": 10,  # Seulement avec --at (sinon "maintenant", hors calendrier)
+}
+
+
+# --- Flux synthétique ---
+def _is_id_column(name: str) -> bool:
+    return name.endswith("_id") or name == "parent_station"
+
+
+def synthetic_feed(src: str, dst: str, copies: int) -> str:
+    """
+    Écrit dans `dst` un flux `copies` fois plus gros que `src` : chaque copie préfixe tous
+    ses identifiants ("s1_", "s2_"...) et décale ses arrêts et tracés vers le nord, pour ne
+    pas créer de correspondances à pied entre copies.
+    """
+    os.makedirs(dst, exist_ok=True)
+    for filename in sorted(os.listdir(src)):
+        if not filename.endswith(".txt"):
+            continue
+        with open(os.path.join(src, filename), "r", encoding="utf-8-sig", newline="") as f:
+            reader = csv.DictReader(f)
+            fieldnames = reader.fieldnames or []
+            rows = list(reader)
+        with open(os.path.join(dst, filename), "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            for copy in range(copies if filename != "feed_info.txt" else 1):
+                prefix = f"s{copy}_" if copy else ""
+                for row in rows:
+                    if copy:
+                        row = {
+                            key: (prefix + value if value and _is_id_column(key) else value)
+                            for key, value in row.items()
+                        }
+                        for key in ("stop_lat", "shape_pt_lat"):
+                            if row.get(key):
+                                row[key] = f"{float(row[key]) + copy * 0.5:.6f}"
+                    writer.writerow(row)
+    return dst
+
+
+def seed_database(feed_dir: str) -> None:
+    """Migre la base locale puis y charge le flux de `feed_dir` avec seed.py."""
+    from alembic import command
+    from alembic.config import Config
+    from sqlalchemy import func
+
+    command.upgrade(Config(os.path.join(BASE_DIR, "alembic.ini")), "head")
+
+    import models
+    import seed
+    with seed.SessionLocal() as db_session:
+        if db_session.query(func.count(models.Stop.stop_id)).scalar():
+            raise SystemExit("The database already contains stops: --seed needs an empty database.")
+    seed.main(["--data", feed_dir])
+
+
+# --- Serveur ---
+def start_server(port: int, workers: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BASE_DIR,
+    )
+
+
+def wait_until_ready(base_url: str, server: Optional[subprocess.Popen] = None) -> None:
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            raise SystemExit(f"The API exited during startup (code {server.returncode}).")
+        try:
+            if httpx.get(f"{base_url}/agencies/", params={"limit": 1}, timeout=5).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(1)
+    raise SystemExit(f"The API did not answer within {STARTUP_TIMEOUT} s.")
+
+
+# --- Trafic ---
+def sample_ids(base_url: str, rng: random.Random, sample_size: int = 200) -> Dict[str, list]:
+    """Identifiants réels pris dans l'API elle-même (arrêts, routes, trajets)."""
+    with httpx.Client(base_url=base_url, timeout=60) as client:
+        stops = [stop["stop_id"] for stop in client.get("/stops/", params={"limit": 100000}).json()]
+        routes = [route["route_id"] for route in client.get("/routes/", params={"limit": 100000}).json()]
+        trips: List[str] = []
+        for route_id in rng.sample(routes, min(len(routes), 20)):
+            trips.extend(trip["trip_id"] for trip in client.get(f"/routes/{quote(route_id, safe='/')}/trips/").json())
+    if not stops or not routes or not trips:
+        raise SystemExit("The API returned no stops, routes or trips: load a feed first (--seed).")
+    return {
+        "stops": rng.sample(stops, min(len(stops), sample_size)),
+        "stop_pages": list(range(0, len(stops), 100)),
+        "routes": rng.sample(routes, min(len(routes), sample_size)),
+        "trips": rng.sample(trips, min(len(trips), sample_size)),
+    }
+
+
+def next_request(endpoint: str, ids: Dict[str, list], rng: random.Random, at: Optional[str]) -> Tuple[str, dict]:
+    """URL et paramètres d'une requête tirée au hasard pour `endpoint`."""
+    def pick(kind: str) -> str:
+        return quote(rng.choice(ids[kind]), safe="/")
+
+    if endpoint == "GET /stops/{stop_id}":
+        return f"/stops/{pick('stops')}", {}
+    if endpoint == "GET /stops/":
+        return "/stops/", {"skip": rng.choice(ids["stop_pages"]), "limit": 100}
+    if endpoint == "GET /routes/":
+        return "/routes/", {}
+    if endpoint == "GET /routes/{route_id}":
+        return f"/routes/{pick('routes')}", {}
+    if endpoint == "GET /routes/{route_id}/trips/":
+        return f"/routes/{pick('routes')}/trips/", {}
+    if endpoint == "GET /trips/{trip_id}/stop_times/":
+        return f"/trips/{pick('trips')}/stop_times/", {"skip": rng.choice((0, 0, 20, 40)), "limit": 20}
+    if endpoint == "GET /stops/{stop_id}/departures":
+        return f"/stops/{pick('stops')}/departures", {"at": at}
+    raise ValueError(endpoint)
+
+
+async def run_level(base_url: str, concurrency: int, duration: float, warmup: float,
+                    ids: Dict[str, list], mix: Dict[str, int], at: Optional[str], seed: int) -> dict:
+    """`concurrency` clients enchaînent des requêtes pendant `duration` secondes (après la chauffe)."""
+    endpoints = list(mix)
+    weights = list(mix.values())
+    latencies: Dict[str, List[float]] = {endpoint: [] for endpoint in endpoints}
+    errors: Dict[str, int] = {endpoint: 0 for endpoint in endpoints}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        start = time.perf_counter()
+        measure_from = start + warmup
+        stop_at = measure_from + duration
+
+        async def user(rng: random.Random) -> None:
+            while True:
+                endpoint = rng.choices(endpoints, weights)[0]
+                url, params = next_request(endpoint, ids, rng, at)
+                sent = time.perf_counter()
+                if sent >= stop_at:
+                    return
+                try:
+                    status = (await client.get(url, params=params)).status_code
+                except httpx.HTTPError:
+                    status = None
+                received = time.perf_counter()
+                if sent >= measure_from:
+                    latencies[endpoint].append(received - sent)
+                    if status is None or status >= 400:
+                        errors[endpoint] += 1
+
+        await asyncio.gather(*(user(random.Random(seed * 1000 + i)) for i in range(concurrency)))
+
+    result = {"concurrency": concurrency, "duration": duration, "requests": 0, "errors": 0, "endpoints": {}}
+    for endpoint in endpoints:
+        samples = np.array(latencies[endpoint]) * 1000
+        if not len(samples):
+            continue
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        result["endpoints"][endpoint] = {
+            "requests": len(samples),
+            "errors": errors[endpoint],
+            "rps": round(len(samples) / duration, 1),
+            "p50_ms": round(float(p50), 2),
+            "p95_ms": round(float(p95), 2),
+            "p99_ms": round(float(p99), 2),
+        }
+        result["requests"] += len(samples)
+        result["errors"] += errors[endpoint]
+    result["rps"] = round(result["requests"] / duration, 1)
+    return result
+
+
+# --- Rapport et comparaison ---
+def print_report(results: List[dict]) -> None:
+    for level in results:
+        print(f"\nConcurrency {level['concurrency']}: {level['rps']} req/s, "
+              f"{level['requests']} requests, {level['errors']} errors")
+        print(f"  {'endpoint':<36} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for endpoint, stats in level["endpoints"].items():
+            print(f"  {endpoint:<36} {stats['rps']:>8} {stats['p50_ms']:>8} {stats['p95_ms']:>8} "
+                  f"{stats['p99_ms']:>8} {stats['errors']:>7}")
+
+
+def compare(results: List[dict], baseline: List[dict], threshold: float) -> List[str]:
+    """Régressions par rapport à la référence : p95 par endpoint et débit global, par niveau."""
+    regressions = []
+    reference = {level["concurrency"]: level for level in baseline}
+    for level in results:
+        base = reference.get(level["concurrency"])
+        if base is None:
+            continue
+        if level["rps"] < base["rps"] * (1 - threshold):
+            regressions.append(f"concurrency {level['concurrency']}: {level['rps']} req/s "
+                               f"(baseline {base['rps']})")
+        for endpoint, stats in level["endpoints"].items():
+            base_stats = base["endpoints"].get(endpoint)
+            if base_stats is None:
+                continue
+            limit = base_stats["p95_ms"] * (1 + threshold)
+            if stats["p95_ms"] > limit and stats["p95_ms"] - base_stats["p95_ms"] > MIN_REGRESSION_MS:
+                regressions.append(f"concurrency {level['concurrency']}, {endpoint}: p95 {stats['p95_ms']} ms "
+                                   f"(baseline {base_stats['p95_ms']} ms)")
+        if level["errors"] > base["errors"]:
+            regressions.append(f"concurrency {level['concurrency']}: {level['errors']} errors "
+                               f"(baseline {base['errors']})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai HTTP de l'API (débit et latences par endpoint).")
+    parser.add_argument("--url", help="API déjà lancée (sinon uvicorn est démarré sur --port)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="Processus uvicorn")
+    parser.add_argument("--seed", action="store_true", help="Migre et charge le flux dans la base locale (vide)")
+    parser.add_argument("--data", default=DATA_DIR, help="Dossier du flux GTFS à charger")
+    parser.add_argument("--synthetic", type=int, default=1, metavar="N", help="Charge le flux répliqué N fois")
+    parser.add_argument("--concurrency", default=",".join(map(str, DEFAULT_CONCURRENCY)),
+                        help="Niveaux de concurrence, ex. 1,8,32")
+    parser.add_argument("--duration", type=float, default=10, help="Durée mesurée par niveau (secondes)")
+    parser.add_argument("--warmup", type=float, default=2, help="Chauffe non mesurée par niveau (secondes)")
+    parser.add_argument("--at", help="Instant des requêtes de départs (ISO 8601, dans la période du flux)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Fichier de référence")
+    parser.add_argument("--save-baseline", action="store_true", help="Enregistre les résultats comme référence")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Dégradation tolérée (0.2 = 20 %%)")
+    parser.add_argument("--out", help="Écrit aussi les résultats en JSON")
+    parser.add_argument("--random-seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.seed:
+        if args.synthetic > 1:
+            feed_dir = synthetic_feed(args.data, tempfile.mkdtemp(prefix="gtfs-synthetic-"), args.synthetic)
+            print(f"Synthetic feed ({args.synthetic} copies) written to {feed_dir}.")
+        else:
+            feed_dir = args.data
+        seed_database(feed_dir)
+
+    mix = {endpoint: weight for endpoint, weight in TRAFFIC_MIX.items()
+           if args.at or endpoint != "GET /stops/{stop_id}/departures"}
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+
+    server = None
+    base_url = args.url.rstrip("/") if args.url else f"http://127.0.0.1:{args.port}"
+    if not args.url:
+        print(f"Starting the API on {base_url}...")
+        server = start_server(args.port, args.workers)
+    try:
+        wait_until_ready(base_url, server)
+        rng = random.Random(args.random_seed)
+        ids = sample_ids(base_url, rng)
+        results = []
+        for concurrency in levels:
+            print(f"Running {args.duration:g} s at concurrency {concurrency}...")
+            results.append(asyncio.run(run_level(
+                base_url, concurrency, args.duration, args.warmup, ids, mix, args.at, args.random_seed,
+            )))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    print_report(results)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}.")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}: run with --save-baseline to create one.")
+        return
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        sys.exit(1)
+    print(f"\nNo regression beyond {args.threshold:.0%} against {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
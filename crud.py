@@ -1,14 +1,28 @@
 # app/crud.py
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 import models, schemas # Ajustez les imports
-from typing import List, Optional
+from query_cache import cached # Lectures mémoïsées jusqu'au prochain rechargement du flux
+from typing import Dict, List, Optional
+
+# Chaque lecture est limitée à un flux (feed_id) : PostgreSQL ne lit que sa partition
+
+# --- Feed CRUD ---
+@cached
+def get_feed(db: Session, feed_id: str) -> Optional[models.Feed]:
+    return db.query(models.Feed).filter(models.Feed.feed_id == feed_id).first()
+
+@cached
+def get_feeds(db: Session) -> List[models.Feed]:
+    return db.query(models.Feed).order_by(models.Feed.feed_id).all()
 
 # --- Agency CRUD ---
-def get_agency(db: Session, agency_id: str) -> Optional[models.Agency]:
-    return db.query(models.Agency).filter(models.Agency.agency_id == agency_id).first()
+@cached
+def get_agency(db: Session, feed_id: str, agency_id: str) -> Optional[models.Agency]:
+    return db.query(models.Agency).filter(models.Agency.feed_id == feed_id, models.Agency.agency_id == agency_id).first()
 
-def get_agencies(db: Session, skip: int = 0, limit: int = 100) -> List[models.Agency]:
-    return db.query(models.Agency).offset(skip).limit(limit).all()
+@cached
+def get_agencies(db: Session, feed_id: str, skip: int = 0, limit: int = 100) -> List[models.Agency]:
+    return db.query(models.Agency).filter(models.Agency.feed_id == feed_id).offset(skip).limit(limit).all()
 
 # Pour GTFS, la création se fait via le seed. Mais si vous voulez ajouter un CRUD :
 # def create_agency(db: Session, agency: schemas.AgencyCreate) -> models.Agency:
@@ -19,29 +33,104 @@ def get_agencies(db: Session, skip: int = 0, limit: int = 100) -> List[models.Ag
 #     return db_agency
 
 # --- Stop CRUD ---
-def get_stop(db: Session, stop_id: str) -> Optional[models.Stop]:
-    return db.query(models.Stop).filter(models.Stop.stop_id == stop_id).first()
+@cached
+def get_stop(db: Session, feed_id: str, stop_id: str) -> Optional[models.Stop]:
+    return db.query(models.Stop).filter(models.Stop.feed_id == feed_id, models.Stop.stop_id == stop_id).first()
 
-def get_stops(db: Session, skip: int = 0, limit: int = 100) -> List[models.Stop]:
-    return db.query(models.Stop).offset(skip).limit(limit).all()
+@cached
+def get_stops(db: Session, feed_id: str, skip: int = 0, limit: int = 100, collapse_stations: bool = False) -> List[models.Stop]:
+    query = db.query(models.Stop).filter(models.Stop.feed_id == feed_id)
+    if collapse_stations:
+        # Stations et arrêts isolés seulement : les arrêts rattachés à une station sont masqués
+        query = query.filter(models.Stop.parent_station.is_(None))
+    return query.offset(skip).limit(limit).all()
 
 # --- Route CRUD ---
-def get_route(db: Session, route_id: str) -> Optional[models.Route]:
-    return db.query(models.Route).filter(models.Route.route_id == route_id).first()
+@cached
+def get_route(db: Session, feed_id: str, route_id: str) -> Optional[models.Route]:
+    return db.query(models.Route).filter(models.Route.feed_id == feed_id, models.Route.route_id == route_id).first()
 
-def get_routes(db: Session, agency_id: Optional[str] = None, skip: int = 0, limit: int = 100) -> List[models.Route]:
-    query = db.query(models.Route)
+@cached
+def get_routes(db: Session, feed_id: str, agency_id: Optional[str] = None, skip: int = 0, limit: int = 100) -> List[models.Route]:
+    query = db.query(models.Route).filter(models.Route.feed_id == feed_id)
     if agency_id:
         query = query.filter(models.Route.agency_id == agency_id)
     return query.offset(skip).limit(limit).all()
 
 # --- Trip CRUD ---
-def get_trips_by_route(db: Session, route_id: str, skip: int = 0, limit: int = 100) -> List[models.Trip]:
-    return db.query(models.Trip).filter(models.Trip.route_id == route_id).offset(skip).limit(limit).all()
+@cached
+def get_trip(db: Session, feed_id: str, trip_id: str) -> Optional[models.Trip]:
+    return db.query(models.Trip).filter(models.Trip.feed_id == feed_id, models.Trip.trip_id == trip_id).first()
+
+@cached
+def get_trips_by_route(db: Session, feed_id: str, route_id: str, skip: int = 0, limit: int = 100) -> List[models.Trip]:
+    return db.query(models.Trip).filter(models.Trip.feed_id == feed_id, models.Trip.route_id == route_id).offset(skip).limit(limit).all()
+
+# --- Pattern CRUD ---
+@cached
+def get_patterns_by_route(db: Session, feed_id: str, route_id: str) -> List[models.Pattern]:
+    return (
+        db.query(models.Pattern)
+        .options(selectinload(models.Pattern.stops))
+        .filter(models.Pattern.feed_id == feed_id, models.Pattern.route_id == route_id)
+        .order_by(models.Pattern.pattern_id)
+        .all()
+    )
+
+@cached
+def get_stops_by_route(db: Session, feed_id: str, route_id: str) -> List[models.Stop]:
+    # Arrêts desservis par la route, dans l'ordre de leur première apparition dans ses patterns
+    rows = (
+        db.query(models.PatternStop.stop_id)
+        .join(models.Pattern, (models.Pattern.feed_id == models.PatternStop.feed_id) & (models.Pattern.pattern_id == models.PatternStop.pattern_id))
+        .filter(models.Pattern.feed_id == feed_id, models.Pattern.route_id == route_id)
+        .order_by(models.Pattern.pattern_id, models.PatternStop.stop_sequence)
+        .all()
+    )
+    stop_ids = list(dict.fromkeys(row.stop_id for row in rows))
+    stops = {stop.stop_id: stop for stop in db.query(models.Stop).filter(models.Stop.feed_id == feed_id, models.Stop.stop_id.in_(stop_ids))}
+    return [stops[stop_id] for stop_id in stop_ids if stop_id in stops]
+
+@cached
+def get_routes_by_stop(db: Session, feed_id: str, stop_id: str) -> List[dict]:
+    # Index inversés stop_routes et pattern_stops : lectures par clé, proportionnelles au
+    # nombre de routes et de patterns de l'arrêt (aucun parcours de stop_times)
+    rows = (
+        db.query(models.StopRoute, models.Route)
+        .join(models.Route, (models.Route.feed_id == models.StopRoute.feed_id) & (models.Route.route_id == models.StopRoute.route_id))
+        .filter(models.StopRoute.feed_id == feed_id, models.StopRoute.stop_id == stop_id)
+        .all()
+    )
+    pattern_ids: Dict[str, List[str]] = {}
+    for pattern in (
+        db.query(models.Pattern.pattern_id, models.Pattern.route_id)
+        .join(models.PatternStop, (models.PatternStop.feed_id == models.Pattern.feed_id) & (models.PatternStop.pattern_id == models.Pattern.pattern_id))
+        .filter(models.PatternStop.feed_id == feed_id, models.PatternStop.stop_id == stop_id)
+        .distinct()
+        .order_by(models.Pattern.pattern_id)
+    ):
+        pattern_ids.setdefault(pattern.route_id, []).append(pattern.pattern_id)
+    rows.sort(key=lambda row: (row.Route.route_sort_order is None, row.Route.route_sort_order or 0, row.Route.route_short_name or "", row.Route.route_id))
+    return [
+        {
+            "route": row.Route,
+            "pattern_count": row.StopRoute.pattern_count,
+            "trip_count": row.StopRoute.trip_count,
+            "pattern_ids": pattern_ids.get(row.Route.route_id, []),
+        }
+        for row in rows
+    ]
 
 # --- StopTime CRUD ---
-def get_stop_times_by_trip(db: Session, trip_id: str, skip: int = 0, limit: int = 100) -> List[models.StopTime]:
-    return db.query(models.StopTime).filter(models.StopTime.trip_id == trip_id).order_by(models.StopTime.stop_sequence).offset(skip).limit(limit).all()
+@cached
+def get_stop_times_by_trip(db: Session, feed_id: str, trip_id: str, skip: int = 0, limit: int = 100) -> List[models.StopTime]:
+    return db.query(models.StopTime).filter(models.StopTime.feed_id == feed_id, models.StopTime.trip_id == trip_id).order_by(models.StopTime.stop_sequence).offset(skip).limit(limit).all()
+
+@cached
+def get_trip_stops(db: Session, feed_id: str, trip_id: str) -> Dict[str, models.Stop]:
+    # Arrêts desservis par un trajet, indexés par stop_id
+    stop_ids = db.query(models.StopTime.stop_id).filter(models.StopTime.feed_id == feed_id, models.StopTime.trip_id == trip_id)
+    return {stop.stop_id: stop for stop in db.query(models.Stop).filter(models.Stop.feed_id == feed_id, models.Stop.stop_id.in_(stop_ids))}
 
 # Ajoutez des fonctions CRUD pour tous vos autres modèles...
 # Ex: get_calendar_by_service_id, get_shapes_for_trip_id, etc.
\ No newline at end of file
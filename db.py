@@ -1,9 +1,15 @@
 # app/database.py (ou traafdata/database.py)
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
 # from sqlalchemy.ext.declarative import declarative_base # Base est déjà dans models.py
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, DisconnectionError
+from sqlalchemy.orm import Session, sessionmaker
+import itertools
 import os
+import threading
+import time
+from typing import List
 from dotenv import load_dotenv # <--- AJOUTER CET IMPORT
 
 load_dotenv() # <--- APPELER load_dotenv() ICI, AVANT DE LIRE LES VARIABLES
@@ -14,8 +20,18 @@ DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 
+# Réplicas en lecture : "hote1:5432,hote2" (mêmes identifiants et base que le primaire)
+DB_REPLICA_HOSTS = [host.strip() for host in os.getenv("DB_REPLICA_HOSTS", "").split(",") if host.strip()]
+# Délai avant de réessayer un réplica en échec (secondes)
+DB_REPLICA_RETRY_SECONDS = float(os.getenv("DB_REPLICA_RETRY_SECONDS", "30"))
+
+# Base embarquée en lecture seule : fichier SQLite compilé par embedded.py. Si défini,
+# l'API lit ce fichier localement, sans PostgreSQL ni réplicas.
+DB_SQLITE_PATH = os.getenv("DB_SQLITE_PATH")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
 # Vérification que les variables sont bien chargées (pour le débogage)
-if not all([DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME]):
+if not DB_SQLITE_PATH and not all([DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME]):
     print("ERREUR: Toutes les variables d'environnement de base de données ne sont pas définies.")
     print(f"DB_HOST: {DB_HOST}") # Pour voir quelle variable est None
     # Vous pourriez même lever une exception ici pour arrêter le démarrage de l'app
@@ -23,17 +39,165 @@ if not all([DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME]):
 
 SQLALCHEMY_DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+def _pool_options(role: str) -> dict:
+    """
+    Réglages du pool d'un moteur. Chaque valeur se lit d'abord dans DB_<ROLE>_<REGLAGE>
+    (ex. DB_REPLICA_POOL_SIZE), puis dans DB_<REGLAGE> commun aux moteurs, sinon
+    la valeur par défaut de SQLAlchemy.
+    """
+    def setting(name: str):
+        return os.getenv(f"DB_{role}_{name}", os.getenv(f"DB_{name}"))
+
+    options = {}
+    for name, key, cast in (
+        ("POOL_SIZE", "pool_size", int),
+        ("MAX_OVERFLOW", "max_overflow", int),
+        ("POOL_TIMEOUT", "pool_timeout", float),
+        ("POOL_RECYCLE", "pool_recycle", int),
+        ("POOL_PRE_PING", "pool_pre_ping", lambda v: v.lower() in ("1", "true", "yes")),
+    ):
+        value = setting(name)
+        if value is not None:
+            options[key] = cast(value)
+    return options
+
+
+def _replica_url(host: str) -> str:
+    hostname, _, port = host.partition(":")
+    return f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{hostname}:{port or DB_PORT}/{DB_NAME}"
+
+
+def _sqlite_engine(path: str) -> Engine:
+    """
+    Moteur en lecture seule sur une base embarquée. Le fichier ne change jamais sous
+    l'API (une nouvelle compilation le remplace par renommage) : ouvert en immutable,
+    SQLite se passe de verrous et plusieurs lecteurs travaillent en parallèle.
+    """
+    path = os.path.abspath(path)
+    sqlite_engine = create_engine(
+        f"sqlite:///file:{path}?mode=ro&immutable=1&uri=true",
+        connect_args={"check_same_thread": False},
+        **_pool_options("PRIMARY"),
+    )
+
+    @event.listens_for(sqlite_engine, "connect")
+    def _configure(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only = ON")
+        cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        cursor.close()
+        connection_record.info["inode"] = os.stat(path).st_ino
+
+    @event.listens_for(sqlite_engine, "checkout")
+    def _check_file(dbapi_connection, connection_record, connection_proxy):
+        # Fichier remplacé depuis l'ouverture : la connexion est rouverte sur le nouveau
+        if os.stat(path).st_ino != connection_record.info.get("inode"):
+            raise DisconnectionError("embedded database file replaced")
+
+    return sqlite_engine
+
+
+# Moteur primaire : chargements et écritures (seed, loadata, tables dérivées)
+# En mode embarqué, c'est le fichier SQLite, en lecture seule
+if DB_SQLITE_PATH:
+    engine = _sqlite_engine(DB_SQLITE_PATH)
+else:
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, **_pool_options("PRIMARY"))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+class ReplicaRouter:
+    """
+    Répartit les sessions en lecture seule entre les réplicas, à tour de rôle. Un réplica
+    dont la connexion échoue est écarté pendant DB_REPLICA_RETRY_SECONDS, puis sondé
+    (SELECT 1) avant d'être réutilisé. Sans réplica disponible, on lit sur le primaire.
+    """
+
+    def __init__(self, replicas: List[Engine], primary: Engine, retry_seconds: float = DB_REPLICA_RETRY_SECONDS):
+        self.replicas = replicas
+        self.primary = primary
+        self.retry_seconds = retry_seconds
+        self._down_until = {id(replica): 0.0 for replica in replicas}
+        self._cycle = itertools.cycle(replicas)
+        self._lock = threading.Lock()
+        for replica in replicas:
+            event.listen(replica, "handle_error", self._on_error)
+
+    def _on_error(self, context) -> None:
+        # Perte de connexion ou connexion impossible : le réplica est écarté
+        if context.is_disconnect or context.connection is None:
+            self.mark_down(context.engine)
+
+    def mark_down(self, replica: Engine) -> None:
+        self._down_until[id(replica)] = time.monotonic() + self.retry_seconds
+
+    def _probe(self, replica: Engine) -> bool:
+        try:
+            with replica.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            return True
+        except DBAPIError:
+            self.mark_down(replica)
+            return False
+
+    def healthy(self, replica: Engine) -> bool:
+        return self._down_until[id(replica)] <= time.monotonic()
+
+    def next_engine(self) -> Engine:
+        for _ in range(len(self.replicas)):
+            with self._lock:
+                replica = next(self._cycle)
+            down_until = self._down_until[id(replica)]
+            if down_until == 0.0:
+                return replica
+            if down_until <= time.monotonic() and self._probe(replica):
+                self._down_until[id(replica)] = 0.0
+                return replica
+        return self.primary
+
+    def status(self) -> List[dict]:
+        return [
+            {"url": replica.url.render_as_string(hide_password=True), "healthy": self.healthy(replica)}
+            for replica in self.replicas
+        ]
+
+
+replica_router = ReplicaRouter(
+    [create_engine(_replica_url(host), **_pool_options("REPLICA")) for host in DB_REPLICA_HOSTS if not DB_SQLITE_PATH],
+    engine,
+)
+_ReadSession = sessionmaker(autocommit=False, autoflush=False)
+
+
+def ReadSessionLocal() -> Session:
+    """Session en lecture seule, sur le prochain réplica disponible (ou le primaire)."""
+    for _ in range(len(replica_router.replicas)):
+        bind = replica_router.next_engine()
+        if bind is replica_router.primary:
+            break
+        session = _ReadSession(bind=bind)
+        try:
+            session.connection()  # Connexion prise tout de suite : un réplica injoignable est écarté ici
+            return session
+        except DBAPIError:
+            session.close()
+            replica_router.mark_down(bind)
+    return _ReadSession(bind=replica_router.primary)
+
+
+def all_engines() -> List[Engine]:
+    return [engine] + replica_router.replicas
+
 # Importer Base depuis votre fichier models.py
 from models import Base # Si database.py et models.py sont dans le même dossier/package
 # Ou ajustez le chemin d'import : from traafdata.models import Base
 
 # Dépendance pour obtenir la session de base de données
+# L'API ne fait que des lectures : ses sessions vont sur les réplicas
 def get_db():
-    db = SessionLocal()
+    db = ReadSessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -0,0 +1,92 @@
+# embedded.py
+# Compilation du flux GTFS en un fichier SQLite autonome, en lecture seule, pour les
+# déploiements embarqués (bornes, serveurs en périphérie) : l'API le lit localement quand
+# DB_SQLITE_PATH le désigne, sans PostgreSQL ni aller-retour réseau. Le fichier contient les
+# tables de models.py, les tables dérivées (distances des tracés, patterns, correspondances
+# à pied) et des index composés taillés pour les requêtes de crud.py.
+#
+# Utilisation : python embedded.py --out gtfs.sqlite [--data data/]
+
+import argparse
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import models
+import seed
+from feeds import DEFAULT_FEED_ID, create_feed
+from validate import validate_feed
+
+# Index en plus de ceux de models.py : (nom, table, colonnes). Les pages d'horaires d'un
+# trajet sont servies par la clé primaire (feed_id, trip_id, stop_sequence).
+EMBEDDED_INDEXES = (
+    # Filtre des routes par agence (crud.get_routes)
+    ("ix_routes_agency_id", "routes", ("agency_id",)),
+)
+
+
+def compile_feed(data_dir: str, out_path: str) -> str:
+    """
+    Valide puis charge le flux de `data_dir` dans un nouveau fichier SQLite, l'indexe et le compacte,
+    puis le publie en `out_path` par renommage (les API en cours rouvrent leurs connexions
+    sur le nouveau fichier). Retourne le chemin écrit.
+    """
+    report = validate_feed(data_dir)
+    report.print_summary()
+    if not report.valid:
+        raise ValueError(f"the feed in {data_dir} has {report.errors} errors")
+    staging = out_path + ".tmp"
+    if os.path.exists(staging):
+        os.remove(staging)
+    build_engine = create_engine(f"sqlite:///{staging}")
+
+    @event.listens_for(build_engine, "connect")
+    def _fast_load(dbapi_connection, connection_record):
+        # Fichier jetable tant qu'il n'est pas publié : ni journal ni fsync pendant le chargement
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode = OFF")
+        cursor.execute("PRAGMA synchronous = OFF")
+        cursor.close()
+
+    models.Base.metadata.create_all(build_engine)
+    create_feed(build_engine, DEFAULT_FEED_ID)  # Un seul flux par fichier, celui servi par défaut
+    seed.DATA_DIR = data_dir
+    db_session = sessionmaker(autocommit=False, autoflush=False, bind=build_engine)()
+    try:
+        seed.seed_feed(db_session, DEFAULT_FEED_ID)
+    finally:
+        db_session.close()
+
+    with build_engine.begin() as connection:
+        for name, table, columns in EMBEDDED_INDEXES:
+            connection.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+        connection.exec_driver_sql("ANALYZE")  # Statistiques pour le planificateur
+    with build_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql("VACUUM")
+    build_engine.dispose()
+
+    os.chmod(staging, 0o444)
+    os.replace(staging, out_path)
+    print(f"Embedded database written to {out_path} ({os.path.getsize(out_path)} bytes).")
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile le flux GTFS en une base SQLite embarquée, en lecture seule.")
+    parser.add_argument("--out", required=True, help="Fichier SQLite à produire")
+    parser.add_argument("--data", default=seed.DATA_DIR, help="Dossier du flux GTFS")
+    args = parser.parse_args()
+
+    try:
+        print("Compiling embedded database...")
+        compile_feed(args.data, args.out)
+        print("Embedded database compiled.")
+    except Exception as e:
+        print(f"An error occurred while compiling the embedded database: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# export.py
+# Export du flux tel qu'il est en base (nettoyé, complété : shape_dist_traveled calculés,
+# etc.) en archive GTFS zip, pour le republier aux partenaires. Chaque fichier GTFS est
+# produit par un COPY (SELECT ...) TO STDOUT WITH CSV HEADER : PostgreSQL formate lui-même
+# le CSV, qui est copié par blocs sur disque sans jamais passer en lignes Python.
+#
+# Les tables sont exportées en parallèle, une connexion par table, toutes sur le même
+# instantané (pg_export_snapshot, comme pg_dump -j) : l'archive est cohérente même si un
+# chargement a lieu pendant l'export. Chaque table est mise en zip dès que son COPY se
+# termine, pendant que les autres continuent ; l'archive est publiée par renommage.
+#
+# Un seul flux est exporté (--feed, par défaut GTFS_FEED_ID) : chaque COPY ne lit que sa
+# partition. Les tables dérivées (patterns, pattern_stops, pattern_trips) ne font pas
+# partie du GTFS et ne sont pas exportées, pas plus que les correspondances à pied
+# générées, sauf --with-synthetic-transfers.
+#
+# Utilisation : python export.py --out gtfs.zip [--feed <feed_id>] [--jobs 4]
+
+import argparse
+import csv
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Table
+from sqlalchemy.engine import Engine
+
+import models
+from feeds import DEFAULT_FEED_ID
+
+DEFAULT_JOBS = 4
+CHUNK_SIZE = 1024 * 1024  # Taille des blocs copiés du fichier temporaire vers le zip
+FETCH_ROWS = 10000  # Lignes par lot, hors PostgreSQL
+
+# Fichier GTFS -> (modèle, colonnes de tri). Les colonnes exportées sont celles du modèle,
+# sans les clés techniques ni les marques internes (EXCLUDED_COLUMNS).
+GTFS_FILES: Dict[str, Tuple[type, Tuple[str, ...]]] = {
+    "agency.txt": (models.Agency, ("agency_id",)),
+    "stops.txt": (models.Stop, ("stop_id",)),
+    "routes.txt": (models.Route, ("route_id",)),
+    "trips.txt": (models.Trip, ("trip_id",)),
+    "stop_times.txt": (models.StopTime, ("trip_id", "stop_sequence")),
+    "calendar.txt": (models.Calendar, ("service_id",)),
+    "calendar_dates.txt": (models.CalendarDate, ("service_id", "date")),
+    "fare_attributes.txt": (models.FareAttribute, ("fare_id",)),
+    "fare_rules.txt": (models.FareRule, ("id",)),
+    "shapes.txt": (models.Shape, ("shape_id", "shape_pt_sequence")),
+    "frequencies.txt": (models.Frequency, ("trip_id", "start_time")),
+    "transfers.txt": (models.Transfer, ("from_stop_id", "to_stop_id")),
+    "pathways.txt": (models.Pathway, ("pathway_id",)),
+    "levels.txt": (models.Level, ("level_id",)),
+    "feed_info.txt": (models.FeedInfo, ("feed_publisher_name",)),
+}
+EXCLUDED_COLUMNS = {"feed_id", "id", "is_synthetic"}
+
+
+def _select(filename: str, feed_id: str, with_synthetic_transfers: bool) -> Tuple[str, List[str]]:
+    """Requête SELECT d'un fichier GTFS d'un flux et ses colonnes, dans l'ordre du modèle."""
+    model, order_by = GTFS_FILES[filename]
+    table: Table = model.__table__
+    columns = [column.name for column in table.columns if column.name not in EXCLUDED_COLUMNS]
+    # Valeur littérale (COPY n'accepte pas de paramètres liés), constante pour l'élagage des partitions
+    query = f"SELECT {', '.join(columns)} FROM {table.name} WHERE feed_id = '{feed_id.replace(chr(39), chr(39) * 2)}'"
+    if model is models.Transfer and not with_synthetic_transfers:
+        query += " AND (is_synthetic IS NULL OR is_synthetic = 0)"
+    return f"{query} ORDER BY {', '.join(order_by)}", columns
+
+
+# --- Copie d'une table vers un fichier temporaire ---
+def _copy_postgresql(dbapi_connection, query: str, out) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER, NULL '', ENCODING 'UTF8')", out)
+    finally:
+        cursor.close()
+
+
+def _copy_rows(dbapi_connection, query: str, columns: List[str], out) -> None:
+    # Autres bases (fichier SQLite embarqué) : même CSV, par lots de FETCH_ROWS lignes
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+    writer = csv.writer(text, lineterminator="\n")
+    writer.writerow(columns)
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(query)
+        while True:
+            rows = cursor.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            writer.writerows(rows)
+    finally:
+        cursor.close()
+    text.detach()
+
+
+@contextmanager
+def _snapshot_connection(engine: Engine, snapshot_id: Optional[str]) -> Iterator:
+    """Connexion DBAPI en lecture seule, placée sur l'instantané exporté `snapshot_id`."""
+    connection = engine.raw_connection()
+    try:
+        if snapshot_id is not None:
+            cursor = connection.cursor()
+            # Première instruction de la transaction (psycopg2 ouvre la transaction implicitement)
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            cursor.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+            cursor.close()
+        yield connection
+    finally:
+        connection.rollback()
+        connection.close()
+
+
+def _export_table(engine: Engine, snapshot_id: Optional[str], filename: str, feed_id: str, with_synthetic_transfers: bool,
+                  tmp_dir: str) -> Tuple[str, str]:
+    query, columns = _select(filename, feed_id, with_synthetic_transfers)
+    fd, path = tempfile.mkstemp(prefix=filename, dir=tmp_dir)
+    with os.fdopen(fd, "wb") as out, _snapshot_connection(engine, snapshot_id) as connection:
+        if engine.dialect.name == "postgresql":
+            _copy_postgresql(connection, query, out)
+        else:
+            _copy_rows(connection, query, columns, out)
+    return filename, path
+
+
+# --- Archive ---
+def export_feed(engine: Engine, out_path: str, feed_id: str = DEFAULT_FEED_ID, jobs: int = DEFAULT_JOBS,
+                with_synthetic_transfers: bool = False) -> Dict[str, int]:
+    """
+    Écrit le flux `feed_id` de `engine` en archive GTFS `out_path`. Retourne le nombre de lignes
+    (hors en-tête) de chaque fichier. Les tables vides ne produisent pas de fichier.
+    """
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    staging = f"{out_path}.{os.getpid()}.tmp"
+    counts: Dict[str, int] = {}
+
+    leader = engine.raw_connection() if engine.dialect.name == "postgresql" else None
+    try:
+        snapshot_id = None
+        if leader is not None:
+            # Transaction ouverte pendant tout l'export : elle maintient l'instantané partagé
+            cursor = leader.cursor()
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            cursor.execute("SELECT pg_export_snapshot()")
+            snapshot_id = cursor.fetchone()[0]
+            cursor.close()
+
+        with tempfile.TemporaryDirectory(dir=out_dir) as tmp_dir, \
+                zipfile.ZipFile(staging, "w", compression=zipfile.ZIP_DEFLATED) as archive, \
+                ThreadPoolExecutor(max_workers=jobs) as pool:
+            # Les plus grosses tables d'abord : elles bornent la durée totale
+            ordered = sorted(GTFS_FILES, key=lambda name: name not in ("stop_times.txt", "shapes.txt"))
+            futures = [pool.submit(_export_table, engine, snapshot_id, name, feed_id, with_synthetic_transfers, tmp_dir) for name in ordered]
+            for future in as_completed(futures):
+                filename, path = future.result()
+                with open(path, "rb") as src:
+                    lines = sum(chunk.count(b"\n") for chunk in iter(lambda: src.read(CHUNK_SIZE), b""))
+                    if lines > 1:
+                        src.seek(0)
+                        with archive.open(filename, "w", force_zip64=True) as dst:
+                            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                os.remove(path)
+                counts[filename] = max(lines - 1, 0)
+                print(f"  {filename}: {counts[filename]} rows")
+        os.replace(staging, out_path)
+    finally:
+        if leader is not None:
+            leader.rollback()
+            leader.close()
+        if os.path.exists(staging):
+            os.remove(staging)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporte le flux de la base en archive GTFS (zip).")
+    parser.add_argument("--out", required=True, help="Archive zip à produire")
+    parser.add_argument("--feed", default=DEFAULT_FEED_ID, help="Flux à exporter")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="Tables exportées en parallèle")
+    parser.add_argument("--with-synthetic-transfers", action="store_true",
+                        help="Inclut les correspondances à pied générées (footpaths.py) dans transfers.txt")
+    args = parser.parse_args()
+
+    from db import replica_router
+    try:
+        print(f"Exporting GTFS feed {args.feed}...")
+        counts = export_feed(replica_router.next_engine(), args.out, feed_id=args.feed, jobs=args.jobs,
+                             with_synthetic_transfers=args.with_synthetic_transfers)
+        print(f"GTFS feed exported to {args.out} ({len([c for c in counts.values() if c])} files, {os.path.getsize(args.out)} bytes).")
+    except Exception as e:
+        print(f"An error occurred while exporting the feed: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
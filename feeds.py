@@ -0,0 +1,164 @@
+# feeds.py
+# Registre des flux chargés et gestion de leurs partitions. Chaque flux (un opérateur, ou
+# une version datée du même flux) a son feed_id ; sous PostgreSQL chaque table GTFS est
+# partitionnée par liste sur feed_id (cf. models.PARTITION_BY_FEED) et un flux possède une
+# partition par table, nommée "<table>__<feed_id>".
+#
+# - create : crée les partitions du flux et l'inscrit au registre, avant son chargement.
+# - drop   : retire le flux du registre (l'API cesse de le servir), puis détache et
+#            supprime ses partitions, tables qui référencent d'abord. Aucune ligne n'est
+#            supprimée une à une. Sous PostgreSQL (14 ou plus), chaque partition est détachée
+#            par DETACH PARTITION ... CONCURRENTLY, une instruction par transaction : la table
+#            parente n'est prise qu'en SHARE UPDATE EXCLUSIVE, les autres flux restent lisibles
+#            et modifiables, et le détachement attend la fin des requêtes qui lisent encore la
+#            partition. Le détachement d'une table référencée vérifie qu'aucune ligne ne la
+#            référence plus (les partitions qui la référencent sont déjà supprimées, la
+#            vérification ne trouve rien). Restent des verrous brefs sur les tables référencées :
+#            une partition détachée garde ses clés étrangères en propre (triggers créés sur les
+#            tables référencées, leurs écritures attendent), puis son DROP TABLE retire ces
+#            triggers sous ACCESS EXCLUSIVE (lectures comprises), le temps du catalogue.
+#            Interrompu, drop peut être relancé : il termine les détachements en suspens.
+#
+# Le flux servi par défaut (routes sans préfixe /feeds/{feed_id}, index horaire en mémoire)
+# est GTFS_FEED_ID. Hors PostgreSQL (base SQLite embarquée), les tables ne sont pas
+# partitionnées et un flux est supprimé ligne à ligne.
+#
+# Utilisation : python feeds.py list | create <feed_id> | drop <feed_id>
+
+import argparse
+import hashlib
+import os
+import re
+from datetime import datetime, timezone
+from typing import List
+
+from sqlalchemy import Table
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+import models
+
+DEFAULT_FEED_ID = os.getenv("GTFS_FEED_ID", "default")
+
+_SUFFIX_MAX = 36  # Noms de partition sous la limite de 63 caractères de PostgreSQL
+
+
+def feed_tables() -> List[Table]:
+    """Tables partitionnées par flux, dans l'ordre des dépendances (référencées d'abord)."""
+    return [
+        table for table in models.Base.metadata.sorted_tables
+        if table.dialect_options["postgresql"]["partition_by"]
+    ]
+
+
+def partition_name(table_name: str, feed_id: str) -> str:
+    """Nom de la partition de `table_name` pour un flux : "<table>__<feed_id>" (normalisé)."""
+    suffix = re.sub(r"[^a-z0-9_]", "_", feed_id.lower())
+    if suffix != feed_id or len(suffix) > _SUFFIX_MAX:
+        # Identifiant réécrit : une empreinte évite que deux flux partagent une partition
+        suffix = f"{suffix[:_SUFFIX_MAX - 9]}_{hashlib.sha1(feed_id.encode()).hexdigest()[:8]}"
+    return f"{table_name}__{suffix}"
+
+
+def _literal(value: str) -> str:
+    # Les bornes de partition (DDL) n'acceptent pas de paramètres liés
+    return "'" + value.replace("'", "''") + "'"
+
+
+def create_feed(engine: Engine, feed_id: str) -> None:
+    """Inscrit un flux au registre et crée ses partitions. Sans effet s'il existe déjà."""
+    with engine.begin() as connection:
+        if engine.dialect.name == "postgresql":
+            for table in feed_tables():
+                connection.exec_driver_sql(
+                    f'CREATE TABLE IF NOT EXISTS "{partition_name(table.name, feed_id)}" '
+                    f'PARTITION OF "{table.name}" FOR VALUES IN ({_literal(feed_id)})'
+                )
+        exists = connection.execute(
+            models.Feed.__table__.select().where(models.Feed.feed_id == feed_id)
+        ).first()
+        if exists is None:
+            connection.execute(models.Feed.__table__.insert().values(feed_id=feed_id, loaded_at=None))
+
+
+def mark_loaded(db: Session, feed_id: str) -> None:
+    """Horodate la fin du chargement d'un flux."""
+    db.query(models.Feed).filter(models.Feed.feed_id == feed_id).update(
+        {"loaded_at": datetime.now(timezone.utc).replace(tzinfo=None)}
+    )
+    db.commit()
+
+
+def drop_feed(engine: Engine, feed_id: str) -> None:
+    """
+    Retire un flux du registre et supprime ses données. Sous PostgreSQL, partition par
+    partition, chacune détachée (CONCURRENTLY) puis supprimée dans ses propres transactions.
+    """
+    if engine.dialect.name != "postgresql":
+        with engine.begin() as connection:
+            connection.execute(models.Feed.__table__.delete().where(models.Feed.feed_id == feed_id))
+            for table in reversed(feed_tables()):
+                connection.execute(table.delete().where(table.c.feed_id == feed_id))
+        return
+
+    with engine.begin() as connection:
+        connection.execute(models.Feed.__table__.delete().where(models.Feed.feed_id == feed_id))
+    # DETACH ... CONCURRENTLY refuse les blocs de transaction : une transaction par instruction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        # Tables qui référencent d'abord : les clés étrangères sont vérifiées au détachement
+        for table in reversed(feed_tables()):
+            partition = partition_name(table.name, feed_id)
+            pending = connection.exec_driver_sql(
+                "SELECT i.inhdetachpending FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE c.relname = %(partition)s AND i.inhparent = %(parent)s::regclass",
+                {"partition": partition, "parent": f'"{table.name}"'},
+            ).scalar()
+            if pending is not None:
+                # Détachement interrompu (pending) : seule l'étape finale reste à faire
+                mode = "FINALIZE" if pending else "CONCURRENTLY"
+                connection.exec_driver_sql(f'ALTER TABLE "{table.name}" DETACH PARTITION "{partition}" {mode}')
+            connection.exec_driver_sql(f'DROP TABLE IF EXISTS "{partition}"')
+
+
+def list_feeds(db: Session) -> List[models.Feed]:
+    return db.query(models.Feed).order_by(models.Feed.feed_id).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gère les flux GTFS chargés en base (un jeu de partitions par flux).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="Liste les flux inscrits au registre")
+    create = commands.add_parser("create", help="Crée les partitions d'un flux")
+    create.add_argument("feed_id")
+    drop = commands.add_parser("drop", help="Supprime un flux (détachement de ses partitions)")
+    drop.add_argument("feed_id")
+    args = parser.parse_args()
+
+    from db import SessionLocal, engine
+    try:
+        if args.command == "list":
+            db_session = SessionLocal()
+            try:
+                for feed in list_feeds(db_session):
+                    status = f"loaded {feed.loaded_at:%Y-%m-%d %H:%M}" if feed.loaded_at else "loading"
+                    default = " (default)" if feed.feed_id == DEFAULT_FEED_ID else ""
+                    print(f"{feed.feed_id}\t{status}{default}")
+            finally:
+                db_session.close()
+        elif args.command == "create":
+            create_feed(engine, args.feed_id)
+            print(f"Feed {args.feed_id} created.")
+        elif args.command == "drop":
+            if args.feed_id == DEFAULT_FEED_ID:
+                print(f"Feed {args.feed_id} is the default feed (GTFS_FEED_ID): switch the API to another feed first.")
+                return
+            drop_feed(engine, args.feed_id)
+            print(f"Feed {args.feed_id} dropped.")
+    except Exception as e:
+        print(f"An error occurred while managing feeds: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# footpaths.py
+# Génération des correspondances à pied entre arrêts proches. transfers.txt et
+# pathways.txt sont vides dans notre flux : sans ces liens, le calcul d'itinéraires
+# ne peut pas passer d'une ligne à une autre entre deux arrêts voisins.
+#
+# Les arrêts sont rangés dans une grille dont la maille vaut le rayon de marche ;
+# seules les paires de cellules voisines sont comparées. Après le tri des clés de
+# cellules (O(n log n)), le coût est proportionnel au nombre de paires produites.
+#
+# Utilisation : python footpaths.py [--radius 400] [--speed 1.3]
+
+import argparse
+import math
+import os
+from typing import Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+from feeds import DEFAULT_FEED_ID
+
+WALK_SPEED = 1.3  # m/s
+WALK_DETOUR = 1.25  # Rapport moyen entre distance parcourue et distance à vol d'oiseau
+DEFAULT_RADIUS = float(os.getenv("WALK_TRANSFER_RADIUS", "400"))  # mètres
+EARTH_RADIUS = 6371000.0
+
+# Offsets des cellules voisines à comparer : la cellule elle-même et la moitié des
+# 8 voisines, les paires étant ensuite rendues symétriques
+_NEIGHBOUR_OFFSETS = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+
+
+def walking_pairs(lat: np.ndarray, lon: np.ndarray, radius: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Toutes les paires d'arrêts (i, j), i != j, à moins de `radius` mètres l'un de l'autre.
+    Retourne (i, j, distance en mètres), chaque paire apparaissant dans les deux sens.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    valid = np.flatnonzero(np.isfinite(lat) & np.isfinite(lon) & ((lat != 0) | (lon != 0)))
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0))
+    if len(valid) < 2 or radius <= 0:
+        return empty
+
+    # Projection équirectangulaire locale (mètres), suffisante à l'échelle d'une ville
+    lat0 = math.radians(float(lat[valid].mean()))
+    x = np.radians(lon[valid]) * math.cos(lat0) * EARTH_RADIUS
+    y = np.radians(lat[valid]) * EARTH_RADIUS
+    cx = np.floor((x - x.min()) / radius).astype(np.int64)
+    cy = np.floor((y - y.min()) / radius).astype(np.int64)
+    width = int(cy.max()) + 3
+    keys = cx * width + cy
+
+    order = np.argsort(keys, kind="stable")
+    cells, cell_start, cell_count = np.unique(keys[order], return_index=True, return_counts=True)
+
+    src, dst = [], []
+    for dx, dy in _NEIGHBOUR_OFFSETS:
+        neighbour = cells + dx * width + dy
+        pos = np.searchsorted(cells, neighbour)
+        pos = np.minimum(pos, len(cells) - 1)
+        found = np.flatnonzero(cells[pos] == neighbour)
+        a_start, a_count = cell_start[found], cell_count[found]
+        b_start, b_count = cell_start[pos[found]], cell_count[pos[found]]
+
+        # Produit cartésien des points de chaque paire de cellules, sans boucle Python
+        sizes = a_count * b_count
+        total = int(sizes.sum())
+        if total == 0:
+            continue
+        pair = np.repeat(np.arange(len(found)), sizes)
+        local = np.arange(total) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        i = order[a_start[pair] + local // b_count[pair]]
+        j = order[b_start[pair] + local % b_count[pair]]
+        if dx == 0 and dy == 0:
+            keep = i < j  # Dans une même cellule, chaque paire une seule fois
+            i, j = i[keep], j[keep]
+        src.append(i)
+        dst.append(j)
+
+    if not src:
+        return empty
+    i = np.concatenate(src)
+    j = np.concatenate(dst)
+    distance = np.hypot(x[i] - x[j], y[i] - y[j])
+    keep = distance <= radius
+    i, j, distance = valid[i[keep]], valid[j[keep]], distance[keep]
+    return np.concatenate([i, j]), np.concatenate([j, i]), np.concatenate([distance, distance])
+
+
+def walk_seconds(distance: np.ndarray, speed: float = WALK_SPEED) -> np.ndarray:
+    """Durée de marche estimée (secondes, arrondie au-dessus) pour une distance à vol d'oiseau."""
+    return np.ceil(np.asarray(distance) * WALK_DETOUR / speed).astype(np.int32)
+
+
+def generate_transfers(db: Session, feed_id: str = DEFAULT_FEED_ID, radius: float = DEFAULT_RADIUS, speed: float = WALK_SPEED) -> int:
+    """
+    Remplace les correspondances générées (is_synthetic = 1) du flux `feed_id` par les
+    paires d'arrêts à moins de `radius` mètres. Les correspondances issues du flux sont conservées et
+    ne sont pas dupliquées. Retourne le nombre de lignes écrites.
+    """
+    # Stations (location_type = 1, cf. stations.py) exclues : aucun trajet n'y passe
+    stops = (
+        db.query(models.Stop.stop_id, models.Stop.stop_lat, models.Stop.stop_lon)
+        .filter(models.Stop.feed_id == feed_id, func.coalesce(models.Stop.location_type, 0) == 0)
+        .all()
+    )
+    stop_ids = [s.stop_id for s in stops]
+    lat = np.array([s.stop_lat if s.stop_lat is not None else np.nan for s in stops], dtype=np.float64)
+    lon = np.array([s.stop_lon if s.stop_lon is not None else np.nan for s in stops], dtype=np.float64)
+    i, j, distance = walking_pairs(lat, lon, radius)
+    seconds = walk_seconds(distance, speed)
+
+    db.query(models.Transfer).filter(models.Transfer.feed_id == feed_id, models.Transfer.is_synthetic == 1).delete()
+    existing = {
+        (t.from_stop_id, t.to_stop_id)
+        for t in db.query(models.Transfer.from_stop_id, models.Transfer.to_stop_id).filter(models.Transfer.feed_id == feed_id)
+    }
+    rows = [
+        {
+            "feed_id": feed_id,
+            "from_stop_id": stop_ids[a],
+            "to_stop_id": stop_ids[b],
+            "transfer_type": 2,  # Correspondance nécessitant un temps minimum
+            "min_transfer_time": int(secs),
+            "is_synthetic": 1,
+        }
+        for a, b, secs in zip(i.tolist(), j.tolist(), seconds.tolist())
+        if (stop_ids[a], stop_ids[b]) not in existing
+    ]
+    db.bulk_insert_mappings(models.Transfer, rows)
+    db.commit()
+    print(f"{len(rows)} walking transfers generated (radius {radius:.0f} m).")
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère les correspondances à pied entre arrêts proches.")
+    parser.add_argument("--feed", default=DEFAULT_FEED_ID, help="Flux à traiter")
+    parser.add_argument("--radius", type=float, default=DEFAULT_RADIUS, help="Rayon de marche en mètres")
+    parser.add_argument("--speed", type=float, default=WALK_SPEED, help="Vitesse de marche en m/s")
+    args = parser.parse_args()
+
+    from db import SessionLocal
+    db_session = SessionLocal()
+    try:
+        print("Generating walking transfers...")
+        generate_transfers(db_session, args.feed, radius=args.radius, speed=args.speed)
+        print("Walking transfers generated.")
+    except Exception as e:
+        db_session.rollback()
+        print(f"An error occurred while generating transfers: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        db_session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# http_cache.py
+# Requêtes conditionnelles HTTP. Les données ne changent qu'avec la version du flux :
+# l'ETag d'une réponse GET est dérivé de feed_info.feed_version, du chemin et des
+# paramètres de la requête. Un If-None-Match qui correspond reçoit un 304 avant même
+# le routage vers le handler, donc sans aucune requête SQL. Un corps servi encodé (gzip,
+# br, cf. snapshots.py) a son propre ETag, suffixé par l'encodage, et les 200 comme les
+# 304 portent Vary: Accept-Encoding.
+#
+# Les handlers dont la réponse dépend de l'instant présent (prochains départs, calcul
+# d'itinéraire "maintenant"...) sont marqués avec @volatile et ne reçoivent pas d'ETag.
+# Ceux qui intègrent d'autres données que le flux (retards temps réel) sont marqués avec
+# @versioned : leur ETag couvre aussi la version de ces données.
+#
+# Variable d'environnement : HTTP_CACHE_MAX_AGE (secondes, défaut 300)
+
+import hashlib
+import os
+from typing import Callable, Optional, Set
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.routing import BaseRoute, Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import query_cache
+
+MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "300"))
+CODINGS = ("br", "gzip")  # Encodages servis par SnapshotMiddleware
+
+
+def volatile(*time_params: str) -> Callable:
+    """
+    Marque un handler dont la réponse dépend de l'heure courante. Si l'un des paramètres
+    `time_params` est fourni dans la requête (ex. `at`), la réponse redevient déterministe
+    et reçoit un ETag ; sans paramètre, le handler n'en reçoit jamais.
+    """
+    def decorator(func: Callable) -> Callable:
+        func.volatile_unless = time_params
+        return func
+    return decorator
+
+
+def versioned(source: Callable[[], Optional[str]]) -> Callable:
+    """
+    Marque un handler dont la réponse dépend aussi d'une autre source que le flux : son
+    ETag inclut `source()` (None = source inactive, la réponse ne dépend que du flux).
+    """
+    def decorator(func: Callable) -> Callable:
+        func.version_source = source
+        return func
+    return decorator
+
+
+def extra_version(endpoint: Optional[Callable]) -> Optional[str]:
+    """Version de la source supplémentaire d'un handler marqué @versioned, None sinon."""
+    source = getattr(endpoint, "version_source", None)
+    return source() if source is not None else None
+
+
+def resolve_route(scope: Scope) -> Optional[BaseRoute]:
+    """Route qui traitera la requête (même résolution que le routeur, sans l'exécuter)."""
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route
+    return None
+
+
+def resolve_endpoint(scope: Scope) -> Optional[Callable]:
+    """Handler qui traitera la requête."""
+    return getattr(resolve_route(scope), "endpoint", None)
+
+
+def make_etag(version: str, path: str, query_string: str) -> str:
+    """ETag fort : empreinte de la version du flux, du chemin et des paramètres triés."""
+    query = urlencode(sorted(parse_qsl(query_string, keep_blank_values=True)))
+    digest = hashlib.blake2b(f"{version}\n{path}\n{query}".encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def coded_etag(etag: str, coding: Optional[str]) -> str:
+    """
+    ETag du corps encodé en `coding` (gzip, br) : le corps brut et chacun de ses encodages
+    sont des représentations distinctes, chacune a donc son propre validateur fort.
+    """
+    if not coding or coding == "identity":
+        return etag
+    return f'{etag[:-1]}-{coding}"'
+
+
+def accepted_encodings(accept_encoding: str) -> Set[str]:
+    """Encodages acceptés par le client (en-tête Accept-Encoding, sans ceux à q=0)."""
+    accepted = set()
+    for token in accept_encoding.split(","):
+        coding, _, params = token.partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if params and float(quality) == 0:
+                continue
+        except ValueError:
+            pass
+        if coding.strip():
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def etag_matches(etag: str, if_none_match: str, accept_encoding: str = "") -> Optional[str]:
+    """
+    Validateur de If-None-Match correspondant à une représentation que le client peut
+    recevoir (corps brut, ou encodage qu'il accepte), None sinon. If-None-Match utilise la
+    comparaison faible : on ignore le préfixe W/.
+    """
+    accepted = accepted_encodings(accept_encoding)
+    valid = {etag} | {coded_etag(etag, coding) for coding in CODINGS if coding in accepted}
+    for tag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        if tag == "*":
+            return etag
+        if tag in valid:
+            return tag
+    return None
+
+
+class ConditionalGetMiddleware:
+    """Middleware ASGI : ETag + Cache-Control sur les GET, 304 si If-None-Match correspond."""
+
+    def __init__(self, app: ASGIApp, max_age: int = MAX_AGE):
+        self.app = app
+        self.cache_control = f"public, max-age={max_age}"
+
+    def _is_cacheable(self, scope: Scope, endpoint: Optional[Callable]) -> bool:
+        if endpoint is None:
+            return False
+        time_params = getattr(endpoint, "volatile_unless", None)
+        if time_params is None:
+            return True
+        query = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+        return bool(time_params) and any(query.get(param) for param in time_params)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+        endpoint = resolve_endpoint(scope)
+        if not self._is_cacheable(scope, endpoint):
+            await self.app(scope, receive, send)
+            return
+
+        if query_cache.query_cache.version_is_stale():
+            await run_in_threadpool(query_cache.feed_version)  # Au plus une requête par intervalle
+        version = query_cache.feed_version()
+        if version is None:
+            await self.app(scope, receive, send)  # Flux sans version : rien ne permet de valider
+            return
+        extra = extra_version(endpoint)
+        if extra is not None:
+            version = f"{version}\n{extra}"
+
+        etag = make_etag(version, scope["path"], scope.get("query_string", b"").decode("latin-1"))
+        request_headers = Headers(scope=scope)
+        if_none_match = request_headers.get("if-none-match")
+        matched = etag_matches(etag, if_none_match, request_headers.get("accept-encoding", "")) if if_none_match else None
+        if matched:
+            await send({
+                "type": "http.response.start",
+                "status": 304,
+                "headers": [
+                    (b"etag", matched.encode()),
+                    (b"cache-control", self.cache_control.encode()),
+                    (b"vary", b"Accept-Encoding"),
+                ],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_with_etag(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                headers = MutableHeaders(scope=message)
+                headers["ETag"] = coded_etag(etag, headers.get("content-encoding"))
+                headers.setdefault("Cache-Control", self.cache_control)
+                if "accept-encoding" not in headers.get("vary", "").lower():
+                    headers.add_vary_header("Accept-Encoding")
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
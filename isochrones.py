@@ -0,0 +1,383 @@
+# isochrones.py
+# Calculs en lot sur l'index horaire : temps de parcours un-vers-tous, matrices
+# origine-destination et isochrones. Les recherches d'une matrice sont réparties
+# sur un pool de processus ; chaque processus construit son routeur une seule fois.
+# L'API garde un pool par flux pour toute sa durée de vie (shared_pool) : l'index horaire
+# n'est transmis qu'une fois à chaque processus, et les matrices demandées en même temps
+# se partagent ses MATRIX_WORKERS processus au lieu d'en lancer chacune autant.
+# La ligne de commande crée son propre pool, le temps du calcul.
+#
+# Utilisation en ligne de commande :
+#   python isochrones.py matrix --depart-at 2023-05-02T08:00 --out matrix.npy --workers 8
+#   python isochrones.py isochrone --from node/10591673049 --depart-at 2023-05-02T08:00 --cutoffs 15 30 45 --out iso.geojson
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from footpaths import WALK_SPEED
+from raptor import DEFAULT_MAX_TRANSFERS, RaptorRouter
+from timetable import Timetable
+
+UNREACHABLE = np.iinfo(np.uint16).max  # Valeur des cellules non atteignables dans une matrice (uint16, secondes)
+EARTH_RADIUS = 6371000.0
+DEFAULT_WORKERS = int(os.getenv("MATRIX_WORKERS", "0")) or os.cpu_count() or 1
+
+
+# --- Temps de parcours un-vers-tous ---
+def travel_times(
+    router: RaptorRouter,
+    origin: int,
+    depart_at: datetime,
+    window_secs: int = 0,
+    step_secs: int = 300,
+    max_duration: int = 7200,
+    max_transfers: int = DEFAULT_MAX_TRANSFERS,
+) -> np.ndarray:
+    """
+    Temps de parcours (secondes) depuis l'arrêt d'indice `origin` vers tous les arrêts, -1 si non atteint.
+    Avec une fenêtre de départ, on lance une recherche toutes les `step_secs` secondes
+    et on retient la médiane (profil de temps de parcours).
+    """
+    if window_secs < 0 or step_secs <= 0:
+        raise ValueError("window_secs must be >= 0 and step_secs > 0")
+    day = depart_at.date()
+    base = depart_at.hour * 3600 + depart_at.minute * 60 + depart_at.second
+    runs = []
+    for offset in range(0, window_secs + 1, step_secs):
+        start = base + offset
+        _, _, _, _, best = router.route(origin, None, day, start, max_transfers, start + max_duration)
+        runs.append(np.asarray(best, dtype=np.int64) - start)
+    times = runs[0] if len(runs) == 1 else np.median(np.stack(runs), axis=0)
+    return np.where(times <= max_duration, times, -1).astype(np.int32)
+
+
+# --- Matrices origine-destination ---
+_worker_router: Optional[RaptorRouter] = None
+
+
+def _init_worker(tt: Timetable):
+    global _worker_router
+    _worker_router = RaptorRouter(tt)
+
+
+def _matrix_rows(origins: List[int], destinations: np.ndarray, depart_at: datetime, options: dict, router: Optional[RaptorRouter] = None) -> np.ndarray:
+    router = router or _worker_router
+    rows = np.full((len(origins), len(destinations)), UNREACHABLE, dtype=np.uint16)
+    for i, origin in enumerate(origins):
+        times = travel_times(router, origin, depart_at, **options)[destinations]
+        rows[i] = np.where(times >= 0, np.minimum(times, UNREACHABLE - 1), UNREACHABLE)
+    return rows
+
+
+# Un pool par flux servi : feed_id -> (pool, index horaire de ses processus)
+_pools: Dict[str, Tuple[ProcessPoolExecutor, Timetable]] = {}
+_pool_lock = threading.Lock()
+
+
+def shared_pool(tt: Timetable) -> Optional[ProcessPoolExecutor]:
+    """
+    Pool de DEFAULT_WORKERS processus initialisés avec `tt`, gardé entre les appels pour le
+    flux de `tt` et recréé si son index horaire change. None avec un seul worker (calcul sur place).
+    """
+    if DEFAULT_WORKERS <= 1:
+        return None
+    entry = _pools.get(tt.feed_id)
+    if entry is None or entry[1] is not tt:
+        with _pool_lock:
+            entry = _pools.get(tt.feed_id)
+            if entry is None or entry[1] is not tt:
+                if entry is not None:
+                    entry[0].shutdown(wait=False)  # Les lots déjà soumis se terminent sur l'ancien index
+                entry = _pools[tt.feed_id] = (
+                    ProcessPoolExecutor(max_workers=DEFAULT_WORKERS, initializer=_init_worker, initargs=(tt,)), tt,
+                )
+    return entry[0]
+
+
+def shutdown_pool():
+    """Arrête les pools partagés (à l'arrêt de l'API)."""
+    with _pool_lock:
+        for pool, _ in _pools.values():
+            pool.shutdown(wait=True, cancel_futures=True)
+        _pools.clear()
+
+
+def compute_matrix(
+    tt: Timetable,
+    origins: Sequence[int],
+    destinations: Sequence[int],
+    depart_at: datetime,
+    workers: Optional[int] = None,
+    router: Optional[RaptorRouter] = None,
+    pool: Optional[ProcessPoolExecutor] = None,
+    **options,
+) -> np.ndarray:
+    """
+    Matrice (origines x destinations) des temps de parcours en secondes, au format uint16
+    (UNREACHABLE si non atteint). Les options sont celles de travel_times.
+    Avec plusieurs workers, les origines sont découpées en lots traités en parallèle, sur
+    `pool` s'il est fourni (processus déjà initialisés avec `tt`), sinon sur un pool créé
+    pour l'appel.
+    """
+    workers = workers or DEFAULT_WORKERS  # Taille du pool partagé s'il est fourni
+    origins = list(origins)
+    destinations = np.asarray(destinations, dtype=np.int64)
+    if workers <= 1 or len(origins) < 2 * workers:
+        return _matrix_rows(origins, destinations, depart_at, options, router or RaptorRouter(tt))
+
+    batches = _batches(origins, workers)
+    args = (_matrix_rows, batches, [destinations] * len(batches), [depart_at] * len(batches), [options] * len(batches))
+    if pool is not None:
+        return np.concatenate(list(pool.map(*args)), axis=0)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(tt,)) as call_pool:
+        return np.concatenate(list(call_pool.map(*args)), axis=0)
+
+
+async def compute_matrix_async(
+    origins: Sequence[int],
+    destinations: Sequence[int],
+    depart_at: datetime,
+    router: RaptorRouter,
+    pool: Optional[ProcessPoolExecutor],
+    **options,
+) -> np.ndarray:
+    """
+    compute_matrix pour l'API : les lots sont attendus sur le pool partagé (processus déjà
+    initialisés avec l'index de `router`) sans occuper de thread pendant le calcul. Sans
+    pool, ou pour peu d'origines, le calcul se fait sur place dans un thread.
+    """
+    origins = list(origins)
+    destinations = np.asarray(destinations, dtype=np.int64)
+    loop = asyncio.get_running_loop()
+    if pool is None or len(origins) < 2 * DEFAULT_WORKERS:
+        return await loop.run_in_executor(None, _matrix_rows, origins, destinations, depart_at, options, router)
+    rows = await asyncio.gather(*(
+        loop.run_in_executor(pool, _matrix_rows, batch, destinations, depart_at, options)
+        for batch in _batches(origins, DEFAULT_WORKERS)
+    ))
+    return np.concatenate(rows, axis=0)
+
+
+def _batches(origins: List[int], workers: int) -> List[List[int]]:
+    """Petits lots (4 par worker) pour équilibrer la charge entre origines rapides et lentes."""
+    chunk = max(1, math.ceil(len(origins) / (workers * 4)))
+    return [origins[i:i + chunk] for i in range(0, len(origins), chunk)]
+
+
+# --- Isochrones ---
+def isochrone(
+    router: RaptorRouter,
+    origin: int,
+    depart_at: datetime,
+    cutoffs: Sequence[int],
+    cell_size: float = 100.0,
+    **options,
+) -> dict:
+    """
+    Isochrones (GeoJSON FeatureCollection de MultiPolygon) depuis l'arrêt `origin`,
+    une par durée de `cutoffs` (minutes). La zone couvre, autour de chaque arrêt atteint
+    en t secondes, la distance parcourable à pied pendant le temps restant.
+    """
+    tt = router.tt
+    max_duration = max(cutoffs) * 60
+    times = travel_times(router, origin, depart_at, max_duration=max_duration, **options)
+    reached = np.flatnonzero(times >= 0)
+
+    # Projection équirectangulaire locale, en mètres, centrée sur l'origine
+    lat0, lon0 = float(tt.stop_lat[origin]), float(tt.stop_lon[origin])
+    kx = math.radians(1) * EARTH_RADIUS * math.cos(math.radians(lat0))
+    ky = math.radians(1) * EARTH_RADIUS
+    xs = (tt.stop_lon[reached] - lon0) * kx
+    ys = (tt.stop_lat[reached] - lat0) * ky
+
+    features = []
+    for cutoff in sorted(cutoffs):
+        radius = (cutoff * 60 - times[reached]) * WALK_SPEED
+        keep = radius > 0
+        mask, x_min, y_min = _rasterize(xs[keep], ys[keep], radius[keep], cell_size)
+        polygons = []
+        for outer, holes in _mask_to_polygons(mask):
+            polygons.append([
+                [[round(lon0 + (x_min + x * cell_size) / kx, 6), round(lat0 + (y_min + y * cell_size) / ky, 6)] for x, y in ring]
+                for ring in [outer] + holes
+            ])
+        features.append({
+            "type": "Feature",
+            "properties": {"cutoff": cutoff, "stop_id": tt.stop_ids[origin], "reachable_stops": int(keep.sum())},
+            "geometry": {"type": "MultiPolygon", "coordinates": polygons},
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def _rasterize(xs: np.ndarray, ys: np.ndarray, radii: np.ndarray, cell_size: float):
+    """Grille booléenne des cellules dont le centre est à moins de `radius` d'un des points."""
+    if len(xs) == 0:
+        return np.zeros((0, 0), dtype=bool), 0.0, 0.0
+    x_min = float((xs - radii).min()) - cell_size
+    y_min = float((ys - radii).min()) - cell_size
+    nx = int(math.ceil((float((xs + radii).max()) - x_min) / cell_size)) + 2
+    ny = int(math.ceil((float((ys + radii).max()) - y_min) / cell_size)) + 2
+    mask = np.zeros((ny, nx), dtype=bool)
+    for x, y, r in zip(xs, ys, radii):
+        j0, j1 = int((x - r - x_min) // cell_size), int((x + r - x_min) // cell_size) + 1
+        i0, i1 = int((y - r - y_min) // cell_size), int((y + r - y_min) // cell_size) + 1
+        cx = x_min + (np.arange(j0, j1) + 0.5) * cell_size
+        cy = y_min + (np.arange(i0, i1) + 0.5) * cell_size
+        mask[i0:i1, j0:j1] |= (cx[None, :] - x) ** 2 + (cy[:, None] - y) ** 2 <= r * r
+    return mask, x_min, y_min
+
+
+def _mask_to_polygons(mask: np.ndarray) -> List[tuple]:
+    """
+    Contours d'une grille booléenne en polygones (anneau extérieur, trous), en coordonnées de grille.
+    Les arêtes de bord sont orientées avec la cellule pleine à gauche : les anneaux extérieurs
+    sont parcourus dans le sens trigonométrique et les trous dans le sens horaire.
+    """
+    if not mask.any():
+        return []
+    padded = np.pad(mask, 1)
+    inner = padded[1:-1, 1:-1]
+    # (ligne, colonne) des cellules pleines ayant un voisin vide de chaque côté
+    edges: Dict[tuple, list] = {}
+
+    def add(cells, start, end):
+        for i, j in zip(*np.nonzero(cells)):
+            a = (int(j) + start[0], int(i) + start[1])
+            b = (int(j) + end[0], int(i) + end[1])
+            edges.setdefault(a, []).append(b)
+
+    add(inner & ~padded[:-2, 1:-1], (0, 0), (1, 0))  # bas
+    add(inner & ~padded[1:-1, 2:], (1, 0), (1, 1))   # droite
+    add(inner & ~padded[2:, 1:-1], (1, 1), (0, 1))   # haut
+    add(inner & ~padded[1:-1, :-2], (0, 1), (0, 0))  # gauche
+
+    rings = []
+    while edges:
+        start = next(iter(edges))
+        ring = [start]
+        prev, current = None, start
+        while True:
+            options = edges[current]
+            if len(options) == 1 or prev is None:
+                nxt = options.pop(0)
+            else:
+                # Point selle : on tourne à gauche pour ne pas fusionner deux cellules en diagonale
+                dx, dy = current[0] - prev[0], current[1] - prev[1]
+                left = (current[0] - dy, current[1] + dx)
+                nxt = options.pop(options.index(left)) if left in options else options.pop(0)
+            if not options:
+                del edges[current]
+            prev, current = current, nxt
+            if current == start:
+                break
+            ring.append(current)
+        rings.append(_simplify_ring(ring))
+
+    outers = sorted(((ring, []) for ring in rings if _ring_area(ring) > 0), key=lambda o: _ring_area(o[0]))
+    for ring in rings:
+        if _ring_area(ring) >= 0:
+            continue
+        # Centre de la cellule pleine qui borde la première arête du trou (à gauche de l'arête)
+        (x1, y1), (x2, y2) = ring[0], ring[1]
+        dx, dy = (x2 > x1) - (x2 < x1), (y2 > y1) - (y2 < y1)
+        probe = (x1 + 0.5 * dx - 0.5 * dy, y1 + 0.5 * dy + 0.5 * dx)
+        # Le plus petit anneau extérieur qui contient ce point porte le trou
+        for outer, holes in outers:
+            if _point_in_ring(probe, outer):
+                holes.append(ring)
+                break
+    return [(outer + outer[:1], [hole + hole[:1] for hole in holes]) for outer, holes in outers]
+
+
+def _simplify_ring(ring: list) -> list:
+    """Supprime les sommets alignés le long des bords de cellules."""
+    kept = []
+    n = len(ring)
+    for k in range(n):
+        a, b, c = ring[k - 1], ring[k], ring[(k + 1) % n]
+        if (b[0] - a[0]) * (c[1] - b[1]) != (b[1] - a[1]) * (c[0] - b[0]):
+            kept.append(b)
+    return kept
+
+
+def _ring_area(ring: list) -> float:
+    return 0.5 * sum(ring[k - 1][0] * ring[k][1] - ring[k][0] * ring[k - 1][1] for k in range(len(ring)))
+
+
+def _point_in_ring(point: tuple, ring: list) -> bool:
+    x, y = point
+    inside = False
+    for k in range(len(ring)):
+        (x1, y1), (x2, y2) = ring[k - 1], ring[k]
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+
+# --- Ligne de commande ---
+def main():
+    parser = argparse.ArgumentParser(description="Matrices de temps de parcours et isochrones sur le flux GTFS.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--depart-at", type=datetime.fromisoformat, required=True, help="Heure de départ locale, ex. 2023-05-02T08:00")
+    common.add_argument("--window", type=int, default=0, help="Fenêtre de départ en minutes (profil, médiane)")
+    common.add_argument("--step", type=int, default=5, help="Pas entre deux départs de la fenêtre, en minutes")
+    common.add_argument("--max-transfers", type=int, default=DEFAULT_MAX_TRANSFERS)
+
+    matrix_parser = sub.add_parser("matrix", parents=[common], help="Matrice arrêt-arrêt au format .npy (uint16, secondes)")
+    matrix_parser.add_argument("--out", required=True, help="Fichier .npy ; la liste des arrêts est écrite à côté (_stops.txt)")
+    matrix_parser.add_argument("--origins", help="Fichier d'identifiants d'arrêts (un par ligne) ; par défaut tous les arrêts")
+    matrix_parser.add_argument("--max-duration", type=int, default=120, help="Durée maximale en minutes")
+    matrix_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+
+    iso_parser = sub.add_parser("isochrone", parents=[common], help="Isochrones GeoJSON depuis un arrêt")
+    iso_parser.add_argument("--from", dest="origin", required=True)
+    iso_parser.add_argument("--cutoffs", type=int, nargs="+", default=[15, 30, 45])
+    iso_parser.add_argument("--out", required=True)
+
+    args = parser.parse_args()
+    options = {"window_secs": args.window * 60, "step_secs": args.step * 60, "max_transfers": args.max_transfers}
+
+    from db import ReadSessionLocal
+    db = ReadSessionLocal()
+    try:
+        tt = Timetable.from_db(db)
+    finally:
+        db.close()
+
+    if args.command == "matrix":
+        if args.origins:
+            with open(args.origins, encoding="utf-8") as f:
+                origin_ids = [line.strip() for line in f if line.strip()]
+        else:
+            origin_ids = tt.stop_ids
+        origins = [tt.stop_index[stop_id] for stop_id in origin_ids]
+        started = datetime.now()
+        matrix = compute_matrix(
+            tt, origins, range(len(tt.stop_ids)), args.depart_at,
+            workers=args.workers, max_duration=args.max_duration * 60, **options,
+        )
+        np.save(args.out, matrix)
+        stops_path = os.path.splitext(args.out)[0] + "_stops.txt"
+        with open(stops_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(tt.stop_ids) + "\n")
+        print(f"Matrice {matrix.shape} écrite dans {args.out} ({(datetime.now() - started).total_seconds():.1f} s)")
+    else:
+        result = isochrone(RaptorRouter(tt), tt.stop_index[args.origin], args.depart_at, args.cutoffs, **options)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        print(f"Isochrones écrites dans {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,33 @@
 # main.py
 
-from fastapi import FastAPI, Depends, HTTPException
+import io
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Path, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import numpy as np
 
 # Supposons que crud.py, models.py, schemas.py, db.py sont au même niveau que main.py
 # ou que main.py est dans un package et les autres sont des modules de ce package.
 import crud
+import http_cache
+import isochrones
+import metrics
 import models
+import query_cache
+import realtime
 import schemas
-from db import get_db # Importer uniquement la dépendance get_db
+import singleflight
+import slow_queries
+import snapshots
+import subscriptions
+from db import get_db, replica_router # get_db : sessions en lecture (réplicas)
+from feeds import DEFAULT_FEED_ID
+from raptor import RaptorRouter, get_router
+from shapes import ShapeIndex, trip_segments
+from timetable import Timetable, get_timetable
 
 #
 # LA LIGNE SUIVANTE DOIT ÊTRE SUPPRIMÉE OU COMMENTÉE
@@ -17,105 +35,454 @@ from db import get_db # Importer uniquement la dépendance get_db
 # models.Base.metadata.create_all(bind=engine) # <--- SUPPRIMER/COMMENTER CECI
 #
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Construit l'index horaire en mémoire (et le routeur) une fois pour toutes au démarrage
+    router = get_router()
+    # Pool de calcul des matrices, initialisé une fois avec l'index horaire
+    isochrones.shared_pool(router.tt)
+    # Relève des retards temps réel (si GTFS_RT_TRIP_UPDATES_URL est défini)
+    realtime.start()
+    yield
+    isochrones.shutdown_pool()
+
 app = FastAPI(
     title="API Données GTFS Traaf",
     description="Une API pour accéder aux données GTFS stockées dans PostgreSQL.",
     version="0.1.0",
+    lifespan=lifespan,
 )
+# Le dernier middleware ajouté est le plus externe : un 304 évite aussi le regroupement
+# Requêtes GET identiques simultanées : une seule exécution, réponse partagée
+app.add_middleware(singleflight.SingleFlightMiddleware)
+# Réponses statiques servies depuis les instantanés précompressés (si SNAPSHOT_DIR est défini)
+app.add_middleware(snapshots.SnapshotMiddleware)
+# ETag / Cache-Control dérivés de la version du flux, 304 sans requête SQL
+app.add_middleware(http_cache.ConditionalGetMiddleware)
+# Latences et coût en base par route (le plus externe : mesure aussi les 304)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Routes des données d'un flux, recopiées deux fois sur l'application en fin de fichier
+# (mount_feed_routes) : sans préfixe pour le flux par défaut (GTFS_FEED_ID) et sous
+# /feeds/{feed_id} pour n'importe quel flux chargé
+feed_router = APIRouter()
+
+def current_feed(request: Request) -> str:
+    """Flux de la requête : le {feed_id} du préfixe /feeds/{feed_id}, sinon le flux par défaut."""
+    return request.path_params.get("feed_id", DEFAULT_FEED_ID)
+
+def feed_timetable(feed_id: str = Depends(current_feed)) -> Timetable:
+    """Index horaire en mémoire du flux de la requête (construit au premier appel)."""
+    return get_timetable(feed_id)
+
+def feed_raptor_router(feed_id: str = Depends(current_feed)) -> RaptorRouter:
+    """Routeur RAPTOR sur l'index horaire du flux de la requête."""
+    return get_router(feed_id)
+
+def require_feed(feed_id: str = Path(..., description="Identifiant du flux"), db: Session = Depends(get_db)):
+    if crud.get_feed(db, feed_id=feed_id) is None:
+        raise HTTPException(status_code=404, detail="Feed not found")
+
+# --- Routes pour Feed ---
+@app.get("/feeds/", response_model=List[schemas.Feed], tags=["Feeds"])
+def read_feeds(db: Session = Depends(get_db)):
+    """
+    Récupère les flux chargés (opérateurs, versions datées) ; `is_default` désigne le flux
+    servi par les routes sans préfixe et le seul qui reçoit les retards temps réel.
+    """
+    return [
+        schemas.Feed(feed_id=feed.feed_id, loaded_at=feed.loaded_at, is_default=feed.feed_id == DEFAULT_FEED_ID)
+        for feed in crud.get_feeds(db)
+    ]
 
 # --- Routes pour Agency ---
-@app.get("/agencies/", response_model=List[schemas.Agency], tags=["Agencies"])
-def read_agencies(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@feed_router.get("/agencies/", response_model=List[schemas.Agency], tags=["Agencies"])
+def read_agencies(skip: int = 0, limit: int = 100, feed_id: str = Depends(current_feed), db: Session = Depends(get_db)):
     """
     Récupère une liste d'agences.
     """
-    agencies = crud.get_agencies(db, skip=skip, limit=limit)
+    agencies = crud.get_agencies(db, feed_id, skip=skip, limit=limit)
     return agencies
 
-@app.get("/agencies/{agency_id}", response_model=schemas.Agency, tags=["Agencies"])
-def read_agency(agency_id: str, db: Session = Depends(get_db)):
+@feed_router.get("/agencies/{agency_id}", response_model=schemas.Agency, tags=["Agencies"])
+def read_agency(agency_id: str, feed_id: str = Depends(current_feed), db: Session = Depends(get_db)):
     """
     Récupère une agence spécifique par son ID.
     """
-    db_agency = crud.get_agency(db, agency_id=agency_id)
+    db_agency = crud.get_agency(db, feed_id, agency_id=agency_id)
     if db_agency is None:
         raise HTTPException(status_code=404, detail="Agency not found")
     return db_agency
 
 # --- Routes pour Stop ---
-@app.get("/stops/", response_model=List[schemas.Stop], tags=["Stops"])
-def read_stops(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@feed_router.get("/stops/", response_model=List[schemas.Stop], tags=["Stops"])
+def read_stops(
+    skip: int = 0,
+    limit: int = 100,
+    collapse_stations: bool = False,
+    feed_id: str = Depends(current_feed),
+    db: Session = Depends(get_db),
+):
     """
-    Récupère une liste d'arrêts.
+    Récupère une liste d'arrêts. Avec `collapse_stations`, les arrêts rattachés à une
+    station (parent_station) sont remplacés par leur station.
     """
-    stops = crud.get_stops(db, skip=skip, limit=limit)
+    stops = crud.get_stops(db, feed_id, skip=skip, limit=limit, collapse_stations=collapse_stations)
     return stops
     
-@app.get("/stops/{stop_id}", response_model=schemas.Stop, tags=["Stops"])
-def read_stop(stop_id: str, db: Session = Depends(get_db)):
+# Déclarée avant /stops/{stop_id:path}, qui l'engloberait (les stop_id OSM contiennent des "/")
+@feed_router.get("/stops/{stop_id:path}/departures", response_model=List[schemas.Departure], tags=["Stops"])
+@http_cache.volatile("at")
+@http_cache.versioned(realtime.version)
+def read_stop_departures(
+    stop_id: str,
+    at: Optional[datetime] = None,
+    window: int = Query(60, ge=1, le=24 * 60),
+    limit: int = Query(10, ge=1, le=200),
+    tt: Timetable = Depends(feed_timetable),
+):
+    """
+    Récupère les prochains départs à un arrêt, depuis l'index horaire en mémoire.
+    `at` est l'instant de référence (par défaut maintenant, dans le fuseau de l'agence),
+    `window` la fenêtre de recherche en minutes. Les retards temps réel, s'il y en a,
+    sont ajoutés à chaque départ du flux par défaut (delay, realtime_departure, canceled).
+    """
+    overlay = realtime.current() if tt.feed_id == DEFAULT_FEED_ID else None
+    departures = tt.departures(stop_id, tt.local_time(at), window * 60, limit, overlay=overlay)
+    if departures is None:
+        raise HTTPException(status_code=404, detail="Stop not found")
+    return departures
+
+@feed_router.get("/stops/{stop_id:path}/departures/stream", tags=["Stops"])
+@singleflight.exempt
+@http_cache.volatile()
+async def stream_stop_departures(
+    stop_id: str,
+    request: Request,
+    window: int = Query(60, ge=1, le=24 * 60),
+    limit: int = Query(10, ge=1, le=200),
+    feed_id: str = Depends(current_feed),
+):
+    """
+    Abonnement aux prochains départs d'un arrêt, en Server-Sent Events : un événement
+    `snapshot` (liste complète, comme /departures) à l'ouverture, puis des événements
+    `update` ne contenant que les départs modifiés (`changed`) et disparus (`removed`).
+    """
+    if stop_id not in get_timetable(feed_id).stop_index:
+        raise HTTPException(status_code=404, detail="Stop not found")
+    key = (feed_id, stop_id, window * 60, limit)
+    try:
+        queue = await subscriptions.departures_hub.subscribe(key)
+    except subscriptions.HubFull:
+        raise HTTPException(status_code=503, detail="Too many subscribers", headers={"Retry-After": "30"})
+    return StreamingResponse(
+        subscriptions.departures_hub.stream(key, queue, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Déclarée avant /stops/{stop_id:path}, qui l'engloberait
+@feed_router.get("/stops/{stop_id:path}/routes", response_model=List[schemas.StopRoute], tags=["Stops"])
+def read_stop_routes(stop_id: str, feed_id: str = Depends(current_feed), db: Session = Depends(get_db)):
+    """
+    Récupère les routes qui desservent un arrêt, avec leurs patterns, depuis l'index inversé
+    stop_routes construit au chargement (cf. patterns.py).
+    """
+    db_stop = crud.get_stop(db, feed_id, stop_id=stop_id)
+    if db_stop is None:
+        raise HTTPException(status_code=404, detail="Stop not found")
+    return crud.get_routes_by_stop(db, feed_id, stop_id=stop_id)
+
+# Montée après les routes /stops/{stop_id:path}/... de l'application, qu'elle engloberait
+@feed_router.get("/stops/{stop_id:path}", response_model=schemas.Stop, tags=["Stops"])
+def read_stop(stop_id: str, feed_id: str = Depends(current_feed), db: Session = Depends(get_db)):
     """
     Récupère un arrêt spécifique par son ID.
     """
-    db_stop = crud.get_stop(db, stop_id=stop_id)
+    db_stop = crud.get_stop(db, feed_id, stop_id=stop_id)
     if db_stop is None:
         raise HTTPException(status_code=404, detail="Stop not found")
     return db_stop
 
 # --- Routes pour Route ---
-@app.get("/routes/", response_model=List[schemas.Route], tags=["Routes"])
-def read_routes(agency_id: Optional[str] = None, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@feed_router.get("/routes/", response_model=List[schemas.Route], tags=["Routes"])
+def read_routes(
+    agency_id: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    feed_id: str = Depends(current_feed),
+    db: Session = Depends(get_db),
+):
     """
     Récupère une liste de routes, avec un filtre optionnel par agency_id.
     """
-    routes = crud.get_routes(db, agency_id=agency_id, skip=skip, limit=limit)
+    routes = crud.get_routes(db, feed_id, agency_id=agency_id, skip=skip, limit=limit)
     return routes
 
-@app.get("/routes/{route_id}", response_model=schemas.Route, tags=["Routes"])
-def read_route(route_id: str, db: Session = Depends(get_db)):
+@feed_router.get("/routes/{route_id}", response_model=schemas.Route, tags=["Routes"])
+def read_route(route_id: str, feed_id: str = Depends(current_feed), db: Session = Depends(get_db)):
     """
     Récupère une route spécifique par son ID.
     """
-    db_route = crud.get_route(db, route_id=route_id)
+    db_route = crud.get_route(db, feed_id, route_id=route_id)
     if db_route is None:
         raise HTTPException(status_code=404, detail="Route not found")
     return db_route
 
+@feed_router.get("/routes/{route_id}/patterns", response_model=List[schemas.Pattern], tags=["Routes"])
+def read_route_patterns(route_id: str, feed_id: str = Depends(current_feed), db: Session = Depends(get_db)):
+    """
+    Récupère les patterns d'une route (suites d'arrêts distinctes et leur profil de temps).
+    """
+    db_route = crud.get_route(db, feed_id, route_id=route_id)
+    if db_route is None:
+        raise HTTPException(status_code=404, detail="Route not found")
+    return crud.get_patterns_by_route(db, feed_id, route_id=route_id)
+
+@feed_router.get("/routes/{route_id}/stops", response_model=List[schemas.Stop], tags=["Routes"])
+def read_route_stops(route_id: str, feed_id: str = Depends(current_feed), db: Session = Depends(get_db)):
+    """
+    Récupère les arrêts desservis par une route, à partir de ses patterns.
+    """
+    db_route = crud.get_route(db, feed_id, route_id=route_id)
+    if db_route is None:
+        raise HTTPException(status_code=404, detail="Route not found")
+    return crud.get_stops_by_route(db, feed_id, route_id=route_id)
 
 # --- Routes pour Trip ---
-@app.get("/routes/{route_id}/trips/", response_model=List[schemas.Trip], tags=["Trips"])
-def read_trips_for_route(route_id: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@feed_router.get("/routes/{route_id}/trips/", response_model=List[schemas.Trip], tags=["Trips"])
+def read_trips_for_route(
+    route_id: str,
+    skip: int = 0,
+    limit: int = 100,
+    feed_id: str = Depends(current_feed),
+    db: Session = Depends(get_db),
+):
     """
     Récupère les trajets pour une route spécifique.
     """
-    db_route = crud.get_route(db, route_id=route_id)
+    db_route = crud.get_route(db, feed_id, route_id=route_id)
     if db_route is None:
         raise HTTPException(status_code=404, detail="Route not found")
-    trips = crud.get_trips_by_route(db, route_id=route_id, skip=skip, limit=limit)
+    trips = crud.get_trips_by_route(db, feed_id, route_id=route_id, skip=skip, limit=limit)
     return trips
 
-@app.get("/trips/{trip_id}", response_model=schemas.Trip, tags=["Trips"])
-def read_trip(trip_id: str, db: Session = Depends(get_db)):
+@feed_router.get("/trips/{trip_id}", response_model=schemas.Trip, tags=["Trips"])
+def read_trip(trip_id: str, feed_id: str = Depends(current_feed), db: Session = Depends(get_db)):
     """
     Récupère un trajet spécifique par son ID.
     """
-    db_trip = crud.get_trip(db, trip_id=trip_id) # Vous devrez ajouter get_trip à crud.py
+    db_trip = crud.get_trip(db, feed_id, trip_id=trip_id) # Vous devrez ajouter get_trip à crud.py
     if db_trip is None:
         raise HTTPException(status_code=404, detail="Trip not found")
     return db_trip
 
 # --- Routes pour StopTime ---
-@app.get("/trips/{trip_id}/stop_times/", response_model=List[schemas.StopTime], tags=["StopTimes"])
-def read_stop_times_for_trip(trip_id: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+@feed_router.get("/trips/{trip_id}/stop_times/", response_model=List[schemas.StopTime], tags=["StopTimes"])
+@http_cache.versioned(realtime.version)
+def read_stop_times_for_trip(
+    trip_id: str,
+    skip: int = 0,
+    limit: int = 100,
+    service_date: Optional[date] = None,
+    feed_id: str = Depends(current_feed),
+    db: Session = Depends(get_db),
+):
     """
-    Récupère les horaires d'arrêt pour un trajet spécifique.
+    Récupère les horaires d'arrêt pour un trajet spécifique, avec les prédictions temps
+    réel du jour de service `service_date` (par défaut aujourd'hui) s'il y en a (flux par défaut).
     """
-    db_trip = crud.get_trip(db, trip_id=trip_id) # Vérifier si le trajet existe
+    db_trip = crud.get_trip(db, feed_id, trip_id=trip_id) # Vérifier si le trajet existe
     if db_trip is None:
         raise HTTPException(status_code=404, detail="Trip not found")
-    stop_times = crud.get_stop_times_by_trip(db, trip_id=trip_id, skip=skip, limit=limit)
+    stop_times = crud.get_stop_times_by_trip(db, feed_id, trip_id=trip_id, skip=skip, limit=limit)
     # if not stop_times: # Cette vérification est redondante si le trip existe
     #     pass
+    overlay = realtime.current() if feed_id == DEFAULT_FEED_ID else None
+    if overlay is not None:
+        # Les objets ORM viennent du cache de lectures : les prédictions vont dans des copies
+        day = service_date or get_timetable().local_time().date()
+        return overlay.apply_to_stop_times(stop_times, day)
     return stop_times
+
+@feed_router.get("/trips/{trip_id}/segments", response_model=List[schemas.TripSegment], tags=["StopTimes"])
+def read_trip_segments(trip_id: str, feed_id: str = Depends(current_feed), db: Session = Depends(get_db)):
+    """
+    Découpe le tracé d'un trajet entre chaque paire d'arrêts consécutifs (GeoJSON LineString),
+    à partir de StopTime.shape_dist_traveled. Sans tracé, les segments sont des lignes droites.
+    """
+    db_trip = crud.get_trip(db, feed_id, trip_id=trip_id)
+    if db_trip is None:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    stop_times = crud.get_stop_times_by_trip(db, feed_id, trip_id=trip_id, limit=None)
+    stops = crud.get_trip_stops(db, feed_id, trip_id=trip_id)
+    stop_times = [st for st in stop_times if st.stop_id in stops]
+    points = ShapeIndex.from_db(db, feed_id, shape_id=db_trip.shape_id).points(db_trip.shape_id) if db_trip.shape_id else None
+    return trip_segments(stop_times, stops, points)
+
+# --- Routes pour Calendar ---
+@feed_router.get("/services/active", response_model=schemas.ActiveServices, tags=["Calendar"])
+@http_cache.volatile("date")
+def read_active_services(date: Optional[date] = None, tt: Timetable = Depends(feed_timetable)):
+    """
+    Récupère les service_id actifs à une date (par défaut aujourd'hui, dans le fuseau de l'agence),
+    depuis le calendrier compilé en bitsets.
+    """
+    day = date or tt.local_time().date()
+    return {"date": day, "service_ids": tt.calendar.active_services(day)}
+
+# --- Routes pour le calcul d'itinéraires ---
+@feed_router.get("/plan", response_model=List[schemas.Itinerary], tags=["Planning"])
+@http_cache.volatile("depart_at")
+def plan_journey(
+    from_stop_id: str = Query(..., alias="from"),
+    to_stop_id: str = Query(..., alias="to"),
+    depart_at: Optional[datetime] = None,
+    max_transfers: int = Query(4, ge=0, le=8),
+    router: RaptorRouter = Depends(feed_raptor_router),
+):
+    """
+    Calcule les itinéraires entre deux arrêts (algorithme RAPTOR sur l'index en mémoire).
+    Retourne le front de Pareto : un itinéraire par nombre de correspondances qui arrive plus tôt.
+    """
+    itineraries = router.plan(from_stop_id, to_stop_id, router.tt.local_time(depart_at), max_transfers)
+    if itineraries is None:
+        raise HTTPException(status_code=404, detail="Stop not found")
+    return itineraries
+
+@feed_router.get("/isochrones", tags=["Planning"])
+@http_cache.volatile("depart_at")
+def read_isochrones(
+    from_stop_id: str = Query(..., alias="from"),
+    depart_at: Optional[datetime] = None,
+    cutoffs: List[int] = Query([15, 30, 45]),
+    window: int = Query(0, ge=0, le=180),
+    max_transfers: int = Query(4, ge=0, le=8),
+    router: RaptorRouter = Depends(feed_raptor_router),
+):
+    """
+    Récupère les zones atteignables depuis un arrêt en `cutoffs` minutes (transport + marche),
+    sous forme de GeoJSON FeatureCollection (un MultiPolygon par durée).
+    """
+    origin = router.tt.stop_index.get(from_stop_id)
+    if origin is None:
+        raise HTTPException(status_code=404, detail="Stop not found")
+    if not cutoffs or min(cutoffs) <= 0 or max(cutoffs) > 240:
+        raise HTTPException(status_code=400, detail="cutoffs must be between 1 and 240 minutes")
+    return isochrones.isochrone(
+        router, origin, router.tt.local_time(depart_at), cutoffs,
+        window_secs=window * 60, max_transfers=max_transfers,
+    )
+
+@feed_router.post("/matrix", response_class=Response, tags=["Planning"])
+async def compute_travel_time_matrix(request: schemas.MatrixRequest, router: RaptorRouter = Depends(feed_raptor_router)):
+    """
+    Calcule la matrice des temps de parcours (secondes) entre origines et destinations.
+    Réponse binaire au format .npy (uint16, 65535 = non atteignable), lignes dans l'ordre
+    de `origins`, colonnes dans l'ordre de `destinations`. Les lots sont attendus sur le
+    pool de processus partagé : aucun thread de l'API n'est bloqué pendant le calcul.
+    """
+    tt = router.tt
+    destination_ids = request.destinations or request.origins
+    unknown = [stop_id for stop_id in request.origins + destination_ids if stop_id not in tt.stop_index]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Stops not found: {', '.join(unknown[:10])}")
+    matrix = await isochrones.compute_matrix_async(
+        [tt.stop_index[stop_id] for stop_id in request.origins],
+        [tt.stop_index[stop_id] for stop_id in destination_ids],
+        tt.local_time(request.depart_at),
+        router,
+        isochrones.shared_pool(tt),
+        window_secs=request.window * 60,
+        step_secs=request.step * 60,
+        max_duration=request.max_duration * 60,
+        max_transfers=request.max_transfers,
+    )
+    buffer = io.BytesIO()
+    np.save(buffer, matrix)
+    return Response(
+        content=buffer.getvalue(),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": 'attachment; filename="matrix.npy"'},
+    )
+
+# --- Routes d'exploitation ---
+@app.get("/cache/stats", response_model=schemas.CacheStats, tags=["Monitoring"])
+@http_cache.volatile()
+def read_cache_stats():
+    """
+    Compteurs du cache des lectures crud (succès, échecs, évictions, invalidations).
+    """
+    return query_cache.get_stats()
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Monitoring"])
+@http_cache.volatile()
+def read_metrics():
+    """
+    Métriques au format texte Prometheus : latences, requêtes SQL, temps en base, lignes
+    et attente du pool par route, plus les compteurs du cache et du regroupement de requêtes.
+    """
+    cache = query_cache.get_stats()
+    flights = singleflight.get_stats()
+    extra = {
+        "gtfs_query_cache_hits_total": ("counter", "Lectures crud servies par le cache.", {(): cache["hits"]}),
+        "gtfs_query_cache_misses_total": ("counter", "Lectures crud exécutées en base.", {(): cache["misses"]}),
+        "gtfs_query_cache_evictions_total": ("counter", "Entrées évincées du cache.", {(): cache["evictions"]}),
+        "gtfs_query_cache_bytes": ("gauge", "Taille estimée du cache.", {(): cache["bytes"]}),
+        "gtfs_coalesced_requests_total": ("counter", "Requêtes servies par une requête identique en cours.", {(): flights["coalesced"]}),
+        "gtfs_db_replica_up": ("gauge", "Réplica en lecture disponible (1) ou écarté (0).", {
+            (("replica", replica["url"]),): int(replica["healthy"]) for replica in replica_router.status()
+        }),
+    }
+    status = realtime.get_status()
+    if status["polls"]:
+        extra["gtfs_realtime_trips"] = ("gauge", "Trajets couverts par les retards temps réel.", {(): status["trips"]})
+        extra["gtfs_realtime_poll_errors_total"] = ("counter", "Relèves GTFS-RT en échec.", {(): status["errors"]})
+        if status["feed_timestamp"]:
+            extra["gtfs_realtime_feed_timestamp_seconds"] = ("gauge", "Horodatage du dernier flux GTFS-RT lu.", {(): status["feed_timestamp"]})
+    hub = subscriptions.departures_hub.stats()
+    extra["gtfs_departure_subscribers"] = ("gauge", "Abonnés aux flux de départs (SSE).", {(): hub["subscribers"]})
+    extra["gtfs_departure_subscribed_stops"] = ("gauge", "Arrêts suivis par au moins un abonné.", {(): hub["topics"]})
+    return PlainTextResponse(metrics.render_prometheus(extra), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/slow-queries", response_model=schemas.SlowQueryReport, tags=["Monitoring"])
+@http_cache.volatile()
+def read_slow_queries():
+    """
+    Dernières requêtes SQL lentes (plus récentes d'abord), avec leur plan d'exécution.
+    Actif seulement si SLOW_QUERY_MS est défini.
+    """
+    return {"threshold_ms": slow_queries.threshold_ms(), "queries": slow_queries.get_slow_queries()}
+
+@app.get("/coalescing/stats", response_model=schemas.CoalescingStats, tags=["Monitoring"])
+@http_cache.volatile()
+def read_coalescing_stats():
+    """
+    Compteurs du regroupement des requêtes identiques simultanées (single-flight).
+    """
+    return singleflight.get_stats()
+
+def mount_feed_routes(router: APIRouter) -> None:
+    """
+    Enregistre chaque route de `router` directement sur l'application, sans préfixe puis
+    sous /feeds/{feed_id}. Pas d'include_router : FastAPI y ajoute un routeur intermédiaire,
+    et les middlewares qui résolvent la route avant l'exécution (ETag, coalescence,
+    métriques, instantanés) ne verraient plus ni le handler ni le gabarit du chemin.
+    """
+    for prefix, dependencies in (("", []), ("/feeds/{feed_id}", [Depends(require_feed)])):
+        for route in router.routes:
+            app.add_api_route(
+                prefix + route.path,
+                route.endpoint,
+                methods=list(route.methods),
+                response_model=route.response_model,
+                response_class=route.response_class,
+                tags=route.tags,
+                dependencies=dependencies,
+                name=route.name,
+            )
+
+mount_feed_routes(feed_router)
     
 # TODO: Ajoutez des routes pour les autres entités GTFS (Calendar, CalendarDate, Shapes, Frequencies, etc.)
 # en suivant le même modèle :
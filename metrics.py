@@ -0,0 +1,242 @@
+# metrics.py
+# Instrumentation des requêtes HTTP et de leur coût en base, exposée au format texte
+# Prometheus sur /metrics. Pour chaque route (gabarit de chemin, ex. /routes/{route_id}) :
+# histogramme des latences, nombre de requêtes SQL (total et par requête HTTP, pour
+# repérer les N+1), temps passé en base, lignes renvoyées et attente de connexion du pool.
+#
+# Les lignes renvoyées viennent de cursor.rowcount, que seuls certains pilotes renseignent
+# pour un SELECT (psycopg2 avec un curseur client). Sous SQLite ou avec un curseur serveur
+# il vaut -1 : ces requêtes ne sont pas comptées dans les lignes, mais à part.
+#
+# Les compteurs d'une requête HTTP vivent dans une ContextVar : elle suit la requête
+# jusque dans le thread du handler (run_in_threadpool copie le contexte).
+
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from http_cache import resolve_route
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestCost:
+    """Coût en base d'une requête HTTP, alimenté par les événements SQLAlchemy."""
+
+    __slots__ = ("endpoint", "statements", "db_seconds", "rows", "unreported_rows", "pool_wait_seconds")
+
+    def __init__(self, endpoint: str = ""):
+        self.endpoint = endpoint  # "GET /routes/{route_id}"
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.unreported_rows = 0  # SELECT dont le pilote ne donne pas le nombre de lignes
+        self.pool_wait_seconds = 0.0
+
+
+_current: ContextVar[Optional[RequestCost]] = ContextVar("request_cost", default=None)
+
+
+def current_endpoint() -> Optional[str]:
+    """Route de la requête HTTP en cours dans ce contexte (None hors requête)."""
+    cost = _current.get()
+    return cost.endpoint if cost is not None else None
+
+
+# --- Événements SQLAlchemy (tous les moteurs : primaire et réplicas) ---
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    cost = _current.get()
+    if cost is None or not conn.info.get("query_start"):
+        return
+    cost.db_seconds += time.perf_counter() - conn.info["query_start"].pop()
+    cost.statements += 1
+    if cursor.description is not None:
+        # Nombre de lignes du SELECT : connu dès l'exécution avec psycopg2, -1 sinon
+        if cursor.rowcount >= 0:
+            cost.rows += cursor.rowcount
+        else:
+            cost.unreported_rows += 1
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    # Requête en échec : after_cursor_execute ne sera pas appelé, son départ est retiré ici
+    starts = context.connection.info.get("query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+@event.listens_for(Session, "after_transaction_create")
+def _after_transaction_create(session, transaction):
+    # Début de transaction : la connexion va être demandée au pool
+    if transaction.parent is None and _current.get() is not None:
+        session.info["checkout_start"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_begin")
+def _after_begin(session, transaction, connection):
+    cost = _current.get()
+    start = session.info.pop("checkout_start", None)
+    if cost is not None and start is not None:
+        cost.pool_wait_seconds += time.perf_counter() - start
+
+
+# --- Agrégats par route ---
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, buckets: Tuple[float, ...], value: float) -> None:
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+
+class _RouteMetrics:
+    __slots__ = ("latency", "statements_per_request", "statuses", "statements", "db_seconds", "rows", "unreported_rows",
+                 "pool_wait_seconds")
+
+    def __init__(self):
+        self.latency = _Histogram(LATENCY_BUCKETS)
+        self.statements_per_request = _Histogram(STATEMENT_BUCKETS)
+        self.statuses: Dict[int, int] = {}
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.unreported_rows = 0
+        self.pool_wait_seconds = 0.0
+
+
+_routes: Dict[Tuple[str, str], _RouteMetrics] = {}
+_lock = threading.Lock()
+
+
+def record(method: str, route: str, status: int, seconds: float, cost: RequestCost) -> None:
+    with _lock:
+        metrics = _routes.get((method, route))
+        if metrics is None:
+            metrics = _routes[(method, route)] = _RouteMetrics()
+        metrics.latency.observe(LATENCY_BUCKETS, seconds)
+        metrics.statements_per_request.observe(STATEMENT_BUCKETS, cost.statements)
+        metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+        metrics.statements += cost.statements
+        metrics.db_seconds += cost.db_seconds
+        metrics.rows += cost.rows
+        metrics.unreported_rows += cost.unreported_rows
+        metrics.pool_wait_seconds += cost.pool_wait_seconds
+
+
+class MetricsMiddleware:
+    """Middleware ASGI : mesure chaque requête HTTP, y compris celles servies sans handler (304)."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = resolve_route(scope)
+        template = getattr(route, "path", None) or "<unmatched>"
+        cost = RequestCost(f"{scope['method']} {template}")
+        token = _current.set(cost)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current.reset(token)
+            record(scope["method"], template, status, time.perf_counter() - start, cost)
+
+
+# --- Format texte Prometheus ---
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def _histogram_lines(name: str, buckets: Tuple[float, ...], histogram: _Histogram, labels: dict) -> List[str]:
+    lines = [
+        f"{name}_bucket{_labels(**labels, le=bound)} {count}"
+        for bound, count in zip(buckets, histogram.counts)
+    ]
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {histogram.count}")
+    lines.append(f"{name}_sum{_labels(**labels)} {histogram.total}")
+    lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+    return lines
+
+
+def render_prometheus(extra: Optional[Dict[str, Tuple[str, str, Dict[tuple, float]]]] = None) -> str:
+    """
+    Toutes les métriques au format d'exposition texte Prometheus (version 0.0.4).
+    `extra` ajoute des séries : nom -> (type, aide, {((label, valeur), ...): valeur}).
+    """
+    with _lock:
+        routes = sorted(_routes.items())
+        out: List[str] = []
+
+        def family(name: str, kind: str, help_text: str) -> None:
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+
+        family("gtfs_http_request_duration_seconds", "histogram", "Latence des requêtes HTTP par route.")
+        for (method, route), metrics in routes:
+            out.extend(_histogram_lines("gtfs_http_request_duration_seconds", LATENCY_BUCKETS, metrics.latency,
+                                        {"method": method, "route": route}))
+        family("gtfs_http_requests_total", "counter", "Requêtes HTTP par route et code de statut.")
+        for (method, route), metrics in routes:
+            for status, count in sorted(metrics.statuses.items()):
+                out.append(f"gtfs_http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+        family("gtfs_db_statements_per_request", "histogram", "Requêtes SQL exécutées par requête HTTP.")
+        for (method, route), metrics in routes:
+            out.extend(_histogram_lines("gtfs_db_statements_per_request", STATEMENT_BUCKETS,
+                                        metrics.statements_per_request, {"method": method, "route": route}))
+        for name, attribute, help_text in (
+            ("gtfs_db_statements_total", "statements", "Requêtes SQL exécutées."),
+            ("gtfs_db_duration_seconds_total", "db_seconds", "Temps passé à exécuter les requêtes SQL."),
+            ("gtfs_db_rows_total", "rows",
+             "Lignes renvoyées par les SELECT, selon cursor.rowcount : dépend du pilote (psycopg2 avec curseur client), "
+             "voir gtfs_db_rows_unreported_statements_total."),
+            ("gtfs_db_rows_unreported_statements_total", "unreported_rows",
+             "SELECT dont le pilote ne donne pas le nombre de lignes (SQLite, curseurs serveur), absents de gtfs_db_rows_total."),
+            ("gtfs_db_pool_wait_seconds_total", "pool_wait_seconds", "Attente d'une connexion du pool."),
+        ):
+            family(name, "counter", help_text)
+            for (method, route), metrics in routes:
+                out.append(f"{name}{_labels(method=method, route=route)} {getattr(metrics, attribute)}")
+
+    for name, (kind, help_text, series) in (extra or {}).items():
+        family(name, kind, help_text)
+        for labels, value in series.items():
+            out.append(f"{name}{_labels(**dict(labels)) if labels else ''} {value}")
+    return "\n".join(out) + "\n"
@@ -1,17 +1,49 @@
 # traafdata/models.py (avec corrections pour Trip et Shape)
 
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, PrimaryKeyConstraint
+from sqlalchemy import Column, DateTime, Integer, String, Float, ForeignKeyConstraint, PrimaryKeyConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import UniqueConstraint
 
 Base = declarative_base()
 
+# Plusieurs flux (opérateurs, versions datées) cohabitent : chaque table GTFS porte feed_id en
+# tête de sa clé primaire et, sous PostgreSQL, est partitionnée par liste sur feed_id (une
+# partition par flux, créée par feeds.py). Une requête filtrée sur un flux ne lit que sa
+# partition, et un flux entier disparaît en détachant ses partitions.
+PARTITION_BY_FEED = {"postgresql_partition_by": "LIST (feed_id)"}
+
+
+def feed_foreign_key(column: str, table: str, remote_column: str = None) -> ForeignKeyConstraint:
+    """Clé étrangère composée (feed_id, column) vers `table`, dans le même flux."""
+    return ForeignKeyConstraint(
+        ["feed_id", column],
+        [f"{table}.feed_id", f"{table}.{remote_column or column}"],
+    )
+
+
+def same_feed(model: str, column: str, target: str, target_column: str) -> str:
+    """
+    Condition de jointure (feed_id, column) -> target, pour une relation dont la table a
+    plusieurs clés étrangères : la relation n'écrit que `column`, feed_id reste à une seule.
+    """
+    return f"and_({model}.feed_id == {target}.feed_id, foreign({model}.{column}) == {target}.{target_column})"
+
+
+# --- Registre des flux ---
+
+class Feed(Base):
+    __tablename__ = 'feeds'
+    feed_id = Column(String, primary_key=True)
+    loaded_at = Column(DateTime) # Fin du chargement (NULL tant que le flux est en cours de chargement)
+
+
 # --- GTFS Models ---
 
 class Agency(Base):
     __tablename__ = 'agencies'
-    agency_id = Column(String, primary_key=True, index=True)
+    feed_id = Column(String, primary_key=True)
+    agency_id = Column(String, primary_key=True)
     agency_name = Column(String, nullable=False)
     agency_url = Column(String, nullable=False)
     agency_timezone = Column(String, nullable=False)
@@ -20,12 +52,15 @@ class Agency(Base):
     agency_fare_url = Column(String)
     agency_email = Column(String)
 
+    __table_args__ = PARTITION_BY_FEED
+
     routes = relationship("Route", back_populates="agency")
 
 
 class Calendar(Base):
     __tablename__ = 'calendar'
-    service_id = Column(String, primary_key=True, index=True)
+    feed_id = Column(String, primary_key=True)
+    service_id = Column(String, primary_key=True)
     monday = Column(Integer, nullable=False)
     tuesday = Column(Integer, nullable=False)
     wednesday = Column(Integer, nullable=False)
@@ -36,53 +71,80 @@ class Calendar(Base):
     start_date = Column(String, nullable=False)
     end_date = Column(String, nullable=False)
 
-    trips = relationship("Trip", back_populates="calendar_service")
+    __table_args__ = PARTITION_BY_FEED
+
+    trips = relationship("Trip", primaryjoin=same_feed("Trip", "service_id", "Calendar", "service_id"), back_populates="calendar_service")
     calendar_dates = relationship("CalendarDate", back_populates="calendar_service")
 
 
 class CalendarDate(Base):
     __tablename__ = 'calendar_dates'
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    service_id = Column(String, ForeignKey('calendar.service_id'), nullable=False, index=True)
-    date = Column(String, nullable=False)
+    # Clé GTFS (service_id, date) : pas de clé artificielle, qu'il faudrait numéroter par flux
+    feed_id = Column(String, primary_key=True)
+    service_id = Column(String, primary_key=True)
+    date = Column(String, primary_key=True)
     exception_type = Column(Integer, nullable=False)
 
+    __table_args__ = (
+        feed_foreign_key('service_id', 'calendar'),
+        PARTITION_BY_FEED,
+    )
+
     calendar_service = relationship("Calendar", back_populates="calendar_dates")
 
 
 class FareAttribute(Base):
     __tablename__ = 'fare_attributes'
-    fare_id = Column(String, primary_key=True, index=True)
+    feed_id = Column(String, primary_key=True)
+    fare_id = Column(String, primary_key=True)
     price = Column(Float, nullable=False)
     currency_type = Column(String, nullable=False)
     payment_method = Column(Integer, nullable=False)
     transfers = Column(Integer)
-    agency_id = Column(String, ForeignKey('agencies.agency_id'))
+    agency_id = Column(String)
     transfer_duration = Column(Integer)
 
+    __table_args__ = (
+        feed_foreign_key('agency_id', 'agencies'),
+        PARTITION_BY_FEED,
+    )
+
     agency = relationship("Agency", backref="fare_attributes") # Using backref for simplicity if Agency doesn't define it
     fare_rules = relationship("FareRule", back_populates="fare_attribute")
 
 
 class FareRule(Base):
     __tablename__ = 'fare_rules'
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    fare_id = Column(String, ForeignKey('fare_attributes.fare_id'), nullable=False, index=True)
-    route_id = Column(String, ForeignKey('routes.route_id'))
-    origin_id = Column(String, ForeignKey('stops.stop_id'))
-    destination_id = Column(String, ForeignKey('stops.stop_id'))
-    contains_id = Column(String, ForeignKey('stops.stop_id'))
+    # Toutes les colonnes GTFS sont facultatives : id est le numéro de ligne dans fare_rules.txt
+    feed_id = Column(String, primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    fare_id = Column(String, nullable=False, index=True)
+    route_id = Column(String)
+    origin_id = Column(String)
+    destination_id = Column(String)
+    contains_id = Column(String)
+
+    __table_args__ = (
+        feed_foreign_key('fare_id', 'fare_attributes'),
+        feed_foreign_key('route_id', 'routes'),
+        feed_foreign_key('origin_id', 'stops', 'stop_id'),
+        feed_foreign_key('destination_id', 'stops', 'stop_id'),
+        feed_foreign_key('contains_id', 'stops', 'stop_id'),
+        PARTITION_BY_FEED,
+    )
 
     fare_attribute = relationship("FareAttribute", back_populates="fare_rules")
-    route = relationship("Route", backref="fare_rules") # Using backref
-    origin_stop = relationship("Stop", foreign_keys=[origin_id])
-    destination_stop = relationship("Stop", foreign_keys=[destination_id])
-    contains_stop = relationship("Stop", foreign_keys=[contains_id])
+    route = relationship("Route", primaryjoin=same_feed("FareRule", "route_id", "Route", "route_id"), backref="fare_rules") # Using backref
+    origin_stop = relationship("Stop", primaryjoin=same_feed("FareRule", "origin_id", "Stop", "stop_id"))
+    destination_stop = relationship("Stop", primaryjoin=same_feed("FareRule", "destination_id", "Stop", "stop_id"))
+    contains_stop = relationship("Stop", primaryjoin=same_feed("FareRule", "contains_id", "Stop", "stop_id"))
 
 
 class FeedInfo(Base):
     __tablename__ = 'feed_info'
-    feed_publisher_name = Column(String, primary_key=True, index=True)
+    # Une ligne par flux (feed_info.txt n'en contient qu'une)
+    feed_id = Column(String, primary_key=True)
+    feed_publisher_name = Column(String, nullable=False)
     feed_publisher_url = Column(String, nullable=False)
     feed_lang = Column(String, nullable=False)
     default_lang = Column(String)
@@ -92,31 +154,43 @@ class FeedInfo(Base):
     feed_contact_email = Column(String)
     feed_contact_url = Column(String)
 
+    __table_args__ = PARTITION_BY_FEED
+
 
 class Frequency(Base):
     __tablename__ = 'frequencies'
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    trip_id = Column(String, ForeignKey('trips.trip_id'), nullable=False, index=True)
-    start_time = Column(String, nullable=False)
+    # Clé GTFS (trip_id, start_time)
+    feed_id = Column(String, primary_key=True)
+    trip_id = Column(String, primary_key=True)
+    start_time = Column(String, primary_key=True)
     end_time = Column(String, nullable=False)
     headway_secs = Column(Integer, nullable=False)
     exact_times = Column(Integer)
 
+    __table_args__ = (
+        feed_foreign_key('trip_id', 'trips'),
+        PARTITION_BY_FEED,
+    )
+
     trip = relationship("Trip", back_populates="frequencies")
 
 
 class Level(Base):
     __tablename__ = 'levels'
-    level_id = Column(String, primary_key=True, index=True)
+    feed_id = Column(String, primary_key=True)
+    level_id = Column(String, primary_key=True)
     level_index = Column(Float, nullable=False)
     level_name = Column(String)
 
+    __table_args__ = PARTITION_BY_FEED
+
 
 class Pathway(Base):
     __tablename__ = 'pathways'
-    pathway_id = Column(String, primary_key=True, index=True)
-    from_stop_id = Column(String, ForeignKey('stops.stop_id'), nullable=False)
-    to_stop_id = Column(String, ForeignKey('stops.stop_id'), nullable=False)
+    feed_id = Column(String, primary_key=True)
+    pathway_id = Column(String, primary_key=True)
+    from_stop_id = Column(String, nullable=False)
+    to_stop_id = Column(String, nullable=False)
     pathway_mode = Column(Integer, nullable=False)
     is_bidirectional = Column(Integer, nullable=False)
     length = Column(Float)
@@ -127,14 +201,83 @@ class Pathway(Base):
     signposted_as = Column(String)
     reversed_signposted_as = Column(String)
 
-    from_stop = relationship("Stop", foreign_keys=[from_stop_id], back_populates="pathways_from")
-    to_stop = relationship("Stop", foreign_keys=[to_stop_id], back_populates="pathways_to")
+    __table_args__ = (
+        feed_foreign_key('from_stop_id', 'stops', 'stop_id'),
+        feed_foreign_key('to_stop_id', 'stops', 'stop_id'),
+        PARTITION_BY_FEED,
+    )
+
+    from_stop = relationship("Stop", foreign_keys=[feed_id, from_stop_id], back_populates="pathways_from")
+    to_stop = relationship("Stop", primaryjoin=same_feed("Pathway", "to_stop_id", "Stop", "stop_id"), back_populates="pathways_to")
+
+
+class Pattern(Base):
+    # Suite d'arrêts unique d'une route, partagée par plusieurs trajets (table dérivée, cf. patterns.py)
+    __tablename__ = 'patterns'
+    feed_id = Column(String, primary_key=True)
+    pattern_id = Column(String, primary_key=True)
+    route_id = Column(String, nullable=False, index=True)
+    direction_id = Column(Integer)
+    shape_id = Column(String)
+    trip_headsign = Column(String)
+    stop_count = Column(Integer, nullable=False)
+    trip_count = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        feed_foreign_key('route_id', 'routes'),
+        PARTITION_BY_FEED,
+    )
+
+    route = relationship("Route", back_populates="patterns")
+    stops = relationship("PatternStop", back_populates="pattern", order_by="PatternStop.stop_sequence")
+    trips = relationship("PatternTrip", back_populates="pattern")
+
+
+class PatternStop(Base):
+    __tablename__ = 'pattern_stops'
+    feed_id = Column(String, nullable=False)
+    pattern_id = Column(String, nullable=False)
+    stop_sequence = Column(Integer, nullable=False) # Position dans le pattern (0, 1, 2...)
+    stop_id = Column(String, nullable=False, index=True)
+    arrival_offset = Column(Integer) # Secondes depuis le départ du trajet, selon le profil de référence
+    departure_offset = Column(Integer)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('feed_id', 'pattern_id', 'stop_sequence', name='pk_pattern_stops'),
+        feed_foreign_key('pattern_id', 'patterns'),
+        feed_foreign_key('stop_id', 'stops'),
+        PARTITION_BY_FEED,
+    )
+
+    pattern = relationship("Pattern", back_populates="stops")
+    stop = relationship("Stop", primaryjoin=same_feed("PatternStop", "stop_id", "Stop", "stop_id"))
+
+
+class PatternTrip(Base):
+    __tablename__ = 'pattern_trips'
+    feed_id = Column(String, primary_key=True)
+    trip_id = Column(String, primary_key=True)
+    pattern_id = Column(String, nullable=False, index=True)
+    start_time = Column(Integer, nullable=False) # Départ au premier arrêt, en secondes depuis minuit
+    # Décalages "arrivée:départ" séparés par des virgules, uniquement si le trajet
+    # ne suit pas le profil de référence du pattern (sinon NULL)
+    time_vector = Column(String)
+
+    __table_args__ = (
+        feed_foreign_key('trip_id', 'trips'),
+        feed_foreign_key('pattern_id', 'patterns'),
+        PARTITION_BY_FEED,
+    )
+
+    pattern = relationship("Pattern", back_populates="trips")
+    trip = relationship("Trip", primaryjoin=same_feed("PatternTrip", "trip_id", "Trip", "trip_id"))
 
 
 class Route(Base):
     __tablename__ = 'routes'
-    route_id = Column(String, primary_key=True, index=True)
-    agency_id = Column(String, ForeignKey('agencies.agency_id'))
+    feed_id = Column(String, primary_key=True)
+    route_id = Column(String, primary_key=True)
+    agency_id = Column(String)
     route_short_name = Column(String)
     route_long_name = Column(String)
     route_desc = Column(String)
@@ -146,23 +289,31 @@ class Route(Base):
     continuous_pickup = Column(Integer)
     continuous_drop_off = Column(Integer)
 
+    __table_args__ = (
+        feed_foreign_key('agency_id', 'agencies'),
+        PARTITION_BY_FEED,
+    )
+
     agency = relationship("Agency", back_populates="routes")
     trips = relationship("Trip", back_populates="route")
+    patterns = relationship("Pattern", back_populates="route")
 
 
 class Shape(Base):
     __tablename__ = 'shapes'
     # id = Column(Integer, primary_key=True, autoincrement=True) # PK artificielle optionnelle
+    feed_id = Column(String, nullable=False)
     shape_id = Column(String, nullable=False, index=True)
     shape_pt_lat = Column(Float, nullable=False)
     shape_pt_lon = Column(Float, nullable=False)
     shape_pt_sequence = Column(Integer, nullable=False)
     shape_dist_traveled = Column(Float)
 
-    # La clé primaire est la combinaison de shape_id et shape_pt_sequence
+    # La clé primaire est la combinaison de feed_id, shape_id et shape_pt_sequence
     __table_args__ = (
-        PrimaryKeyConstraint('shape_id', 'shape_pt_sequence', name='pk_shapes'),
+        PrimaryKeyConstraint('feed_id', 'shape_id', 'shape_pt_sequence', name='pk_shapes'),
         # UniqueConstraint('shape_id', 'shape_pt_sequence', name='_shape_point_uc'), # Redondant si PK
+        PARTITION_BY_FEED,
     )
     # La relation 'trips' n'a pas de sens ici si elle est basée sur une FK de Trip vers Shape.
     # Si un Shape (point) appartenait à plusieurs trips, ce serait différent, mais ce n'est pas le cas.
@@ -171,12 +322,13 @@ class Shape(Base):
 
 class StopTime(Base):
     __tablename__ = 'stop_times'
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    trip_id = Column(String, ForeignKey('trips.trip_id'), nullable=False, index=True)
+    # Clé GTFS (trip_id, stop_sequence), qui sert aussi les lectures des horaires d'un trajet
+    feed_id = Column(String, primary_key=True)
+    trip_id = Column(String, primary_key=True)
     arrival_time = Column(String)
     departure_time = Column(String)
-    stop_id = Column(String, ForeignKey('stops.stop_id'), nullable=False, index=True)
-    stop_sequence = Column(Integer, nullable=False)
+    stop_id = Column(String, nullable=False, index=True)
+    stop_sequence = Column(Integer, primary_key=True)
     stop_headsign = Column(String)
     pickup_type = Column(Integer)
     drop_off_type = Column(Integer)
@@ -186,13 +338,20 @@ class StopTime(Base):
     continuous_pickup = Column(Integer)
     continuous_drop_off = Column(Integer)
 
+    __table_args__ = (
+        feed_foreign_key('trip_id', 'trips'),
+        feed_foreign_key('stop_id', 'stops'),
+        PARTITION_BY_FEED,
+    )
+
     trip = relationship("Trip", back_populates="stop_times")
-    stop = relationship("Stop", back_populates="stop_times")
+    stop = relationship("Stop", primaryjoin=same_feed("StopTime", "stop_id", "Stop", "stop_id"), back_populates="stop_times")
 
 
 class Stop(Base):
     __tablename__ = 'stops'
-    stop_id = Column(String, primary_key=True, index=True)
+    feed_id = Column(String, primary_key=True)
+    stop_id = Column(String, primary_key=True)
     stop_code = Column(String)
     stop_name = Column(String)
     stop_desc = Column(String)
@@ -201,43 +360,75 @@ class Stop(Base):
     zone_id = Column(String)
     stop_url = Column(String)
     location_type = Column(Integer)
-    parent_station = Column(String, ForeignKey('stops.stop_id'))
+    parent_station = Column(String)
     stop_timezone = Column(String)
     wheelchair_boarding = Column(Integer)
-    level_id = Column(String, ForeignKey('levels.level_id'))
+    level_id = Column(String)
     platform_code = Column(String)
 
-    parent = relationship("Stop", remote_side=[stop_id], backref="children_stops") # Added backref for clarity
-    level = relationship("Level", backref="stops") # Using backref
+    __table_args__ = (
+        feed_foreign_key('parent_station', 'stops', 'stop_id'),
+        feed_foreign_key('level_id', 'levels'),
+        PARTITION_BY_FEED,
+    )
+
+    parent = relationship("Stop", remote_side=[feed_id, stop_id], foreign_keys=[feed_id, parent_station], backref="children_stops") # Added backref for clarity
+    level = relationship("Level", primaryjoin=same_feed("Stop", "level_id", "Level", "level_id"), backref="stops") # Using backref
+
+    stop_times = relationship("StopTime", primaryjoin=same_feed("StopTime", "stop_id", "Stop", "stop_id"), back_populates="stop")
+    pathways_from = relationship("Pathway", foreign_keys=[Pathway.feed_id, Pathway.from_stop_id], back_populates="from_stop")
+    pathways_to = relationship("Pathway", primaryjoin=same_feed("Pathway", "to_stop_id", "Stop", "stop_id"), back_populates="to_stop")
 
-    stop_times = relationship("StopTime", back_populates="stop")
-    pathways_from = relationship("Pathway", foreign_keys=[Pathway.from_stop_id], back_populates="from_stop")
-    pathways_to = relationship("Pathway", foreign_keys=[Pathway.to_stop_id], back_populates="to_stop")
+
+class StopRoute(Base):
+    # Index inversé arrêt -> routes (table dérivée, cf. patterns.py) : une ligne par route
+    # desservant l'arrêt, lue par clé primaire (feed_id, stop_id)
+    __tablename__ = 'stop_routes'
+    feed_id = Column(String, primary_key=True)
+    stop_id = Column(String, primary_key=True)
+    route_id = Column(String, primary_key=True)
+    pattern_count = Column(Integer, nullable=False) # Patterns de la route passant par l'arrêt
+    trip_count = Column(Integer, nullable=False) # Trajets de la route passant par l'arrêt
+
+    __table_args__ = (
+        feed_foreign_key('stop_id', 'stops'),
+        feed_foreign_key('route_id', 'routes'),
+        PARTITION_BY_FEED,
+    )
 
 
 class Transfer(Base):
     __tablename__ = 'transfers'
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    from_stop_id = Column(String, ForeignKey('stops.stop_id'), nullable=False)
-    to_stop_id = Column(String, ForeignKey('stops.stop_id'), nullable=False)
+    # Clé (from_stop_id, to_stop_id) : une correspondance par paire d'arrêts, générée ou non
+    feed_id = Column(String, primary_key=True)
+    from_stop_id = Column(String, primary_key=True)
+    to_stop_id = Column(String, primary_key=True)
     transfer_type = Column(Integer, nullable=False)
     min_transfer_time = Column(Integer)
+    is_synthetic = Column(Integer, default=0) # 1 = correspondance à pied générée (cf. footpaths.py), absente du flux
 
-    from_stop = relationship("Stop", foreign_keys=[from_stop_id], backref="transfers_from")
-    to_stop = relationship("Stop", foreign_keys=[to_stop_id], backref="transfers_to")
+    __table_args__ = (
+        feed_foreign_key('from_stop_id', 'stops', 'stop_id'),
+        feed_foreign_key('to_stop_id', 'stops', 'stop_id'),
+        PARTITION_BY_FEED,
+    )
+
+    from_stop = relationship("Stop", foreign_keys=[feed_id, from_stop_id], backref="transfers_from")
+    to_stop = relationship("Stop", primaryjoin=same_feed("Transfer", "to_stop_id", "Stop", "stop_id"), backref="transfers_to")
 
 
 class Trip(Base):
     __tablename__ = 'trips'
-    trip_id = Column(String, primary_key=True, index=True)
-    route_id = Column(String, ForeignKey('routes.route_id'), nullable=False, index=True)
-    service_id = Column(String, ForeignKey('calendar.service_id'), nullable=False, index=True)
-    
+    feed_id = Column(String, primary_key=True)
+    trip_id = Column(String, primary_key=True)
+    route_id = Column(String, nullable=False, index=True)
+    service_id = Column(String, nullable=False, index=True)
+
     # shape_id est juste un identifiant (String). Pas de contrainte de clé étrangère ici.
     # La liaison se fait par convention : vous interrogerez la table 'shapes'
     # en utilisant la valeur de 'trips.shape_id'.
     shape_id = Column(String, index=True) # <--- CORRECTION IMPORTANTE
-    
+
     trip_headsign = Column(String)
     trip_short_name = Column(String)
     direction_id = Column(Integer)
@@ -245,9 +436,15 @@ class Trip(Base):
     wheelchair_accessible = Column(Integer)
     bikes_allowed = Column(Integer)
 
+    __table_args__ = (
+        feed_foreign_key('route_id', 'routes'),
+        feed_foreign_key('service_id', 'calendar'),
+        PARTITION_BY_FEED,
+    )
+
     route = relationship("Route", back_populates="trips")
-    calendar_service = relationship("Calendar", back_populates="trips")
-    
+    calendar_service = relationship("Calendar", primaryjoin=same_feed("Trip", "service_id", "Calendar", "service_id"), back_populates="trips")
+
     # La relation 'shape_point' (ou similaire) n'est pas définie par une FK ici.
     # Si vous voulez accéder aux points de forme pour un trip, vous le ferez via une requête:
     # e.g., session.query(Shape).filter(Shape.shape_id == trip_instance.shape_id).order_by(Shape.shape_pt_sequence)
@@ -257,4 +454,4 @@ class Trip(Base):
     # vous pouvez ajouter une propriété Python à votre classe Trip.
 
     stop_times = relationship("StopTime", back_populates="trip")
-    frequencies = relationship("Frequency", back_populates="trip")
\ No newline at end of file
+    frequencies = relationship("Frequency", back_populates="trip")
@@ -0,0 +1,182 @@
+# patterns.py
+# Extraction des patterns de trajets : les trajets d'une route qui desservent exactement
+# la même suite d'arrêts sont regroupés en un pattern. Le pattern stocke une seule fois
+# la suite d'arrêts et un profil de temps de référence ; chaque trajet ne garde que son
+# heure de départ (et ses propres décalages s'il s'écarte du profil).
+#
+# Les patterns donnent aussi l'index inversé arrêt -> routes (stop_routes) : pattern_stops,
+# indexé sur stop_id, sert déjà d'index arrêt -> patterns.
+#
+# Utilisation : python patterns.py [--feed <feed_id>]  (après le chargement des stop_times, cf. seed.py)
+
+import argparse
+from itertools import groupby
+from typing import Dict, List
+
+from sqlalchemy.orm import Session
+
+import models
+from feeds import DEFAULT_FEED_ID
+from timetable import parse_gtfs_time
+
+
+def _trip_offsets(rows: list) -> tuple:
+    """Heure de départ du trajet et décalages (arrivée, départ) de chaque arrêt."""
+    times = []
+    last_time = 0
+    for row in rows:
+        arrival = parse_gtfs_time(row.arrival_time)
+        departure = parse_gtfs_time(row.departure_time)
+        # Heures manquantes (arrêts non "timepoint") : on reprend la dernière heure connue
+        if arrival < 0:
+            arrival = departure if departure >= 0 else last_time
+        if departure < 0:
+            departure = arrival
+        last_time = departure
+        times.append((arrival, departure))
+    start = times[0][1]
+    return start, tuple((arrival - start, departure - start) for arrival, departure in times)
+
+
+def extract_patterns(db: Session, feed_id: str = DEFAULT_FEED_ID) -> List[dict]:
+    """Regroupe les trajets d'un flux par (route, suite d'arrêts), en une seule passe sur stop_times."""
+    trips = {
+        t.trip_id: t
+        for t in db.query(
+            models.Trip.trip_id,
+            models.Trip.route_id,
+            models.Trip.direction_id,
+            models.Trip.shape_id,
+            models.Trip.trip_headsign,
+        ).filter(models.Trip.feed_id == feed_id)
+    }
+    stop_times = (
+        db.query(
+            models.StopTime.trip_id,
+            models.StopTime.stop_id,
+            models.StopTime.arrival_time,
+            models.StopTime.departure_time,
+        )
+        .filter(models.StopTime.feed_id == feed_id)
+        .order_by(models.StopTime.trip_id, models.StopTime.stop_sequence)
+        .yield_per(50000)
+    )
+
+    groups: Dict[tuple, dict] = {}
+    for trip_id, rows in groupby(stop_times, key=lambda row: row.trip_id):
+        trip = trips.get(trip_id)
+        rows = list(rows)
+        if trip is None or not rows:
+            continue
+        start, offsets = _trip_offsets(rows)
+        stops = tuple(row.stop_id for row in rows)
+        group = groups.setdefault((trip.route_id, stops), {
+            "route_id": trip.route_id,
+            "direction_id": trip.direction_id,
+            "shape_id": trip.shape_id,
+            "trip_headsign": trip.trip_headsign,
+            "stops": stops,
+            "trips": [],
+        })
+        group["trips"].append((start, trip_id, offsets))
+
+    # Identifiants stables : "<route_id>:<n>", dans l'ordre (direction, suite d'arrêts)
+    patterns = sorted(groups.values(), key=lambda p: (p["route_id"], p["direction_id"] or 0, p["stops"]))
+    counters: Dict[str, int] = {}
+    for pattern in patterns:
+        counters[pattern["route_id"]] = counters.get(pattern["route_id"], 0) + 1
+        pattern["pattern_id"] = f"{pattern['route_id']}:{counters[pattern['route_id']]}"
+        pattern["trips"].sort()
+        # Profil de référence : celui du premier trajet de la journée
+        pattern["offsets"] = pattern["trips"][0][2]
+    return patterns
+
+
+def stop_route_rows(patterns: List[dict], feed_id: str) -> List[dict]:
+    """Lignes de stop_routes : pour chaque (arrêt, route), nombre de patterns et de trajets qui y passent."""
+    counts: Dict[tuple, List[int]] = {}
+    for pattern in patterns:
+        for stop_id in dict.fromkeys(pattern["stops"]):  # Un arrêt desservi deux fois (boucle) compte une fois
+            count = counts.setdefault((stop_id, pattern["route_id"]), [0, 0])
+            count[0] += 1
+            count[1] += len(pattern["trips"])
+    return [
+        {"feed_id": feed_id, "stop_id": stop_id, "route_id": route_id, "pattern_count": n_patterns, "trip_count": n_trips}
+        for (stop_id, route_id), (n_patterns, n_trips) in counts.items()
+    ]
+
+
+def build_patterns(db: Session, feed_id: str = DEFAULT_FEED_ID) -> int:
+    """
+    Reconstruit les tables patterns, pattern_stops, pattern_trips et stop_routes d'un flux.
+    Retourne le nombre de patterns.
+    """
+    patterns = extract_patterns(db, feed_id)
+
+    db.query(models.StopRoute).filter(models.StopRoute.feed_id == feed_id).delete()
+    db.query(models.PatternTrip).filter(models.PatternTrip.feed_id == feed_id).delete()
+    db.query(models.PatternStop).filter(models.PatternStop.feed_id == feed_id).delete()
+    db.query(models.Pattern).filter(models.Pattern.feed_id == feed_id).delete()
+
+    pattern_rows, stop_rows, trip_rows = [], [], []
+    for pattern in patterns:
+        pattern_rows.append({
+            "feed_id": feed_id,
+            "pattern_id": pattern["pattern_id"],
+            "route_id": pattern["route_id"],
+            "direction_id": pattern["direction_id"],
+            "shape_id": pattern["shape_id"],
+            "trip_headsign": pattern["trip_headsign"],
+            "stop_count": len(pattern["stops"]),
+            "trip_count": len(pattern["trips"]),
+        })
+        for sequence, (stop_id, (arrival, departure)) in enumerate(zip(pattern["stops"], pattern["offsets"])):
+            stop_rows.append({
+                "feed_id": feed_id,
+                "pattern_id": pattern["pattern_id"],
+                "stop_sequence": sequence,
+                "stop_id": stop_id,
+                "arrival_offset": arrival,
+                "departure_offset": departure,
+            })
+        for start, trip_id, offsets in pattern["trips"]:
+            trip_rows.append({
+                "feed_id": feed_id,
+                "trip_id": trip_id,
+                "pattern_id": pattern["pattern_id"],
+                "start_time": start,
+                "time_vector": None if offsets == pattern["offsets"] else ",".join(f"{a}:{d}" for a, d in offsets),
+            })
+
+    db.bulk_insert_mappings(models.Pattern, pattern_rows)
+    db.bulk_insert_mappings(models.PatternStop, stop_rows)
+    db.bulk_insert_mappings(models.PatternTrip, trip_rows)
+    stop_routes = stop_route_rows(patterns, feed_id)
+    db.bulk_insert_mappings(models.StopRoute, stop_routes)
+    db.commit()
+    print(f"{len(pattern_rows)} patterns, {len(stop_rows)} pattern_stops, {len(trip_rows)} pattern_trips, {len(stop_routes)} stop_routes.")
+    return len(pattern_rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regroupe les trajets de même suite d'arrêts en patterns.")
+    parser.add_argument("--feed", default=DEFAULT_FEED_ID, help="Flux à traiter")
+    args = parser.parse_args()
+
+    from db import SessionLocal
+    db_session = SessionLocal()
+    try:
+        print("Building trip patterns...")
+        build_patterns(db_session, args.feed)
+        print("Trip patterns built.")
+    except Exception as e:
+        db_session.rollback()
+        print(f"An error occurred while building patterns: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        db_session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# query_cache.py
+# Cache mémoire des lectures de crud.py. Les données ne changent qu'au rechargement du
+# flux : les résultats sont gardés dans un LRU borné en octets (estimation) et tout le
+# cache est vidé dès que feed_info.feed_version change ou qu'un rechargement se termine.
+#
+# Variables d'environnement :
+#   QUERY_CACHE_MAX_BYTES       taille maximale estimée du cache (défaut 64 Mo, 0 = désactivé)
+#   QUERY_CACHE_CHECK_INTERVAL  secondes entre deux vérifications de feed_version (défaut 30)
+
+import functools
+import inspect
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+import models
+
+DEFAULT_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CHECK_INTERVAL = float(os.getenv("QUERY_CACHE_CHECK_INTERVAL", "30"))
+
+
+def estimate_size(value: Any, _depth: int = 0) -> int:
+    """Taille approximative en octets d'un résultat (listes, dicts, objets ORM chargés)."""
+    size = sys.getsizeof(value)
+    if _depth > 3:
+        return size
+    if isinstance(value, dict):
+        return size + sum(estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return size + sum(estimate_size(v, _depth + 1) for v in value)
+    if hasattr(value, "_sa_instance_state"):
+        # Objet ORM : seuls les attributs déjà chargés comptent (relations comprises)
+        return size + sum(
+            estimate_size(v, _depth + 1) for k, v in vars(value).items() if k != "_sa_instance_state"
+        )
+    return size
+
+
+class QueryCache:
+    """LRU borné par la taille estimée de ses entrées, invalidé d'un bloc par version du flux."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, check_interval: float = CHECK_INTERVAL):
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # clé -> (valeur, taille)
+        self._lock = threading.Lock()
+        self._version: Optional[tuple] = None
+        self._checked_at = 0.0
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: tuple) -> tuple:
+        """Retourne (trouvé, valeur) et marque l'entrée comme récemment utilisée."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key: tuple, value: Any) -> None:
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return  # Plus gros que le cache entier : on ne le garde pas
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted
+                self.evictions += 1
+
+    def invalidate(self) -> None:
+        """Vide tout le cache (rechargement terminé, nouvelle version du flux)."""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.invalidations += 1
+
+    def version_is_stale(self) -> bool:
+        return time.monotonic() - self._checked_at >= self.check_interval
+
+    def check_version(self, db: Session) -> None:
+        """Relit feed_info.feed_version de chaque flux au plus toutes les `check_interval` secondes."""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        version = read_feed_versions(db)
+        if version != self._version:
+            if self._version is not None:
+                self.invalidate()
+            self._version = version
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "feed_version": ",".join(self._version) if self._version else None,
+            }
+
+
+query_cache = QueryCache()
+
+
+def read_feed_versions(db: Session) -> Tuple[str, ...]:
+    """
+    "feed_id:feed_version" de chaque flux chargé, triés ("" pour un flux sans feed_version) :
+    un flux chargé, supprimé ou remplacé change la version, quel que soit le flux.
+    """
+    return tuple(sorted(
+        f"{row.feed_id}:{row.feed_version}" if row.feed_version else ""
+        for row in db.query(models.FeedInfo.feed_id, models.FeedInfo.feed_version)
+    ))
+
+
+def cached(func: Callable) -> Callable:
+    """
+    Mémoïse une fonction de lecture crud `func(db, ...)` : la clé est le nom de la
+    fonction et ses arguments, hors session. Les objets ORM renvoyés sont détachés
+    après la fermeture de leur session ; seuls leurs attributs chargés sont utilisables.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(db: Session, *args, **kwargs):
+        if query_cache.max_bytes <= 0:
+            return func(db, *args, **kwargs)
+        query_cache.check_version(db)
+        # Arguments normalisés : get_route(db, "A") et get_route(db, route_id="A") partagent l'entrée
+        bound = signature.bind(db, *args, **kwargs)
+        bound.apply_defaults()
+        key = (func.__name__,) + tuple(bound.arguments.values())[1:]
+        found, value = query_cache.get(key)
+        if found:
+            return value
+        value = func(db, *args, **kwargs)
+        query_cache.put(key, value)
+        return value
+
+    wrapper.uncached = func
+    return wrapper
+
+
+def feed_version() -> Optional[str]:
+    """
+    Version des flux chargés ("feed_id:feed_version" de chaque flux), sans requête tant
+    qu'elle a été relue depuis moins de QUERY_CACHE_CHECK_INTERVAL secondes. None si aucun
+    flux n'a de feed_version.
+    """
+    if query_cache.version_is_stale():
+        from db import ReadSessionLocal
+        db = ReadSessionLocal()
+        try:
+            query_cache.check_version(db)
+        finally:
+            db.close()
+    version = query_cache._version
+    return ",".join(version) if version and any(version) else None
+
+
+def invalidate() -> None:
+    query_cache.invalidate()
+
+
+def get_stats() -> Dict[str, Any]:
+    return query_cache.stats()
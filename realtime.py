@@ -0,0 +1,261 @@
+# realtime.py
+# Retards temps réel (GTFS-RT TripUpdates) superposés aux horaires théoriques, sans jamais
+# écrire dans PostgreSQL. Un thread relève le flux à intervalle régulier, résout chaque
+# mise à jour sur les positions du trajet dans l'index horaire (Timetable), propage les
+# retards vers l'aval, puis publie une nouvelle couche (DelayOverlay) d'une seule
+# affectation. Les lecteurs prennent la couche courante sans verrou : une couche publiée
+# n'est plus jamais modifiée. Le flux TripUpdates relevé est celui du flux par défaut
+# (GTFS_FEED_ID) : ses retards ne s'appliquent qu'aux routes de ce flux.
+#
+# Variables d'environnement :
+#   GTFS_RT_TRIP_UPDATES_URL   URL du flux TripUpdates (protobuf) ; non définie = désactivé
+#   GTFS_RT_POLL_SECONDS       intervalle de relève (défaut 30)
+#
+# Le décodage protobuf demande le paquet gtfs-realtime-bindings.
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import urllib.request
+from datetime import date, datetime
+from typing import Dict, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from feeds import DEFAULT_FEED_ID
+from service_calendar import parse_gtfs_date
+from timetable import Timetable, format_gtfs_time, get_timetable
+
+try:
+    from google.transit import gtfs_realtime_pb2
+except ImportError:  # Dépendance optionnelle : sans elle, le temps réel reste désactivé
+    gtfs_realtime_pb2 = None
+
+logger = logging.getLogger(__name__)
+
+TRIP_UPDATES_URL = os.getenv("GTFS_RT_TRIP_UPDATES_URL")
+POLL_SECONDS = float(os.getenv("GTFS_RT_POLL_SECONDS", "30"))
+FETCH_TIMEOUT = 10
+
+UNKNOWN = np.iinfo(np.int32).min  # Pas de prédiction pour cette position
+
+
+class TripDelays:
+    """
+    Retards d'un trajet, par position le long du trajet (0 = premier arrêt).
+    `sequences` reprend les stop_sequence du trajet, pour retrouver une position.
+    """
+
+    __slots__ = ("sequences", "arrival", "departure", "skipped", "canceled")
+
+    def __init__(self, sequences: np.ndarray, canceled: bool = False):
+        self.sequences = sequences
+        self.arrival = np.full(len(sequences), UNKNOWN, dtype=np.int32)
+        self.departure = np.full(len(sequences), UNKNOWN, dtype=np.int32)
+        self.skipped = np.zeros(len(sequences), dtype=bool)
+        self.canceled = canceled
+
+    def position(self, stop_sequence: int) -> Optional[int]:
+        i = int(np.searchsorted(self.sequences, stop_sequence))
+        return i if i < len(self.sequences) and self.sequences[i] == stop_sequence else None
+
+    def arrival_delay(self, position: int) -> Optional[int]:
+        delay = int(self.arrival[position])
+        return None if delay == UNKNOWN else delay
+
+    def departure_delay(self, position: int) -> Optional[int]:
+        delay = int(self.departure[position])
+        return None if delay == UNKNOWN else delay
+
+    def is_canceled(self, position: int) -> bool:
+        return self.canceled or bool(self.skipped[position])
+
+
+class DelayOverlay:
+    """Couche de retards publiée, en lecture seule : (trip_id, date de service) -> TripDelays."""
+
+    def __init__(self, trips: Dict[Tuple[str, Optional[date]], TripDelays], version: str, timestamp: int):
+        self.trips = trips
+        self.version = version  # Empreinte du message GTFS-RT, reprise dans les ETag
+        self.timestamp = timestamp  # header.timestamp du flux (secondes POSIX)
+
+    def trip_delays(self, trip_id: str, service_date: Optional[date]) -> Optional[TripDelays]:
+        # Mise à jour sans start_date : elle vaut pour le jour de service en cours
+        delays = self.trips.get((trip_id, service_date))
+        return delays if delays is not None else self.trips.get((trip_id, None))
+
+    def apply_to_stop_times(self, stop_times: list, service_date: Optional[date]) -> list:
+        """Horaires d'un trajet (objets ORM) complétés des prédictions, en nouveaux dicts."""
+        results = []
+        for st in stop_times:
+            row = {column: getattr(st, column) for column in st.__table__.columns.keys()}
+            delays = self.trip_delays(st.trip_id, service_date)
+            position = delays.position(st.stop_sequence) if delays is not None else None
+            if position is not None:
+                row["arrival_delay"] = delays.arrival_delay(position)
+                row["departure_delay"] = delays.departure_delay(position)
+                row["realtime_arrival_time"] = _shift(st.arrival_time, row["arrival_delay"])
+                row["realtime_departure_time"] = _shift(st.departure_time, row["departure_delay"])
+                row["skipped"] = delays.is_canceled(position)
+            results.append(row)
+        return results
+
+
+def _shift(gtfs_time: Optional[str], delay: Optional[int]) -> Optional[str]:
+    if not gtfs_time or delay is None:
+        return None
+    hours, minutes, seconds = gtfs_time.split(":")
+    return format_gtfs_time(max(int(hours) * 3600 + int(minutes) * 60 + int(seconds) + delay, 0))
+
+
+# --- Construction d'une couche ---
+def _event_delay(event, scheduled: int, midnight: float) -> Optional[int]:
+    """Retard d'un StopTimeEvent : `delay` s'il est donné, sinon heure absolue - horaire théorique."""
+    if event.HasField("delay"):
+        return event.delay
+    if event.HasField("time"):
+        return int(event.time - midnight - scheduled)
+    return None
+
+
+def build_overlay(feed, tt: Timetable, today: Optional[date] = None) -> DelayOverlay:
+    """Résout un FeedMessage TripUpdates sur l'index horaire `tt`."""
+    pb = gtfs_realtime_pb2
+    tz = ZoneInfo(tt.timezone) if tt.timezone else None
+    today = today or tt.local_time().date()
+    trips: Dict[Tuple[str, Optional[date]], TripDelays] = {}
+    unmatched = 0
+
+    for entity in feed.entity:
+        if not entity.HasField("trip_update"):
+            continue
+        trip_update = entity.trip_update
+        descriptor = trip_update.trip
+        trip_idx = tt.trip_index.get(descriptor.trip_id)
+        if trip_idx is None:
+            unmatched += 1
+            continue
+        lo, hi = int(tt.trip_st_start[trip_idx]), int(tt.trip_st_start[trip_idx + 1])
+        service_date = parse_gtfs_date(descriptor.start_date) if descriptor.start_date else None
+        delays = TripDelays(
+            tt.st_sequence[lo:hi],
+            canceled=descriptor.schedule_relationship == pb.TripDescriptor.CANCELED,
+        )
+        trips[(descriptor.trip_id, service_date)] = delays
+        if delays.canceled:
+            continue
+
+        midnight = datetime.combine(service_date or today, datetime.min.time(), tzinfo=tz).timestamp()
+        updates = []  # (position, retard à l'arrivée, retard au départ), None = pas de donnée
+        for update in trip_update.stop_time_update:
+            if update.HasField("stop_sequence"):
+                position = delays.position(update.stop_sequence)
+            else:
+                stop_idx = tt.stop_index.get(update.stop_id)
+                matches = np.flatnonzero(tt.st_stop[lo:hi] == stop_idx) if stop_idx is not None else []
+                position = int(matches[0]) if len(matches) else None
+            if position is None:
+                continue
+            relationship = update.schedule_relationship
+            if relationship == pb.TripUpdate.StopTimeUpdate.SKIPPED:
+                delays.skipped[position] = True
+                continue
+            if relationship == pb.TripUpdate.StopTimeUpdate.NO_DATA:
+                updates.append((position, None, None))  # Interrompt la propagation
+                continue
+            arrival = _event_delay(update.arrival, int(tt.st_arrival[lo + position]), midnight) if update.HasField("arrival") else None
+            departure = _event_delay(update.departure, int(tt.st_departure[lo + position]), midnight) if update.HasField("departure") else None
+            updates.append((position, arrival if arrival is not None else departure,
+                            departure if departure is not None else arrival))
+
+        if not updates and trip_update.HasField("delay"):
+            updates.append((0, trip_update.delay, trip_update.delay))  # Retard global du trajet
+        # Chaque retard vaut jusqu'à la mise à jour suivante (propagation vers l'aval seulement)
+        updates.sort(key=lambda u: u[0])
+        for i, (position, arrival, departure) in enumerate(updates):
+            end = updates[i + 1][0] if i + 1 < len(updates) else hi - lo
+            if arrival is not None:
+                delays.arrival[position] = arrival
+            if departure is not None:
+                delays.departure[position] = departure
+                delays.arrival[position + 1:end] = departure
+                delays.departure[position + 1:end] = departure
+
+    if unmatched:
+        logger.info("GTFS-RT: %d trip updates for unknown trips ignored", unmatched)
+    version = hashlib.blake2b(feed.SerializeToString(), digest_size=8).hexdigest()
+    return DelayOverlay(trips, version, feed.header.timestamp)
+
+
+# --- Couche courante et relève ---
+_overlay: Optional[DelayOverlay] = None
+_status = {"polls": 0, "errors": 0, "last_success": None, "last_error": None}
+
+
+def current() -> Optional[DelayOverlay]:
+    """Couche publiée (None tant qu'aucun flux n'a été lu) ; sans verrou."""
+    return _overlay
+
+
+def version() -> Optional[str]:
+    """Version de la couche courante, pour les ETag des réponses qui l'intègrent."""
+    overlay = _overlay
+    return overlay.version if overlay is not None else None
+
+
+def get_status() -> dict:
+    overlay = _overlay
+    return {
+        **_status,
+        "trips": len(overlay.trips) if overlay is not None else 0,
+        "feed_timestamp": overlay.timestamp if overlay is not None else None,
+    }
+
+
+def publish(overlay: Optional[DelayOverlay]) -> None:
+    global _overlay
+    _overlay = overlay  # Affectation atomique : les lecteurs voient l'ancienne ou la nouvelle couche
+
+
+def poll_once(url: str, tt: Timetable) -> DelayOverlay:
+    with urllib.request.urlopen(url, timeout=FETCH_TIMEOUT) as response:
+        payload = response.read()
+    feed = gtfs_realtime_pb2.FeedMessage()
+    feed.ParseFromString(payload)
+    overlay = build_overlay(feed, tt)
+    publish(overlay)
+    return overlay
+
+
+def _poll_forever(url: str, interval: float) -> None:
+    while True:
+        _status["polls"] += 1
+        try:
+            overlay = poll_once(url, get_timetable(DEFAULT_FEED_ID))
+            _status["last_success"] = time.time()
+            logger.debug("GTFS-RT: %d trips updated", len(overlay.trips))
+        except Exception as exc:
+            _status["errors"] += 1
+            _status["last_error"] = f"{type(exc).__name__}: {exc}"
+            logger.warning("GTFS-RT poll failed: %s", exc)
+        time.sleep(interval)
+
+
+_poller: Optional[threading.Thread] = None
+
+
+def start(url: Optional[str] = TRIP_UPDATES_URL, interval: float = POLL_SECONDS) -> bool:
+    """Démarre la relève en arrière-plan (une fois par processus). False si désactivée."""
+    global _poller
+    if not url:
+        return False
+    if gtfs_realtime_pb2 is None:
+        logger.error("GTFS_RT_TRIP_UPDATES_URL is set but gtfs-realtime-bindings is not installed")
+        return False
+    if _poller is None:
+        _poller = threading.Thread(target=_poll_forever, args=(url, interval), name="gtfs-rt-poller", daemon=True)
+        _poller.start()
+    return True
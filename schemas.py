@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Optional, List
+from datetime import date, datetime
 
 # Schéma pour Agency (déjà existant, mais inclus pour complétude)
 class AgencyBase(BaseModel):
@@ -40,7 +41,6 @@ class CalendarDateBase(BaseModel):
     exception_type: int
 
 class CalendarDate(CalendarDateBase):
-    id: int # Ajouté car c'est une PK artificielle
     class Config:
         from_attributes = True
 
@@ -69,6 +69,14 @@ class FareRule(FareRuleBase):
     class Config:
         from_attributes = True
 
+class Feed(BaseModel):
+    # Flux inscrit au registre (cf. feeds.py)
+    feed_id: str
+    loaded_at: Optional[datetime] = None # None tant que le chargement n'est pas terminé
+    is_default: bool = False # Flux servi par les routes sans préfixe /feeds/{feed_id}
+    class Config:
+        from_attributes = True
+
 class FeedInfoBase(BaseModel):
     feed_publisher_name: str
     feed_publisher_url: str
@@ -92,7 +100,6 @@ class FrequencyBase(BaseModel):
     exact_times: Optional[int] = None
 
 class Frequency(FrequencyBase):
-    id: int # Ajouté car c'est une PK artificielle
     class Config:
         from_attributes = True
 
@@ -123,6 +130,26 @@ class Pathway(PathwayBase):
     class Config:
         from_attributes = True
 
+class PatternStop(BaseModel):
+    stop_sequence: int
+    stop_id: str # Réfère à stop_id
+    arrival_offset: Optional[int] = None # Secondes depuis le départ du trajet
+    departure_offset: Optional[int] = None
+    class Config:
+        from_attributes = True
+
+class Pattern(BaseModel):
+    pattern_id: str
+    route_id: str # Réfère à route_id
+    direction_id: Optional[int] = None
+    shape_id: Optional[str] = None
+    trip_headsign: Optional[str] = None
+    stop_count: int
+    trip_count: int
+    stops: List[PatternStop] = []
+    class Config:
+        from_attributes = True
+
 class RouteBase(BaseModel):
     route_id: str
     agency_id: Optional[str] = None # Réfère à agency_id
@@ -165,12 +192,29 @@ class StopTimeBase(BaseModel):
     continuous_pickup: Optional[int] = None
     continuous_drop_off: Optional[int] = None
     timepoint: Optional[int] = None
+    shape_dist_traveled: Optional[float] = None
 
 class StopTime(StopTimeBase):
-    id: int # Ajouté car c'est une PK artificielle
+    # Temps réel (GTFS-RT TripUpdates), si un flux est configuré et couvre ce trajet
+    arrival_delay: Optional[int] = None # secondes, positif = en retard
+    departure_delay: Optional[int] = None
+    realtime_arrival_time: Optional[str] = None # Format HH:MM:SS
+    realtime_departure_time: Optional[str] = None
+    skipped: bool = False # Arrêt non desservi (ou trajet annulé)
     class Config:
         from_attributes = True
 
+class TripSegment(BaseModel):
+    # Inter-arrêt d'un trajet, avec sa portion de tracé (GeoJSON LineString)
+    from_stop_id: str
+    to_stop_id: str
+    from_stop_sequence: int
+    to_stop_sequence: int
+    departure_time: Optional[str] = None
+    arrival_time: Optional[str] = None
+    distance: float # mètres
+    geometry: Dict[str, Any]
+
 class StopBase(BaseModel):
     stop_id: str
     stop_code: Optional[str] = None
@@ -190,14 +234,20 @@ class Stop(StopBase):
     class Config:
         from_attributes = True
 
+class StopRoute(BaseModel):
+    route: Route
+    pattern_count: int # Patterns de la route passant par l'arrêt
+    trip_count: int
+    pattern_ids: List[str] = []
+
 class TransferBase(BaseModel):
     from_stop_id: str # Réfère à stop_id
     to_stop_id: str # Réfère à stop_id
     transfer_type: int
     min_transfer_time: Optional[int] = None
+    is_synthetic: Optional[int] = None
 
 class Transfer(TransferBase):
-    id: int # Ajouté car c'est une PK artificielle
     class Config:
         from_attributes = True
 
@@ -215,4 +265,90 @@ class TripBase(BaseModel):
 
 class Trip(TripBase):
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+# --- Schémas calculés (non persistés) ---
+
+class Departure(BaseModel):
+    trip_id: str
+    route_id: Optional[str] = None
+    route_short_name: Optional[str] = None
+    route_long_name: Optional[str] = None
+    trip_headsign: Optional[str] = None
+    service_date: date
+    departure_time: str # Format HH:MM:SS, relatif au jour de service (peut dépasser 24:00:00)
+    departure: datetime
+    frequency_based: bool
+    # Temps réel (GTFS-RT TripUpdates), si un flux est configuré et couvre ce trajet
+    delay: Optional[int] = None # secondes, positif = en retard
+    realtime_departure: Optional[datetime] = None
+    canceled: bool = False # Trajet annulé ou arrêt non desservi
+
+class ActiveServices(BaseModel):
+    date: date
+    service_ids: List[str]
+
+class PlanLeg(BaseModel):
+    mode: str # "transit" ou "walk"
+    from_stop_id: str
+    from_stop_name: Optional[str] = None
+    to_stop_id: str
+    to_stop_name: Optional[str] = None
+    departure: datetime
+    arrival: datetime
+    departure_time: Optional[str] = None # Format HH:MM:SS, relatif au jour de service
+    arrival_time: Optional[str] = None
+    trip_id: Optional[str] = None
+    trip_headsign: Optional[str] = None
+    route_id: Optional[str] = None
+    route_short_name: Optional[str] = None
+    route_long_name: Optional[str] = None
+
+class Itinerary(BaseModel):
+    departure: datetime
+    arrival: datetime
+    duration: int # Secondes
+    transfers: int
+    legs: List[PlanLeg]
+
+# Taille maximale d'une matrice demandée à l'API : une recherche un-vers-tous par origine
+# (et par départ de la fenêtre), une colonne par destination
+MATRIX_MAX_ORIGINS = 1000
+MATRIX_MAX_DESTINATIONS = 10000
+
+class MatrixRequest(BaseModel):
+    # Mêmes bornes que les paramètres de GET /plan et GET /isochrones
+    origins: List[str] = Field(..., min_length=1, max_length=MATRIX_MAX_ORIGINS) # stop_id
+    destinations: Optional[List[str]] = Field(None, min_length=1, max_length=MATRIX_MAX_DESTINATIONS) # Par défaut, les mêmes arrêts que origins
+    depart_at: Optional[datetime] = None
+    window: int = Field(0, ge=0, le=180) # Fenêtre de départ en minutes (médiane des temps de parcours)
+    step: int = Field(5, ge=1, le=60) # Pas entre deux départs de la fenêtre, en minutes
+    max_duration: int = Field(120, ge=1, le=240) # Minutes
+    max_transfers: int = Field(4, ge=0, le=8)
+
+class CacheStats(BaseModel):
+    entries: int
+    bytes: int # Taille estimée
+    max_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    feed_version: Optional[str] = None
+
+class CoalescingStats(BaseModel):
+    in_flight: int # Requêtes distinctes en cours d'exécution
+    leaders: int # Requêtes exécutées
+    coalesced: int # Requêtes servies par la réponse d'une requête identique en cours
+    fallbacks: int # Requêtes ré-exécutées après l'échec de la requête attendue
+
+class SlowQuery(BaseModel):
+    recorded_at: datetime
+    duration_ms: float
+    endpoint: Optional[str] = None # "GET /routes/{route_id}", None hors requête HTTP
+    statement: str
+    parameters: Any = None
+    plan: Optional[str] = None # None tant que l'EXPLAIN n'a pas été capturé
+
+class SlowQueryReport(BaseModel):
+    threshold_ms: Optional[float] = None # None : enregistreur désactivé (SLOW_QUERY_MS)
+    queries: List[SlowQuery]
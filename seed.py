@@ -1,3 +1,4 @@
+import argparse
 import csv
 import os
 from sqlalchemy import create_engine
@@ -5,7 +6,14 @@ from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
 # Importer vos modèles SQLAlchemy
-from models import Base, Agency, Stop, Route, Trip, StopTime, Calendar, CalendarDate, FeedInfo, Shape, Frequency, Level, Pathway, FareAttribute, FareRule, Transfer
+from models import Base, Feed, Agency, Stop, Route, Trip, StopTime, Calendar, CalendarDate, FeedInfo, Shape, Frequency, Level, Pathway, FareAttribute, FareRule, Transfer
+from feeds import DEFAULT_FEED_ID, create_feed, mark_loaded
+from footpaths import generate_transfers
+from patterns import build_patterns
+from shape_dedup import dedup_shapes
+from shapes import build_shape_distances
+from stations import build_stations
+from validate import validate_feed
 
 load_dotenv()
 
@@ -49,7 +57,7 @@ def to_str(value, default=None):
 
 # --- Fonctions de seeding pour chaque fichier GTFS ---
 
-def seed_agencies(db_session):
+def seed_agencies(db_session, feed_id=DEFAULT_FEED_ID):
     filepath = os.path.join(DATA_DIR, 'agency.txt')
     if not os.path.exists(filepath):
         print(f"Fichier {filepath} non trouvé.")
@@ -59,6 +67,7 @@ def seed_agencies(db_session):
         reader = csv.DictReader(f)
         for row in reader:
             agency = Agency(
+                feed_id=feed_id,
                 agency_id=to_str(row.get('agency_id')),
                 agency_name=to_str(row.get('agency_name')),
                 agency_url=to_str(row.get('agency_url')),
@@ -72,7 +81,7 @@ def seed_agencies(db_session):
     db_session.commit()
     print("Agencies seeded.")
 
-def seed_stops(db_session):
+def seed_stops(db_session, feed_id=DEFAULT_FEED_ID):
     filepath = os.path.join(DATA_DIR, 'stops.txt')
     if not os.path.exists(filepath):
         print(f"Fichier {filepath} non trouvé.")
@@ -82,6 +91,7 @@ def seed_stops(db_session):
         reader = csv.DictReader(f)
         for row in reader:
             stop = Stop(
+                feed_id=feed_id,
                 stop_id=to_str(row.get('stop_id')),
                 stop_code=to_str(row.get('stop_code')),
                 stop_name=to_str(row.get('stop_name')),
@@ -101,7 +111,7 @@ def seed_stops(db_session):
     db_session.commit()
     print("Stops seeded.")
 
-def seed_routes(db_session):
+def seed_routes(db_session, feed_id=DEFAULT_FEED_ID):
     filepath = os.path.join(DATA_DIR, 'routes.txt')
     if not os.path.exists(filepath):
         print(f"Fichier {filepath} non trouvé.")
@@ -111,6 +121,7 @@ def seed_routes(db_session):
         reader = csv.DictReader(f)
         for row in reader:
             route = Route(
+                feed_id=feed_id,
                 route_id=to_str(row.get('route_id')),
                 agency_id=to_str(row.get('agency_id')) if row.get('agency_id') else None,
                 route_short_name=to_str(row.get('route_short_name')),
@@ -128,7 +139,7 @@ def seed_routes(db_session):
     db_session.commit()
     print("Routes seeded.")
 
-def seed_calendar(db_session):
+def seed_calendar(db_session, feed_id=DEFAULT_FEED_ID):
     filepath = os.path.join(DATA_DIR, 'calendar.txt')
     if not os.path.exists(filepath):
         print(f"Fichier {filepath} non trouvé.")
@@ -138,6 +149,7 @@ def seed_calendar(db_session):
         reader = csv.DictReader(f)
         for row in reader:
             calendar_entry = Calendar(
+                feed_id=feed_id,
                 service_id=to_str(row.get('service_id')),
                 monday=to_int(row.get('monday')),
                 tuesday=to_int(row.get('tuesday')),
@@ -153,7 +165,7 @@ def seed_calendar(db_session):
     db_session.commit()
     print("Calendar seeded.")
 
-def seed_calendar_dates(db_session):
+def seed_calendar_dates(db_session, feed_id=DEFAULT_FEED_ID):
     filepath = os.path.join(DATA_DIR, 'calendar_dates.txt')
     if not os.path.exists(filepath):
         print(f"Fichier {filepath} non trouvé.")
@@ -163,6 +175,7 @@ def seed_calendar_dates(db_session):
         reader = csv.DictReader(f)
         for row in reader:
             calendar_date_entry = CalendarDate(
+                feed_id=feed_id,
                 service_id=to_str(row.get('service_id')),
                 date=to_str(row.get('date')),
                 exception_type=to_int(row.get('exception_type'))
@@ -171,7 +184,7 @@ def seed_calendar_dates(db_session):
     db_session.commit()
     print("Calendar dates seeded.")
 
-def seed_shapes(db_session):
+def seed_shapes(db_session, feed_id=DEFAULT_FEED_ID):
     filepath = os.path.join(DATA_DIR, 'shapes.txt')
     if not os.path.exists(filepath):
         print(f"Fichier {filepath} non trouvé.")
@@ -183,6 +196,7 @@ def seed_shapes(db_session):
         reader = csv.DictReader(f)
         for i, row in enumerate(reader):
             shape_entry = Shape(
+                feed_id=feed_id,
                 shape_id=to_str(row.get('shape_id')),
                 shape_pt_lat=to_float(row.get('shape_pt_lat')),
                 shape_pt_lon=to_float(row.get('shape_pt_lon')),
@@ -202,7 +216,7 @@ def seed_shapes(db_session):
             print(f"Committed {len(shapes_batch)} shapes (final batch).")
     print("Shapes seeded.")
 
-def seed_trips(db_session):
+def seed_trips(db_session, feed_id=DEFAULT_FEED_ID):
     filepath = os.path.join(DATA_DIR, 'trips.txt')
     if not os.path.exists(filepath):
         print(f"Fichier {filepath} non trouvé.")
@@ -212,6 +226,7 @@ def seed_trips(db_session):
         reader = csv.DictReader(f)
         for row in reader:
             trip = Trip(
+                feed_id=feed_id,
                 trip_id=to_str(row.get('trip_id')),
                 route_id=to_str(row.get('route_id')),
                 service_id=to_str(row.get('service_id')),
@@ -227,7 +242,7 @@ def seed_trips(db_session):
     db_session.commit()
     print("Trips seeded.")
 
-def seed_stop_times(db_session):
+def seed_stop_times(db_session, feed_id=DEFAULT_FEED_ID):
     filepath = os.path.join(DATA_DIR, 'stop_times.txt')
     if not os.path.exists(filepath):
         print(f"Fichier {filepath} non trouvé.")
@@ -239,6 +254,7 @@ def seed_stop_times(db_session):
         reader = csv.DictReader(f)
         for i, row in enumerate(reader):
             stop_time = StopTime(
+                feed_id=feed_id,
                 trip_id=to_str(row.get('trip_id')),
                 arrival_time=to_str(row.get('arrival_time')),
                 departure_time=to_str(row.get('departure_time')),
@@ -264,7 +280,7 @@ def seed_stop_times(db_session):
     print("Stop_times seeded.")
 
 # ***** DÉBUT DES FONCTIONS AJOUTÉES/CORRIGÉES *****
-def seed_levels(db_session):
+def seed_levels(db_session, feed_id=DEFAULT_FEED_ID):
     filepath = os.path.join(DATA_DIR, 'levels.txt')
     if not os.path.exists(filepath):
         print(f"Fichier {filepath} non trouvé. Skipping levels seeding.")
@@ -274,6 +290,7 @@ def seed_levels(db_session):
         reader = csv.DictReader(f)
         for row in reader:
             level_entry = Level(
+                feed_id=feed_id,
                 level_id=to_str(row.get('level_id')),
                 level_index=to_float(row.get('level_index')),
                 level_name=to_str(row.get('level_name'))
@@ -282,7 +299,7 @@ def seed_levels(db_session):
     db_session.commit()
     print("Levels seeded.")
 
-def seed_frequencies(db_session):
+def seed_frequencies(db_session, feed_id=DEFAULT_FEED_ID):
     filepath = os.path.join(DATA_DIR, 'frequencies.txt')
     if not os.path.exists(filepath):
         print(f"Fichier {filepath} non trouvé. Skipping frequencies seeding.")
@@ -294,6 +311,7 @@ def seed_frequencies(db_session):
         reader = csv.DictReader(f)
         for i, row in enumerate(reader):
             frequency_entry = Frequency(
+                feed_id=feed_id,
                 trip_id=to_str(row.get('trip_id')),
                 start_time=to_str(row.get('start_time')),
                 end_time=to_str(row.get('end_time')),
@@ -313,7 +331,7 @@ def seed_frequencies(db_session):
             print(f"Committed {len(frequencies_batch)} frequencies (final batch).")
     print("Frequencies seeded.")
 
-def seed_feed_info(db_session):
+def seed_feed_info(db_session, feed_id=DEFAULT_FEED_ID):
     filepath = os.path.join(DATA_DIR, 'feed_info.txt')
     if not os.path.exists(filepath):
         print(f"Fichier {filepath} non trouvé. Skipping feed_info seeding.")
@@ -323,6 +341,7 @@ def seed_feed_info(db_session):
         reader = csv.DictReader(f)
         for row in reader:
             feed_info_entry = FeedInfo(
+                feed_id=feed_id,
                 feed_publisher_name=to_str(row.get('feed_publisher_name')),
                 feed_publisher_url=to_str(row.get('feed_publisher_url')),
                 feed_lang=to_str(row.get('feed_lang')),
@@ -337,7 +356,7 @@ def seed_feed_info(db_session):
     db_session.commit()
     print("Feed_info seeded.")
 
-def seed_pathways(db_session):
+def seed_pathways(db_session, feed_id=DEFAULT_FEED_ID):
     filepath = os.path.join(DATA_DIR, 'pathways.txt')
     if not os.path.exists(filepath):
         print(f"Fichier {filepath} non trouvé. Skipping pathways seeding.")
@@ -347,6 +366,7 @@ def seed_pathways(db_session):
         reader = csv.DictReader(f)
         for row in reader:
             pathway_entry = Pathway(
+                feed_id=feed_id,
                 pathway_id=to_str(row.get('pathway_id')),
                 from_stop_id=to_str(row.get('from_stop_id')),
                 to_stop_id=to_str(row.get('to_stop_id')),
@@ -364,7 +384,7 @@ def seed_pathways(db_session):
     db_session.commit()
     print("Pathways seeded.")
 
-def seed_transfers(db_session):
+def seed_transfers(db_session, feed_id=DEFAULT_FEED_ID):
     filepath = os.path.join(DATA_DIR, 'transfers.txt')
     if not os.path.exists(filepath):
         print(f"Fichier {filepath} non trouvé. Skipping transfers seeding.")
@@ -374,6 +394,7 @@ def seed_transfers(db_session):
         reader = csv.DictReader(f)
         for row in reader:
             transfer_entry = Transfer(
+                feed_id=feed_id,
                 from_stop_id=to_str(row.get('from_stop_id')),
                 to_stop_id=to_str(row.get('to_stop_id')),
                 transfer_type=to_int(row.get('transfer_type')),
@@ -383,7 +404,7 @@ def seed_transfers(db_session):
     db_session.commit()
     print("Transfers seeded.")
 
-def seed_fare_attributes(db_session):
+def seed_fare_attributes(db_session, feed_id=DEFAULT_FEED_ID):
     filepath = os.path.join(DATA_DIR, 'fare_attributes.txt')
     if not os.path.exists(filepath):
         print(f"Fichier {filepath} non trouvé. Skipping fare_attributes seeding.")
@@ -393,6 +414,7 @@ def seed_fare_attributes(db_session):
         reader = csv.DictReader(f)
         for row in reader:
             fare_attribute_entry = FareAttribute(
+                feed_id=feed_id,
                 fare_id=to_str(row.get('fare_id')),
                 price=to_float(row.get('price')),
                 currency_type=to_str(row.get('currency_type')),
@@ -405,7 +427,7 @@ def seed_fare_attributes(db_session):
     db_session.commit()
     print("Fare_attributes seeded.")
 
-def seed_fare_rules(db_session):
+def seed_fare_rules(db_session, feed_id=DEFAULT_FEED_ID):
     filepath = os.path.join(DATA_DIR, 'fare_rules.txt')
     if not os.path.exists(filepath):
         print(f"Fichier {filepath} non trouvé. Skipping fare_rules seeding.")
@@ -413,8 +435,10 @@ def seed_fare_rules(db_session):
     print("Seeding fare_rules...")
     with open(filepath, 'r', encoding='utf-8-sig') as f:
         reader = csv.DictReader(f)
-        for row in reader:
+        for i, row in enumerate(reader, start=1):
             fare_rule_entry = FareRule(
+                feed_id=feed_id,
+                id=i, # Numéro de ligne : fare_rules n'a pas de clé GTFS
                 fare_id=to_str(row.get('fare_id')),
                 route_id=to_str(row.get('route_id')) if row.get('route_id') else None,
                 origin_id=to_str(row.get('origin_id')) if row.get('origin_id') else None,
@@ -427,10 +451,66 @@ def seed_fare_rules(db_session):
 # ***** FIN DES FONCTIONS AJOUTÉES/CORRIGÉES *****
 
 
-def main():
+def seed_feed(db_session, feed_id=DEFAULT_FEED_ID):
+    """Charge tous les fichiers de DATA_DIR dans le flux `feed_id` puis calcule les tables dérivées."""
+    # Ordre de seeding:
+    seed_feed_info(db_session, feed_id)
+    seed_agencies(db_session, feed_id)
+    seed_levels(db_session, feed_id) # Doit être défini
+    seed_stops(db_session, feed_id)
+    seed_calendar(db_session, feed_id)
+    seed_calendar_dates(db_session, feed_id)
+    seed_routes(db_session, feed_id)
+    seed_shapes(db_session, feed_id) # Mis à jour pour utiliser batching
+    
+    seed_fare_attributes(db_session, feed_id) # Doit être défini
+    
+    seed_trips(db_session, feed_id)
+    
+    seed_stop_times(db_session, feed_id) # Mis à jour pour utiliser batching
+    seed_frequencies(db_session, feed_id) # Doit être défini
+    
+    seed_pathways(db_session, feed_id) # Doit être défini
+    seed_transfers(db_session, feed_id) # Doit être défini
+    
+    seed_fare_rules(db_session, feed_id) # Doit être défini
+
+    # Tables dérivées
+    print("Deduplicating shapes...")
+    dedup_shapes(db_session, feed_id)
+    print("Computing shape distances...")
+    build_shape_distances(db_session, feed_id)
+    print("Building trip patterns...")
+    build_patterns(db_session, feed_id)
+    print("Clustering stops into stations...")
+    build_stations(db_session, feed_id)
+    print("Generating walking transfers...")
+    generate_transfers(db_session, feed_id)
+    mark_loaded(db_session, feed_id)
+
+
+def main(argv=None):
+    global DATA_DIR
+    parser = argparse.ArgumentParser(description="Charge un flux GTFS en base.")
+    parser.add_argument("--feed", default=DEFAULT_FEED_ID, help="Identifiant du flux (une partition par flux)")
+    parser.add_argument("--data", default=DATA_DIR, help="Dossier du flux GTFS")
+    args = parser.parse_args(argv)
+    DATA_DIR = args.data
+
+    # Contrôle du flux avant toute écriture : une référence cassée est signalée ici, pas en plein chargement
+    report = validate_feed(DATA_DIR)
+    report.print_summary()
+    if not report.valid:
+        print("Seeding aborted: the feed has errors (run `python validate.py --json report.json` for the full report).")
+        return
+
     db_session = SessionLocal()
     try:
-        print("Starting database seeding...")
+        if db_session.get(Feed, args.feed) is not None:
+            print(f"Seeding aborted: feed {args.feed} already exists (load the new version under another feed id, or run `python feeds.py drop {args.feed}` first).")
+            return
+        create_feed(engine, args.feed)
+        print(f"Starting database seeding (feed {args.feed})...")
 
         # Optionnel: Vider les tables
         # for table in reversed(Base.metadata.sorted_tables):
@@ -439,27 +519,7 @@ def main():
         # db_session.commit()
         # print("All tables cleared.")
 
-        # Ordre de seeding:
-        seed_feed_info(db_session)
-        seed_agencies(db_session)
-        seed_levels(db_session) # Doit être défini
-        seed_stops(db_session)
-        seed_calendar(db_session)
-        seed_calendar_dates(db_session)
-        seed_routes(db_session)
-        seed_shapes(db_session) # Mis à jour pour utiliser batching
-        
-        seed_fare_attributes(db_session) # Doit être défini
-        
-        seed_trips(db_session)
-        
-        seed_stop_times(db_session) # Mis à jour pour utiliser batching
-        seed_frequencies(db_session) # Doit être défini
-        
-        seed_pathways(db_session) # Doit être défini
-        seed_transfers(db_session) # Doit être défini
-        
-        seed_fare_rules(db_session) # Doit être défini
+        seed_feed(db_session, args.feed)
 
         print("Database seeding completed successfully!")
     except Exception as e:
@@ -0,0 +1,105 @@
+# service_calendar.py
+# Calendrier de service compilé : chaque service_id devient un bitset des jours
+# où il circule, sur toute la période de validité du flux. Savoir si un service
+# roule un jour donné se réduit alors à un test de bit, sans comparer de chaînes
+# ni relire calendar/calendar_dates.
+
+from datetime import date, timedelta
+from typing import Dict, Iterable, List
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+import models
+
+WEEKDAY_COLUMNS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+
+def parse_gtfs_date(value: str) -> date:
+    """Convertit une date GTFS 'YYYYMMDD' en objet date."""
+    value = value.strip()
+    return date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+
+
+class ServiceCalendar:
+    """
+    Bitsets de jours actifs par service.
+
+    `bits[s]` contient un bit par jour depuis `start` (ordre des bits "little") :
+    le bit d du service s vaut 1 si le service circule le jour start + d.
+    """
+
+    def __init__(self, service_ids: List[str], start: date, n_days: int, bits: np.ndarray):
+        self.service_ids = service_ids
+        self.service_index: Dict[str, int] = {service_id: i for i, service_id in enumerate(service_ids)}
+        self.start = start
+        self.n_days = n_days
+        self.bits = bits
+
+    # --- Compilation ---
+    @classmethod
+    def compile(cls, calendars: Iterable, calendar_dates: Iterable) -> "ServiceCalendar":
+        """Compile des lignes Calendar / CalendarDate (ORM ou tuples nommés) en bitsets."""
+        calendars = list(calendars)
+        calendar_dates = list(calendar_dates)
+
+        service_ids: List[str] = []
+        index: Dict[str, int] = {}
+        for service_id in [c.service_id for c in calendars] + [cd.service_id for cd in calendar_dates]:
+            if service_id not in index:
+                index[service_id] = len(service_ids)
+                service_ids.append(service_id)
+
+        bounds = [parse_gtfs_date(c.start_date) for c in calendars] + [parse_gtfs_date(c.end_date) for c in calendars]
+        bounds += [parse_gtfs_date(cd.date) for cd in calendar_dates]
+        if not bounds:
+            return cls(service_ids, date.min, 0, np.zeros((len(service_ids), 0), dtype=np.uint8))
+        start, end = min(bounds), max(bounds)
+        n_days = (end - start).days + 1
+
+        active = np.zeros((len(service_ids), n_days), dtype=bool)
+        # Jour de la semaine de chaque jour de la période (0 = lundi)
+        weekdays = (np.arange(n_days) + start.weekday()) % 7
+        for cal in calendars:
+            flags = np.array([bool(getattr(cal, day)) for day in WEEKDAY_COLUMNS])
+            lo = (parse_gtfs_date(cal.start_date) - start).days
+            hi = (parse_gtfs_date(cal.end_date) - start).days + 1
+            active[index[cal.service_id], lo:hi] = flags[weekdays[lo:hi]]
+        for cd in calendar_dates:
+            # exception_type 1 = service ajouté, 2 = service supprimé
+            active[index[cd.service_id], (parse_gtfs_date(cd.date) - start).days] = cd.exception_type == 1
+
+        return cls(service_ids, start, n_days, np.packbits(active, axis=1, bitorder="little"))
+
+    @classmethod
+    def from_db(cls, db: Session, feed_id: str) -> "ServiceCalendar":
+        return cls.compile(
+            db.query(models.Calendar).filter(models.Calendar.feed_id == feed_id).all(),
+            db.query(models.CalendarDate).filter(models.CalendarDate.feed_id == feed_id).all(),
+        )
+
+    @property
+    def end(self) -> date:
+        return self.start + timedelta(days=self.n_days - 1)
+
+    # --- Requêtes ---
+    def _day_offset(self, day: date) -> int:
+        offset = (day - self.start).days
+        return offset if 0 <= offset < self.n_days else -1
+
+    def is_active(self, service_idx: int, day: date) -> bool:
+        offset = self._day_offset(day)
+        if offset < 0 or service_idx < 0:
+            return False
+        return bool((self.bits[service_idx, offset >> 3] >> (offset & 7)) & 1)
+
+    def active_mask(self, day: date) -> np.ndarray:
+        """Tableau booléen indexé par service : True si le service circule ce jour-là."""
+        offset = self._day_offset(day)
+        if offset < 0:
+            return np.zeros(len(self.service_ids), dtype=bool)
+        return ((self.bits[:, offset >> 3] >> (offset & 7)) & 1).astype(bool)
+
+    def active_services(self, day: date) -> List[str]:
+        mask = self.active_mask(day)
+        return [self.service_ids[i] for i in np.flatnonzero(mask)]
@@ -0,0 +1,249 @@
+# shape_dedup.py
+# Déduplication géométrique des tracés. Beaucoup de shape_id décrivent le même couloir
+# (mêmes rues, voies OSM légèrement différentes) et chacun est stocké point par point.
+#
+# 1. Empreinte : coordonnées quantifiées (QUANTUM degrés, ~1 m), points consécutifs
+#    confondus retirés, puis hachées. Deux tracés de même empreinte sont identiques.
+# 2. Les autres ne sont comparés qu'aux tracés canoniques dont le départ tombe dans une
+#    cellule voisine (grille de maille `tolerance`), dont l'arrivée est à moins de
+#    `tolerance` mètres et dont la longueur est proche. Ils sont doublons si leur distance
+#    de Hausdorff (sommets -> polyligne, dans les deux sens) reste sous `tolerance`.
+#
+# Le tracé canonique d'un groupe est celui qui sert le plus de trajets. Les Trip.shape_id
+# (et Pattern.shape_id) des doublons pointent vers lui et leurs points sont supprimés.
+# seed.py l'exécute avant le calcul des distances ; en ligne de commande, les stop_times
+# sont ensuite reprojetés sur les tracés canoniques.
+#
+# Utilisation : python shape_dedup.py [--feed default] [--tolerance 10] [--dry-run] [--json rapport.json]
+
+import argparse
+import hashlib
+import json
+import math
+import os
+from collections import defaultdict
+from typing import Dict, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+import models
+from feeds import DEFAULT_FEED_ID
+from shapes import EARTH_RADIUS, ShapeIndex, _local_xy, build_shape_distances, cumulative_distances, haversine
+
+QUANTUM = 1e-5  # degrés (~1 m) : grille de quantification des empreintes
+LENGTH_TOLERANCE = 0.05  # Écart relatif de longueur admis entre deux doublons
+DEFAULT_TOLERANCE = float(os.getenv("SHAPE_DEDUP_TOLERANCE", "10"))  # mètres (0 : doublons exacts seulement)
+_CHUNK = 1024  # Sommets comparés à la fois (matrices sommets x segments)
+_DELETE_BATCH = 500
+
+
+def fingerprint(lat: np.ndarray, lon: np.ndarray) -> str:
+    """Empreinte d'un tracé : suite de ses coordonnées quantifiées, sans répétitions consécutives."""
+    quantized = np.stack([np.round(lat / QUANTUM), np.round(lon / QUANTUM)], axis=1).astype(np.int64)
+    if len(quantized) > 1:
+        quantized = quantized[np.concatenate(([True], (quantized[1:] != quantized[:-1]).any(axis=1)))]
+    return hashlib.sha1(quantized.tobytes()).hexdigest()
+
+
+def _directed_hausdorff(ax: np.ndarray, ay: np.ndarray, bx: np.ndarray, by: np.ndarray, limit: float) -> float:
+    # Plus grande distance d'un sommet de A à la polyligne B ; s'arrête dès que `limit` est dépassée
+    if len(bx) < 2:
+        return float(np.hypot(ax - bx[0], ay - by[0]).max())
+    sx, sy = bx[:-1], by[:-1]
+    dx, dy = bx[1:] - sx, by[1:] - sy
+    length2 = np.where(dx * dx + dy * dy > 0, dx * dx + dy * dy, 1.0)
+    worst = 0.0
+    for lo in range(0, len(ax), _CHUNK):
+        px, py = ax[lo:lo + _CHUNK, None], ay[lo:lo + _CHUNK, None]
+        t = np.clip(((px - sx) * dx + (py - sy) * dy) / length2, 0.0, 1.0)
+        worst = max(worst, float(np.hypot(px - (sx + t * dx), py - (sy + t * dy)).min(axis=1).max()))
+        if worst > limit:
+            break
+    return worst
+
+
+def hausdorff_distance(a_lat: np.ndarray, a_lon: np.ndarray, b_lat: np.ndarray, b_lon: np.ndarray,
+                       limit: float = math.inf) -> float:
+    """
+    Distance de Hausdorff (mètres) entre deux tracés, chaque sommet étant comparé à
+    l'autre polyligne. Au-delà de `limit`, la valeur retournée est seulement > limit.
+    """
+    lat0 = float(np.mean(a_lat))
+    ax, ay = _local_xy(a_lat, a_lon, lat0)
+    bx, by = _local_xy(b_lat, b_lon, lat0)
+    forward = _directed_hausdorff(ax, ay, bx, by, limit)
+    if forward > limit:
+        return forward
+    return max(forward, _directed_hausdorff(bx, by, ax, ay, limit))
+
+
+def _cell(lat: float, lon: float, size: float) -> Tuple[int, int]:
+    y = math.radians(lat) * EARTH_RADIUS
+    x = math.radians(lon) * math.cos(math.radians(lat)) * EARTH_RADIUS
+    return int(x // size), int(y // size)
+
+
+def find_duplicates(shapes: ShapeIndex, trip_counts: Dict[str, int], tolerance: float) -> Tuple[Dict[str, str], int]:
+    """
+    Associe chaque tracé doublon à son tracé canonique. Retourne (doublon -> canonique,
+    nombre de doublons exacts). Les tracés sont parcourus du plus utilisé au moins utilisé.
+    """
+    lengths = np.zeros(len(shapes.shape_ids))
+    if len(shapes.lat):
+        dist = cumulative_distances(shapes.shape_start, shapes.lat, shapes.lon)
+        lengths = dist[shapes.shape_start[1:] - 1]
+
+    order = sorted(range(len(shapes.shape_ids)), key=lambda i: (-trip_counts.get(shapes.shape_ids[i], 0), shapes.shape_ids[i]))
+    by_fingerprint: Dict[str, str] = {}
+    grid: Dict[Tuple[int, int], list] = defaultdict(list)  # Cellule du point de départ -> tracés canoniques
+    mapping: Dict[str, str] = {}
+    exact = 0
+    for i in order:
+        shape_id = shapes.shape_ids[i]
+        lat, lon, _ = shapes.points(shape_id)
+        key = fingerprint(lat, lon)
+        if key in by_fingerprint:
+            mapping[shape_id] = by_fingerprint[key]
+            exact += 1
+            continue
+
+        canonical = None
+        if tolerance > 0:
+            cx, cy = _cell(lat[0], lon[0], tolerance)
+            candidates = (j for ox in (-1, 0, 1) for oy in (-1, 0, 1) for j in grid.get((cx + ox, cy + oy), ()))
+            for j in candidates:
+                other_lat, other_lon, _ = shapes.points(shapes.shape_ids[j])
+                if abs(lengths[i] - lengths[j]) > LENGTH_TOLERANCE * max(lengths[i], lengths[j]) + tolerance:
+                    continue
+                ends = haversine([lat[0], lat[-1]], [lon[0], lon[-1]], [other_lat[0], other_lat[-1]], [other_lon[0], other_lon[-1]])
+                if ends.max() > tolerance:
+                    continue
+                if hausdorff_distance(lat, lon, other_lat, other_lon, limit=tolerance) <= tolerance:
+                    canonical = j
+                    break
+        if canonical is not None:
+            mapping[shape_id] = shapes.shape_ids[canonical]
+            continue
+        by_fingerprint[key] = shape_id
+        if tolerance > 0:
+            grid[_cell(lat[0], lon[0], tolerance)].append(i)
+    return mapping, exact
+
+
+def _savings(shapes: ShapeIndex, mapping: Dict[str, str], exact: int, trips_remapped: int) -> dict:
+    # Stockage : lignes de shapes et leur taille dans shapes.txt ; charge utile : GeoJSON des tracés
+    points_total = len(shapes.lat)
+    points_removed = csv_bytes = geojson_bytes = 0
+    for shape_id in mapping:
+        idx = shapes.shape_index[shape_id]
+        lo, hi = shapes.shape_start[idx], shapes.shape_start[idx + 1]
+        lat, lon, dist, sequence = shapes.lat[lo:hi], shapes.lon[lo:hi], shapes.dist[lo:hi], shapes.sequence[lo:hi]
+        points_removed += hi - lo
+        csv_bytes += sum(
+            len(f"{shape_id},{a:.6f},{o:.6f},{s},{d:.2f}\n")
+            for a, o, s, d in zip(lat.tolist(), lon.tolist(), sequence.tolist(), dist.tolist())
+        )
+        geojson_bytes += len(json.dumps(
+            {"type": "LineString", "coordinates": [[o, a] for a, o in zip(lat.tolist(), lon.tolist())]},
+            separators=(",", ":"),
+        ))
+    return {
+        "shapes": len(shapes.shape_ids),
+        "canonical_shapes": len(shapes.shape_ids) - len(mapping),
+        "exact_duplicates": exact,
+        "near_duplicates": len(mapping) - exact,
+        "trips_remapped": trips_remapped,
+        "points_total": points_total,
+        "points_removed": int(points_removed),
+        "shapes_txt_bytes_saved": csv_bytes,
+        "geojson_bytes_saved": geojson_bytes,
+        "mapping": mapping,
+    }
+
+
+def dedup_shapes(db: Session, feed_id: str = DEFAULT_FEED_ID, tolerance: float = DEFAULT_TOLERANCE,
+                 apply: bool = True) -> dict:
+    """
+    Regroupe les tracés identiques ou quasi identiques d'un flux et, si `apply`, fait pointer
+    les trajets et patterns vers le tracé canonique puis supprime les doublons. Retourne le rapport.
+    """
+    shapes = ShapeIndex.from_db(db, feed_id)
+    trips = db.query(models.Trip.trip_id, models.Trip.shape_id).filter(
+        models.Trip.feed_id == feed_id, models.Trip.shape_id.isnot(None)
+    ).all()
+    trip_counts: Dict[str, int] = defaultdict(int)
+    for trip in trips:
+        trip_counts[trip.shape_id] += 1
+
+    mapping, exact = find_duplicates(shapes, trip_counts, tolerance)
+    remapped = [
+        {"feed_id": feed_id, "trip_id": trip.trip_id, "shape_id": mapping[trip.shape_id]}
+        for trip in trips if trip.shape_id in mapping
+    ]
+    report = _savings(shapes, mapping, exact, len(remapped))
+
+    if apply and mapping:
+        db.bulk_update_mappings(models.Trip, remapped)
+        db.bulk_update_mappings(models.Pattern, [
+            {"feed_id": feed_id, "pattern_id": pattern.pattern_id, "shape_id": mapping[pattern.shape_id]}
+            for pattern in db.query(models.Pattern.pattern_id, models.Pattern.shape_id).filter(models.Pattern.feed_id == feed_id)
+            if pattern.shape_id in mapping
+        ])
+        duplicates = list(mapping)
+        for lo in range(0, len(duplicates), _DELETE_BATCH):
+            db.query(models.Shape).filter(
+                models.Shape.feed_id == feed_id, models.Shape.shape_id.in_(duplicates[lo:lo + _DELETE_BATCH])
+            ).delete(synchronize_session=False)
+        db.commit()
+    print_summary(report)
+    return report
+
+
+def print_summary(report: dict) -> None:
+    points_total = report["points_total"] or 1
+    print(
+        f"{report['shapes']} shapes, {report['canonical_shapes']} canonical "
+        f"({report['exact_duplicates']} exact and {report['near_duplicates']} near duplicates, "
+        f"{report['trips_remapped']} trips remapped)."
+    )
+    print(
+        f"Saved {report['points_removed']} shape points ({100 * report['points_removed'] / points_total:.1f} %), "
+        f"{report['shapes_txt_bytes_saved'] / 1024:.0f} KB of shapes.txt, "
+        f"{report['geojson_bytes_saved'] / 1024:.0f} KB of GeoJSON."
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regroupe les tracés identiques ou quasi identiques d'un flux.")
+    parser.add_argument("--feed", default=DEFAULT_FEED_ID, help="Flux à traiter")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Distance de Hausdorff maximale entre doublons, en mètres (0 : doublons exacts seulement)")
+    parser.add_argument("--dry-run", action="store_true", help="Affiche le rapport sans modifier la base")
+    parser.add_argument("--json", help="Écrit le rapport (avec la table doublon -> canonique) dans ce fichier JSON")
+    args = parser.parse_args()
+
+    from db import SessionLocal
+    db_session = SessionLocal()
+    try:
+        print("Deduplicating shapes...")
+        report = dedup_shapes(db_session, args.feed, tolerance=args.tolerance, apply=not args.dry_run)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        if report["mapping"] and not args.dry_run:
+            # Distances des stop_times reprojetées sur les tracés canoniques
+            print("Computing shape distances...")
+            build_shape_distances(db_session, args.feed)
+        print("Shapes deduplicated.")
+    except Exception as e:
+        db_session.rollback()
+        print(f"An error occurred while deduplicating shapes: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        db_session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+# shapes.py
+# Référencement linéaire le long des tracés (shapes) : distance cumulée de chaque point
+# de tracé, projection des arrêts de chaque trajet sur son tracé (remplit
+# StopTime.shape_dist_traveled) et découpe du tracé entre deux arrêts.
+#
+# Notre shapes.txt n'a pas de colonne shape_dist_traveled (seed_shapes la met à 0) :
+# elle est alors calculée en mètres (haversine). Si le flux fournit ses propres
+# distances, elles sont conservées et les arrêts sont projetés dans la même unité.
+#
+# Sous PostgreSQL, les distances calculées sont chargées par COPY dans une table temporaire
+# puis appliquées par un seul UPDATE ... FROM par table, au lieu d'un UPDATE par ligne.
+#
+# Utilisation : python shapes.py [--feed <feed_id>]  (après le chargement des shapes et stop_times, cf. seed.py)
+
+import argparse
+import csv
+import io
+from itertools import groupby
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+import models
+from feeds import DEFAULT_FEED_ID
+
+EARTH_RADIUS = 6371000.0
+SNAP_TOLERANCE = 25.0  # mètres : parmi les segments presque aussi proches, on retient le premier
+
+
+def haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Distance en mètres entre deux séries de points (degrés)."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def cumulative_distances(shape_start: np.ndarray, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """
+    Distance cumulée (mètres) de chaque point, pour tous les tracés à la fois.
+    Les points sont triés par (shape_id, shape_pt_sequence) ; `shape_start` (CSR, taille
+    nb_tracés + 1) donne le premier point de chaque tracé.
+    """
+    step = np.zeros(len(lat))
+    step[1:] = haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    step[shape_start[:-1]] = 0.0  # Pas de distance entre le dernier point d'un tracé et le premier du suivant
+    cumulative = np.cumsum(step)
+    return cumulative - np.repeat(cumulative[shape_start[:-1]], np.diff(shape_start))
+
+
+def _local_xy(lat: np.ndarray, lon: np.ndarray, lat0: float) -> Tuple[np.ndarray, np.ndarray]:
+    # Projection équirectangulaire locale (mètres), suffisante à l'échelle d'un tracé
+    x = np.radians(lon) * np.cos(np.radians(lat0)) * EARTH_RADIUS
+    y = np.radians(lat) * EARTH_RADIUS
+    return x, y
+
+
+def project_stops(
+    shape_lat: np.ndarray,
+    shape_lon: np.ndarray,
+    shape_dist: np.ndarray,
+    stop_lat: np.ndarray,
+    stop_lon: np.ndarray,
+) -> np.ndarray:
+    """
+    Distance le long du tracé de chaque arrêt d'un trajet, dans l'unité de `shape_dist`.
+    Les distances sont croissantes : un arrêt est projeté au plus près sur la partie du
+    tracé située après l'arrêt précédent (tracés en boucle, allers-retours superposés).
+    """
+    n_stops = len(stop_lat)
+    if len(shape_lat) < 2:
+        return np.zeros(n_stops)
+    lat0 = float(np.mean(shape_lat))
+    px, py = _local_xy(shape_lat, shape_lon, lat0)
+    sx, sy = _local_xy(np.asarray(stop_lat, dtype=np.float64), np.asarray(stop_lon, dtype=np.float64), lat0)
+
+    # Projection de chaque arrêt sur chaque segment : matrices (arrêts x segments)
+    ax, ay = px[:-1], py[:-1]
+    dx, dy = px[1:] - ax, py[1:] - ay
+    length2 = dx * dx + dy * dy
+    t = ((sx[:, None] - ax) * dx + (sy[:, None] - ay) * dy) / np.where(length2 > 0, length2, 1.0)
+    t = np.clip(t, 0.0, 1.0)
+    offset = np.hypot(sx[:, None] - (ax + t * dx), sy[:, None] - (ay + t * dy))
+    along = shape_dist[:-1] + t * (shape_dist[1:] - shape_dist[:-1])
+
+    result = np.empty(n_stops)
+    previous = shape_dist[0]
+    for i in range(n_stops):
+        candidates = np.where(along[i] >= previous, offset[i], np.inf)
+        best = candidates.min()
+        if not np.isfinite(best):
+            result[i] = previous  # Arrêt déjà dépassé (tracé incohérent) : on reste sur place
+            continue
+        segment = int(np.argmax(candidates <= best + SNAP_TOLERANCE))
+        previous = result[i] = along[i, segment]
+    return result
+
+
+def cut_shape(
+    shape_lat: np.ndarray,
+    shape_lon: np.ndarray,
+    shape_dist: np.ndarray,
+    start: float,
+    end: float,
+) -> List[List[float]]:
+    """Portion du tracé entre deux distances, en coordonnées GeoJSON [lon, lat]."""
+    if len(shape_lat) == 0:
+        return []
+    start, end = min(start, end), max(start, end)
+    inner = np.flatnonzero((shape_dist > start) & (shape_dist < end))
+    ends = np.array([start, end])
+    lat = np.interp(ends, shape_dist, shape_lat)
+    lon = np.interp(ends, shape_dist, shape_lon)
+    coords = [[float(lon[0]), float(lat[0])]]
+    coords.extend([float(shape_lon[k]), float(shape_lat[k])] for k in inner)
+    coords.append([float(lon[1]), float(lat[1])])
+    return coords
+
+
+def trip_segments(stop_times: list, stops: Dict[str, "models.Stop"], points: Optional[tuple]) -> List[dict]:
+    """
+    Géométrie de chaque inter-arrêt d'un trajet. `stop_times` est ordonné par stop_sequence ;
+    `points` vient de ShapeIndex.points (None si le trajet n'a pas de tracé : segments droits).
+    Les arrêts sans coordonnées sont ignorés : le segment relie les arrêts localisés voisins.
+    """
+    stop_times = [
+        st for st in stop_times
+        if st.stop_id in stops and stops[st.stop_id].stop_lat is not None and stops[st.stop_id].stop_lon is not None
+    ]
+    if points is not None:
+        dist = np.array([st.shape_dist_traveled if st.shape_dist_traveled is not None else np.nan for st in stop_times])
+        if np.isnan(dist).any():
+            # stop_times pas encore projetés (shapes.py non exécuté) : projection à la volée
+            coords = np.array([(stops[st.stop_id].stop_lat, stops[st.stop_id].stop_lon) for st in stop_times], dtype=np.float64).reshape(-1, 2)
+            dist = project_stops(*points, coords[:, 0], coords[:, 1])
+
+    segments = []
+    for k, (origin, destination) in enumerate(zip(stop_times, stop_times[1:])):
+        if points is not None:
+            coords = cut_shape(*points, dist[k], dist[k + 1])
+        else:
+            coords = [
+                [stops[st.stop_id].stop_lon, stops[st.stop_id].stop_lat] for st in (origin, destination)
+            ]
+        line = np.array(coords)
+        segments.append({
+            "from_stop_id": origin.stop_id,
+            "to_stop_id": destination.stop_id,
+            "from_stop_sequence": origin.stop_sequence,
+            "to_stop_sequence": destination.stop_sequence,
+            "departure_time": origin.departure_time,
+            "arrival_time": destination.arrival_time,
+            "distance": float(haversine(line[:-1, 1], line[:-1, 0], line[1:, 1], line[1:, 0]).sum()),
+            "geometry": {"type": "LineString", "coordinates": coords},
+        })
+    return segments
+
+
+class ShapeIndex:
+    """Points de tous les tracés en tableaux CSR, avec leurs distances cumulées."""
+
+    def __init__(self, shape_ids: List[str], shape_start: np.ndarray, lat: np.ndarray, lon: np.ndarray,
+                 sequence: np.ndarray, dist: np.ndarray):
+        self.shape_ids = shape_ids
+        self.shape_index = {shape_id: i for i, shape_id in enumerate(shape_ids)}
+        self.shape_start = shape_start
+        self.lat = lat
+        self.lon = lon
+        self.sequence = sequence
+        self.dist = dist
+
+    @classmethod
+    def from_db(cls, db: Session, feed_id: str = DEFAULT_FEED_ID, shape_id: Optional[str] = None) -> "ShapeIndex":
+        query = db.query(
+            models.Shape.shape_id,
+            models.Shape.shape_pt_sequence,
+            models.Shape.shape_pt_lat,
+            models.Shape.shape_pt_lon,
+            models.Shape.shape_dist_traveled,
+        ).filter(models.Shape.feed_id == feed_id)
+        if shape_id is not None:
+            query = query.filter(models.Shape.shape_id == shape_id)
+        rows = query.order_by(models.Shape.shape_id, models.Shape.shape_pt_sequence).all()
+
+        keys = [row.shape_id for row in rows]
+        shape_ids = list(dict.fromkeys(keys))
+        starts = [0]
+        for _, group in groupby(keys):
+            starts.append(starts[-1] + sum(1 for _ in group))
+        shape_start = np.array(starts, dtype=np.int64)
+        lat = np.array([row.shape_pt_lat for row in rows], dtype=np.float64)
+        lon = np.array([row.shape_pt_lon for row in rows], dtype=np.float64)
+        sequence = np.array([row.shape_pt_sequence for row in rows], dtype=np.int64)
+        provided = np.array([row.shape_dist_traveled or 0.0 for row in rows], dtype=np.float64)
+
+        # Distances du flux conservées pour les tracés qui en ont, haversine pour les autres
+        dist = cumulative_distances(shape_start, lat, lon)
+        if len(rows):
+            has_provided = np.maximum.reduceat(provided, shape_start[:-1]) > 0
+            use_provided = np.repeat(has_provided, np.diff(shape_start))
+            dist = np.where(use_provided, provided, dist)
+        return cls(shape_ids, shape_start, lat, lon, sequence, dist)
+
+    def points(self, shape_id: str) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """(lat, lon, distance) des points d'un tracé, ou None s'il est inconnu."""
+        idx = self.shape_index.get(shape_id)
+        if idx is None:
+            return None
+        lo, hi = self.shape_start[idx], self.shape_start[idx + 1]
+        return self.lat[lo:hi], self.lon[lo:hi], self.dist[lo:hi]
+
+
+def _update_distances(db: Session, model: type, key_columns: Tuple[str, str], feed_id: str, rows: List[tuple]) -> None:
+    """
+    Écrit shape_dist_traveled des lignes (clé1, clé2, distance) d'un flux. PostgreSQL : COPY
+    vers une table temporaire puis un seul UPDATE ... FROM ; autres bases : UPDATE par lot.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        db.bulk_update_mappings(model, [
+            {"feed_id": feed_id, key_columns[0]: key, key_columns[1]: sequence, "shape_dist_traveled": dist}
+            for key, sequence, dist in rows
+        ])
+        return
+
+    table = model.__table__.name
+    staging = f"{table}_dist_staging"
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    buffer.seek(0)
+    # Curseur DBAPI de la connexion de la session : même transaction que le reste du calcul
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(
+            f"CREATE TEMP TABLE {staging} ({key_columns[0]} text, {key_columns[1]} integer, "
+            "shape_dist_traveled double precision) ON COMMIT DROP"
+        )
+        cursor.copy_expert(f"COPY {staging} FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute(
+            f"UPDATE {table} AS t SET shape_dist_traveled = s.shape_dist_traveled FROM {staging} AS s "
+            f"WHERE t.feed_id = %s AND t.{key_columns[0]} = s.{key_columns[0]} AND t.{key_columns[1]} = s.{key_columns[1]}",
+            (feed_id,),
+        )
+    finally:
+        cursor.close()
+
+
+def build_shape_distances(db: Session, feed_id: str = DEFAULT_FEED_ID) -> int:
+    """
+    Remplit shapes.shape_dist_traveled (mètres, si le flux ne le fournit pas) puis
+    stop_times.shape_dist_traveled. Retourne le nombre d'horaires d'arrêt renseignés.
+    """
+    shapes = ShapeIndex.from_db(db, feed_id)
+    _update_distances(db, models.Shape, ("shape_id", "shape_pt_sequence"), feed_id, list(zip(
+        np.repeat(shapes.shape_ids, np.diff(shapes.shape_start)).tolist(),
+        shapes.sequence.tolist(),
+        shapes.dist.tolist(),
+    )))
+
+    # Arrêts sans coordonnées exclus : les trajets qui les desservent ne sont pas projetés
+    stops = {
+        s.stop_id: (s.stop_lat, s.stop_lon)
+        for s in db.query(models.Stop.stop_id, models.Stop.stop_lat, models.Stop.stop_lon).filter(models.Stop.feed_id == feed_id)
+        if s.stop_lat is not None and s.stop_lon is not None
+    }
+    trip_shapes = {t.trip_id: t.shape_id for t in db.query(models.Trip.trip_id, models.Trip.shape_id).filter(models.Trip.feed_id == feed_id)}
+    stop_times = (
+        db.query(models.StopTime.trip_id, models.StopTime.stop_sequence, models.StopTime.stop_id)
+        .filter(models.StopTime.feed_id == feed_id)
+        .order_by(models.StopTime.trip_id, models.StopTime.stop_sequence)
+        .yield_per(50000)
+    )
+
+    # Les trajets qui partagent tracé et suite d'arrêts ne sont projetés qu'une fois
+    projections: Dict[tuple, np.ndarray] = {}
+    updates = []
+    for trip_id, rows in groupby(stop_times, key=lambda row: row.trip_id):
+        rows = list(rows)
+        points = shapes.points(trip_shapes.get(trip_id))
+        stop_ids = tuple(row.stop_id for row in rows)
+        if points is None or any(stop_id not in stops for stop_id in stop_ids):
+            continue
+        key = (trip_shapes[trip_id], stop_ids)
+        if key not in projections:
+            coords = np.array([stops[stop_id] for stop_id in stop_ids], dtype=np.float64)
+            projections[key] = project_stops(*points, coords[:, 0], coords[:, 1])
+        updates.extend((trip_id, row.stop_sequence, dist) for row, dist in zip(rows, projections[key].tolist()))
+
+    _update_distances(db, models.StopTime, ("trip_id", "stop_sequence"), feed_id, updates)
+    db.commit()
+    print(f"{len(shapes.shape_ids)} shapes, {len(updates)} stop_times projected ({len(projections)} distinct projections).")
+    return len(updates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calcule les distances le long des tracés et projette les arrêts.")
+    parser.add_argument("--feed", default=DEFAULT_FEED_ID, help="Flux à traiter")
+    args = parser.parse_args()
+
+    from db import SessionLocal
+    db_session = SessionLocal()
+    try:
+        print("Computing shape distances...")
+        build_shape_distances(db_session, args.feed)
+        print("Shape distances computed.")
+    except Exception as e:
+        db_session.rollback()
+        print(f"An error occurred while computing shape distances: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        db_session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# singleflight.py
+# Regroupement des requêtes identiques simultanées ("single-flight"). Quand des centaines
+# de clients demandent la même ressource au même moment (après un déploiement ou un
+# vidage de cache), seule la première requête exécute le handler et ses requêtes SQL ;
+# les suivantes attendent sa réponse et en reçoivent une copie.
+#
+# Deux requêtes sont identiques si elles ont la même méthode, le même chemin, les mêmes
+# paramètres (triés) et le même Accept-Encoding. Seuls les GET sont regroupés ; les
+# handlers qui diffusent un flux (SSE...) sont marqués avec @exempt.
+
+import asyncio
+from typing import Callable, Dict, List
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from http_cache import resolve_endpoint
+
+
+def exempt(func: Callable) -> Callable:
+    """Marque un handler dont les réponses ne doivent pas être partagées (flux, effets de bord)."""
+    func.no_coalesce = True
+    return func
+
+
+# Requêtes en cours (clé -> réponse à venir) et compteurs, pour tout le processus
+_in_flight: Dict[tuple, asyncio.Future] = {}
+_counters = {
+    "leaders": 0,  # Requêtes réellement exécutées
+    "coalesced": 0,  # Requêtes servies par la réponse d'une autre
+    "fallbacks": 0,  # Requêtes ré-exécutées après l'échec de celle qu'elles attendaient
+}
+
+
+def get_stats() -> Dict[str, int]:
+    return {"in_flight": len(_in_flight), **_counters}
+
+
+def _key(scope: Scope) -> tuple:
+    query = urlencode(sorted(parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)))
+    return (scope["method"], scope["path"], query, Headers(scope=scope).get("accept-encoding", ""))
+
+
+class SingleFlightMiddleware:
+    """Middleware ASGI : une seule exécution en cours par requête GET identique."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+        endpoint = resolve_endpoint(scope)
+        if endpoint is None or getattr(endpoint, "no_coalesce", False):
+            await self.app(scope, receive, send)
+            return
+
+        key = _key(scope)
+        pending = _in_flight.get(key)
+        if pending is not None:
+            try:
+                messages = await asyncio.shield(pending)
+            except Exception:
+                # La requête attendue a échoué (ou son client est parti) : on exécute la nôtre
+                _counters["fallbacks"] += 1
+                await self.app(scope, receive, send)
+                return
+            _counters["coalesced"] += 1
+            for message in messages:
+                await send({**message, "headers": list(message["headers"])} if "headers" in message else message)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        _in_flight[key] = future
+        _counters["leaders"] += 1
+        messages: List[Message] = []
+
+        async def send_and_record(message: Message) -> None:
+            # Copie des en-têtes avant que les middlewares extérieurs ne les modifient
+            messages.append({**message, "headers": list(message["headers"])} if "headers" in message else message)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        except BaseException as exc:
+            future.set_exception(exc if isinstance(exc, Exception) else RuntimeError("request cancelled"))
+            future.exception()  # Marque l'exception comme lue, même sans requête en attente
+            raise
+        else:
+            future.set_result(messages)
+        finally:
+            del _in_flight[key]
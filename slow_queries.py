@@ -0,0 +1,154 @@
+# slow_queries.py
+# Enregistreur des requêtes SQL lentes (opt-in). Toute requête qui dépasse SLOW_QUERY_MS
+# est journalisée avec ses paramètres et la route HTTP qui l'a déclenchée, puis le plan
+# des lectures (SELECT, WITH) est capturé en arrière-plan : EXPLAIN sur PostgreSQL, EXPLAIN
+# QUERY PLAN sur SQLite. Un simple EXPLAIN n'exécute pas la requête ; EXPLAIN (ANALYZE,
+# BUFFERS), qui la rejoue, est opt-in et réservé aux requêtes servies par un réplica : le
+# primaire ne rejoue jamais une requête déjà lente. Les dernières captures sont gardées
+# dans un tampon circulaire lu par GET /debug/slow-queries.
+#
+# Variables d'environnement :
+#   SLOW_QUERY_MS       seuil en millisecondes ; non défini = enregistreur désactivé
+#   SLOW_QUERY_BUFFER   nombre de captures conservées (défaut 100)
+#   SLOW_QUERY_ANALYZE  "1" : EXPLAIN (ANALYZE, BUFFERS) pour les requêtes lentes des réplicas
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from metrics import current_endpoint
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = os.getenv("SLOW_QUERY_MS")
+BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER", "100"))
+ANALYZE = os.getenv("SLOW_QUERY_ANALYZE", "") == "1"
+EXPLAINABLE = ("SELECT", "WITH")  # Lectures dont le plan est capturé
+MAX_PENDING_PLANS = 10  # Au-delà, les plans des nouvelles requêtes lentes ne sont pas capturés
+MAX_PARAMETER_LENGTH = 200
+
+_buffer: deque = deque(maxlen=BUFFER_SIZE)
+_lock = threading.Lock()
+# Un seul thread pour les EXPLAIN : la capture ne doit pas charger la base à son tour
+_explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-explain")
+_pending = 0
+_threshold: Optional[float] = None  # secondes
+
+
+def _short(value: Any) -> Any:
+    text = repr(value)
+    return value if len(text) <= MAX_PARAMETER_LENGTH else text[:MAX_PARAMETER_LENGTH] + "..."
+
+
+def _format_parameters(parameters: Any) -> Any:
+    if isinstance(parameters, dict):
+        return {key: _short(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_short(value) for value in parameters]
+    return _short(parameters)
+
+
+def _explain_prefix(engine: Engine) -> str:
+    if engine.dialect.name != "postgresql":
+        return "EXPLAIN QUERY PLAN "
+    from db import replica_router
+    if ANALYZE and any(engine is replica for replica in replica_router.replicas):
+        return "EXPLAIN (ANALYZE, BUFFERS) "
+    return "EXPLAIN "
+
+
+def _explain(engine: Engine, statement: str, parameters: Any, entry: dict) -> None:
+    global _pending
+    try:
+        prefix = _explain_prefix(engine)
+        raw = engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            cursor.execute(prefix + statement, parameters)
+            plan = "\n".join(" ".join(str(column) for column in row) for row in cursor.fetchall())
+            cursor.close()
+            raw.rollback()  # EXPLAIN ANALYZE exécute la requête : rien ne doit rester ouvert
+        finally:
+            raw.close()
+    except Exception as exc:
+        plan = f"EXPLAIN failed: {exc}"
+    with _lock:
+        entry["plan"] = plan
+        _pending -= 1
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("slow_query_start", []).append(time.perf_counter())
+
+
+def _handle_error(context) -> None:
+    # Requête en échec : after_cursor_execute ne sera pas appelé, son départ est retiré ici
+    starts = context.connection.info.get("slow_query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    global _pending
+    starts = conn.info.get("slow_query_start")
+    if not starts:
+        return
+    duration = time.perf_counter() - starts.pop()
+    if duration < _threshold:
+        return
+
+    entry = {
+        "recorded_at": datetime.now(timezone.utc),
+        "duration_ms": round(duration * 1000, 3),
+        "endpoint": current_endpoint(),
+        "statement": statement,
+        "parameters": _format_parameters(parameters),
+        "plan": None,
+    }
+    logger.warning(
+        "Slow query (%.1f ms) from %s: %s -- parameters: %s",
+        entry["duration_ms"], entry["endpoint"] or "<no request>", " ".join(statement.split()), entry["parameters"],
+    )
+    # Plans des lectures seulement (EXPLAIN ANALYZE rejoue la requête)
+    explainable = not executemany and statement.lstrip().upper().startswith(EXPLAINABLE)
+    with _lock:
+        _buffer.append(entry)
+        if explainable and _pending < MAX_PENDING_PLANS:
+            _pending += 1
+        else:
+            explainable = False
+    if explainable:
+        _explainer.submit(_explain, conn.engine, statement, parameters, entry)
+
+
+def enable(threshold_ms: float) -> None:
+    """Active l'enregistreur sur tous les moteurs (primaire et réplicas)."""
+    global _threshold
+    if _threshold is None:
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+    _threshold = threshold_ms / 1000
+
+
+def threshold_ms() -> Optional[float]:
+    """Seuil courant, None si l'enregistreur est désactivé."""
+    return _threshold * 1000 if _threshold is not None else None
+
+
+def get_slow_queries() -> List[Dict[str, Any]]:
+    """Captures les plus récentes d'abord."""
+    with _lock:
+        return [dict(entry) for entry in reversed(_buffer)]
+
+
+if SLOW_QUERY_MS:
+    enable(float(SLOW_QUERY_MS))
@@ -0,0 +1,282 @@
+# snapshots.py
+# Instantanés statiques de l'API, précompressés, par version du flux. Entre deux
+# rechargements, les listes et fiches (agences, arrêts, routes, trajets) ne changent pas :
+# elles sont rendues une fois en JSON, identique octet pour octet à la réponse de l'API,
+# puis écrites avec leurs versions gzip et brotli dans une arborescence calquée sur les URL :
+#
+#   <racine>/<version>/routes/index.json(.gz|.br)          ->  GET /routes/
+#   <racine>/<version>/routes/index.skip=100.json           ->  GET /routes/?skip=100&limit=100
+#   <racine>/<version>/routes/<route_id>/trips/index.json   ->  GET /routes/<route_id>/trips/
+#   <racine>/current                                        ->  lien vers la dernière version
+#
+# Les listes paginées sont exportées en entier, une page de PAGE_SIZE éléments par fichier
+# (la taille de page par défaut de l'API). Les identifiants sont encodés comme dans une URL
+# (quote) : un stop_id contenant "/" reste un seul dossier. Le dossier de version porte la
+# version vue par l'API (query_cache.feed_version, "feed_id:feed_version" de chaque flux).
+#
+# nginx ou le CDN peuvent servir ces fichiers directement (try_files $uri/index.json avec
+# gzip_static / brotli_static). L'application les sert aussi elle-même quand SNAPSHOT_DIR
+# est défini (SnapshotMiddleware), pour les GET sans paramètres ou avec skip/limit d'une page.
+#
+# Utilisation : python snapshots.py --out /var/www/gtfs
+
+import argparse
+import gzip
+import os
+import shutil
+from itertools import groupby
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qsl, quote
+
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+import crud
+import models
+import query_cache
+import schemas
+from feeds import DEFAULT_FEED_ID
+from http_cache import accepted_encodings, extra_version, resolve_route
+
+try:
+    import brotli
+except ImportError:  # Dépendance optionnelle : sans elle, seuls les fichiers gzip sont produits
+    brotli = None
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR")
+INDEX_FILE = "index.json"
+PAGE_SIZE = 100  # limit par défaut des listes de l'API
+
+_adapters: Dict[Any, TypeAdapter] = {}
+
+
+def render(response_model: Any, value: Any) -> bytes:
+    """JSON compact du résultat, tel que FastAPI le produit avec le même response_model."""
+    adapter = _adapters.get(response_model)
+    if adapter is None:
+        adapter = _adapters[response_model] = TypeAdapter(response_model)
+    return adapter.dump_json(adapter.validate_python(value, from_attributes=True), by_alias=True)
+
+
+def version_dirname(version: str) -> str:
+    # Un feed_version peut contenir des caractères interdits dans un nom de dossier
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in version) or "_"
+
+
+def page_file(skip: int) -> str:
+    """Fichier de la page commençant à `skip` (la première page est celle sans paramètres)."""
+    return INDEX_FILE if skip == 0 else f"index.skip={skip}.json"
+
+
+def query_page_file(query_string: str) -> Optional[str]:
+    """
+    Fichier de la page demandée par les paramètres d'un GET : aucun, ou skip/limit d'une
+    page exportée (limit = PAGE_SIZE, skip multiple de PAGE_SIZE). None sinon.
+    """
+    params = dict(parse_qsl(query_string, keep_blank_values=True))
+    if set(params) - {"skip", "limit"}:
+        return None
+    try:
+        skip, limit = int(params.get("skip", 0)), int(params.get("limit", PAGE_SIZE))
+    except ValueError:
+        return None
+    if limit != PAGE_SIZE or skip < 0 or skip % PAGE_SIZE:
+        return None
+    return page_file(skip)
+
+
+def url_segment(value: Any) -> str:
+    """Identifiant encodé comme un seul segment d'URL ("/" compris)."""
+    return quote(str(value), safe="")
+
+
+class SnapshotWriter:
+    """Écrit chaque réponse rendue en index.json, index.json.gz et index.json.br."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.files = 0
+        self.raw_bytes = 0
+        self.gzip_bytes = 0
+        self.brotli_bytes = 0
+
+    def write(self, url_path: str, body: bytes, name: str = INDEX_FILE) -> None:
+        directory = os.path.join(self.root, *[part for part in url_path.split("/") if part])
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, name)
+        with open(path, "wb") as f:
+            f.write(body)
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+        with open(path + ".gz", "wb") as f:
+            f.write(compressed)
+        self.gzip_bytes += len(compressed)
+        if brotli is not None:
+            compressed = brotli.compress(body, quality=11)
+            with open(path + ".br", "wb") as f:
+                f.write(compressed)
+            self.brotli_bytes += len(compressed)
+        self.files += 1
+        self.raw_bytes += len(body)
+
+    def write_pages(self, url_path: str, response_model: Any, fetch: Callable[[int, int], list]) -> None:
+        """Toutes les pages d'une liste, `fetch(skip, limit)` rendant la page comme l'API."""
+        skip = 0
+        while True:
+            rows = fetch(skip, PAGE_SIZE)
+            if rows or skip == 0:
+                self.write(url_path, render(List[response_model], rows), page_file(skip))
+            if len(rows) < PAGE_SIZE:
+                return
+            skip += PAGE_SIZE
+
+
+def export_snapshots(db: Session, out_dir: str, feed_id: str = DEFAULT_FEED_ID) -> str:
+    """
+    Rend toutes les réponses statiques du flux `feed_id` (servi sans préfixe /feeds/...)
+    dans `out_dir/<version>` puis fait pointer `out_dir/current` dessus. Retourne le dossier
+    écrit. La version est celle que SnapshotMiddleware cherche (query_cache.feed_version).
+    """
+    versions = query_cache.read_feed_versions(db)
+    if not any(versions):
+        raise ValueError("feed_info.feed_version est vide : l'API ne pourrait pas servir l'instantané")
+    target = os.path.join(out_dir, version_dirname(",".join(versions)))
+    staging = target + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    writer = SnapshotWriter(staging)
+
+    writer.write_pages("/agencies/", schemas.Agency, lambda skip, limit: crud.get_agencies(db, feed_id, skip=skip, limit=limit))
+    writer.write_pages("/stops/", schemas.Stop, lambda skip, limit: crud.get_stops(db, feed_id, skip=skip, limit=limit))
+    writer.write_pages("/routes/", schemas.Route, lambda skip, limit: crud.get_routes(db, feed_id, skip=skip, limit=limit))
+
+    for agency in db.query(models.Agency).filter(models.Agency.feed_id == feed_id):
+        writer.write(f"/agencies/{url_segment(agency.agency_id)}", render(schemas.Agency, agency))
+    for stop in db.query(models.Stop).filter(models.Stop.feed_id == feed_id).all():
+        writer.write(f"/stops/{url_segment(stop.stop_id)}", render(schemas.Stop, stop))
+        writer.write(
+            f"/stops/{url_segment(stop.stop_id)}/routes",
+            render(List[schemas.StopRoute], crud.get_routes_by_stop(db, feed_id, stop_id=stop.stop_id)),
+        )
+    for route in db.query(models.Route).filter(models.Route.feed_id == feed_id).all():
+        route_path = f"/routes/{url_segment(route.route_id)}"
+        writer.write(route_path, render(schemas.Route, route))
+        writer.write_pages(
+            f"{route_path}/trips/", schemas.Trip,
+            lambda skip, limit: crud.get_trips_by_route(db, feed_id, route_id=route.route_id, skip=skip, limit=limit),
+        )
+        writer.write(
+            f"{route_path}/patterns",
+            render(List[schemas.Pattern], crud.get_patterns_by_route(db, feed_id, route_id=route.route_id)),
+        )
+        writer.write(
+            f"{route_path}/stops",
+            render(List[schemas.Stop], crud.get_stops_by_route(db, feed_id, route_id=route.route_id)),
+        )
+
+    # Trajets : une seule passe sur stop_times, découpée en pages comme l'API
+    trips = {trip.trip_id: trip for trip in db.query(models.Trip).filter(models.Trip.feed_id == feed_id)}
+    for trip in trips.values():
+        writer.write(f"/trips/{url_segment(trip.trip_id)}", render(schemas.Trip, trip))
+    stop_times = (
+        db.query(models.StopTime)
+        .filter(models.StopTime.feed_id == feed_id)
+        .order_by(models.StopTime.trip_id, models.StopTime.stop_sequence)
+        .yield_per(50000)
+    )
+    for trip_id, rows in groupby(stop_times, key=lambda st: st.trip_id):
+        if trip_id in trips:
+            rows = list(rows)
+            writer.write_pages(f"/trips/{url_segment(trip_id)}/stop_times/", schemas.StopTime, lambda skip, limit: rows[skip:skip + limit])
+
+    # Publication atomique : le dossier complet remplace l'ancien, puis le lien "current"
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+    link = os.path.join(out_dir, "current")
+    if os.path.lexists(link + ".tmp"):
+        os.remove(link + ".tmp")
+    os.symlink(os.path.basename(target), link + ".tmp")
+    os.replace(link + ".tmp", link)
+
+    ratio = writer.gzip_bytes / writer.raw_bytes if writer.raw_bytes else 0
+    print(f"{writer.files} responses written to {target} ({writer.raw_bytes} bytes, gzip {ratio:.0%}"
+          + (f", brotli {writer.brotli_bytes / writer.raw_bytes:.0%})." if brotli is not None and writer.raw_bytes else ")."))
+    return target
+
+
+class SnapshotMiddleware:
+    """
+    Middleware ASGI : sert les GET sans paramètres, ou avec skip/limit d'une page exportée,
+    depuis l'instantané de la version courante quand il existe, dans l'encodage accepté
+    par le client (br, gzip ou brut).
+    """
+
+    def __init__(self, app: ASGIApp, root: Optional[str] = SNAPSHOT_DIR):
+        self.app = app
+        self.root = os.path.realpath(root) if root else None
+
+    def _find(self, version: str, scope: Scope, route: Any) -> Optional[str]:
+        name = query_page_file(scope.get("query_string", b"").decode("latin-1"))
+        path_format = getattr(route, "path_format", None)
+        if name is None or path_format is None:
+            return None
+        # Chemin rebâti depuis les paramètres de la route, encodés comme à l'export
+        _, child_scope = route.matches(scope)
+        params = {key: url_segment(value) for key, value in child_scope.get("path_params", {}).items()}
+        base = os.path.join(self.root, version_dirname(version))
+        parts = [part for part in path_format.format(**params).split("/") if part]
+        candidate = os.path.realpath(os.path.join(base, *parts, name))
+        if not candidate.startswith(base + os.sep) or not os.path.isfile(candidate):
+            return None  # Hors de l'instantané (chemin avec ..) ou réponse non exportée
+        return candidate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.root is None or scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+        route = resolve_route(scope)
+        if route is None or extra_version(getattr(route, "endpoint", None)) is not None:
+            await self.app(scope, receive, send)  # Réponse enrichie (temps réel) : l'instantané ne suffit pas
+            return
+        if query_cache.query_cache.version_is_stale():
+            await run_in_threadpool(query_cache.feed_version)
+        version = query_cache.feed_version()
+        path = self._find(version, scope, route) if version else None
+        if path is None:
+            await self.app(scope, receive, send)
+            return
+
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        headers = {"Vary": "Accept-Encoding"}
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if encoding in accepted and os.path.isfile(path + suffix):
+                path += suffix
+                headers["Content-Encoding"] = encoding
+                break
+        response = FileResponse(path, media_type="application/json", headers=headers)
+        await response(scope, receive, send)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporte les réponses statiques de l'API, précompressées.")
+    parser.add_argument("--out", default=SNAPSHOT_DIR, required=SNAPSHOT_DIR is None, help="Dossier racine des instantanés")
+    args = parser.parse_args()
+
+    from db import ReadSessionLocal
+    db_session = ReadSessionLocal()
+    try:
+        print("Exporting snapshots...")
+        export_snapshots(db_session, args.out)
+        print("Snapshots exported.")
+    except Exception as e:
+        print(f"An error occurred while exporting snapshots: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        db_session.close()
+
+
+if __name__ == "__main__":
+    main()
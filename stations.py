@@ -0,0 +1,200 @@
+# stations.py
+# Regroupement automatique des arrêts en stations (location_type = 1). Notre flux n'a aucun
+# parent_station : les deux côtés d'une même rue sont deux arrêts sans lien, ce qui
+# encombre les résultats de recherche.
+#
+# Les paires d'arrêts à moins de `radius` mètres viennent de la grille de footpaths.py
+# (seules les cellules voisines sont comparées). Une paire est retenue si les noms
+# normalisés (casse, accents, ponctuation) se ressemblent assez. Les paires sont fusionnées
+# de la plus proche à la plus éloignée (union-find), sans laisser un groupe s'étendre
+# au-delà de 2 x `radius` : une rue entière d'arrêts homonymes ne devient pas une station.
+# Le coût est celui du tri des paires, quasi linéaire en nombre d'arrêts.
+#
+# Chaque groupe d'au moins deux arrêts devient une station "station/<plus petit stop_id>"
+# placée au centroïde, et ses arrêts y sont rattachés (parent_station). Seuls les arrêts
+# sans station sont regroupés ; les stations générées lors d'un passage précédent sont
+# remplacées.
+#
+# Utilisation : python stations.py [--feed default] [--radius 100] [--similarity 0.8] [--dry-run] [--json stations.json]
+
+import argparse
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Dict, List
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+from feeds import DEFAULT_FEED_ID
+from footpaths import EARTH_RADIUS, walking_pairs
+
+STATION_PREFIX = "station/"
+DEFAULT_RADIUS = float(os.getenv("STOP_CLUSTER_RADIUS", "100"))  # mètres (0 : pas de regroupement)
+DEFAULT_SIMILARITY = float(os.getenv("STOP_CLUSTER_SIMILARITY", "0.8"))  # Ressemblance minimale des noms (0..1)
+
+
+def normalize_name(name: str) -> str:
+    """Nom comparable : minuscules, sans accents ni ponctuation, espaces réduits."""
+    name = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode("ascii").lower()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", name).split())
+
+
+@lru_cache(maxsize=65536)
+def name_similarity(a: str, b: str) -> float:
+    """Ressemblance (0..1) de deux noms normalisés ; 0 si l'un est vide."""
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    if re.findall(r"\d+", a) != re.findall(r"\d+", b):
+        return 0.0  # "Campus 1" et "Campus 2" sont deux lieux distincts
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def cluster_stops(stop_ids: List[str], names: List[str], lat: np.ndarray, lon: np.ndarray,
+                  radius: float = DEFAULT_RADIUS, similarity: float = DEFAULT_SIMILARITY) -> List[List[int]]:
+    """Groupes (d'au moins deux arrêts) d'indices d'arrêts proches et de noms semblables."""
+    i, j, distance = walking_pairs(lat, lon, radius)
+    half = i < j
+    i, j, distance = i[half], j[half], distance[half]
+    normalized = [normalize_name(name) for name in names]
+    order = np.argsort(distance, kind="stable")
+
+    # Étendue (bbox, mètres) de chaque groupe, pour borner son diamètre
+    lat0 = math.radians(float(np.nanmean(lat))) if len(lat) else 0.0
+    x = np.radians(lon) * math.cos(lat0) * EARTH_RADIUS
+    y = np.radians(lat) * EARTH_RADIUS
+    box = {k: [x[k], y[k], x[k], y[k]] for k in set(i.tolist()) | set(j.tolist())}
+    parent: Dict[int, int] = {}
+
+    def find(k: int) -> int:
+        root = k
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while parent.get(k, k) != root:
+            parent[k], k = root, parent[k]
+        return root
+
+    for a, b in zip(i[order].tolist(), j[order].tolist()):
+        ra, rb = find(a), find(b)
+        if ra == rb or name_similarity(normalized[a], normalized[b]) < similarity:
+            continue
+        merged = [min(box[ra][0], box[rb][0]), min(box[ra][1], box[rb][1]),
+                  max(box[ra][2], box[rb][2]), max(box[ra][3], box[rb][3])]
+        if math.hypot(merged[2] - merged[0], merged[3] - merged[1]) > 2 * radius:
+            continue
+        parent[rb] = ra
+        box[ra] = merged
+
+    groups: Dict[int, List[int]] = {}
+    for k in sorted(box, key=lambda k: stop_ids[k]):
+        groups.setdefault(find(k), []).append(k)
+    return sorted((members for members in groups.values() if len(members) > 1), key=lambda m: stop_ids[m[0]])
+
+
+def propose_stations(db: Session, feed_id: str = DEFAULT_FEED_ID, radius: float = DEFAULT_RADIUS,
+                     similarity: float = DEFAULT_SIMILARITY) -> List[dict]:
+    """Stations proposées pour les arrêts d'un flux qui n'en ont pas : id, nom, centroïde, arrêts."""
+    stops = (
+        db.query(models.Stop.stop_id, models.Stop.stop_name, models.Stop.stop_lat, models.Stop.stop_lon)
+        .filter(
+            models.Stop.feed_id == feed_id,
+            func.coalesce(models.Stop.location_type, 0) == 0,
+            (models.Stop.parent_station.is_(None)) | (models.Stop.parent_station.startswith(STATION_PREFIX)),
+        )
+        .order_by(models.Stop.stop_id)
+        .all()
+    )
+    stop_ids = [s.stop_id for s in stops]
+    names = [s.stop_name for s in stops]
+    lat = np.array([s.stop_lat if s.stop_lat is not None else np.nan for s in stops], dtype=np.float64)
+    lon = np.array([s.stop_lon if s.stop_lon is not None else np.nan for s in stops], dtype=np.float64)
+
+    stations = []
+    for members in cluster_stops(stop_ids, names, lat, lon, radius, similarity):
+        # Nom le plus fréquent du groupe (à égalité, le premier rencontré)
+        name = Counter(names[k] for k in members if names[k]).most_common(1)[0][0]
+        stations.append({
+            "stop_id": f"{STATION_PREFIX}{stop_ids[members[0]]}",
+            "stop_name": name,
+            "stop_lat": round(float(lat[members].mean()), 6),
+            "stop_lon": round(float(lon[members].mean()), 6),
+            "stop_ids": [stop_ids[k] for k in members],
+        })
+    return stations
+
+
+def build_stations(db: Session, feed_id: str = DEFAULT_FEED_ID, radius: float = DEFAULT_RADIUS,
+                   similarity: float = DEFAULT_SIMILARITY, apply: bool = True) -> List[dict]:
+    """
+    Remplace les stations générées d'un flux par celles proposées et y rattache leurs arrêts
+    (si `apply`). Retourne les stations proposées.
+    """
+    stations = propose_stations(db, feed_id, radius, similarity) if radius > 0 else []
+    clustered = sum(len(station["stop_ids"]) for station in stations)
+    if apply:
+        generated = models.Stop.parent_station.startswith(STATION_PREFIX)
+        db.query(models.Stop).filter(models.Stop.feed_id == feed_id, generated).update(
+            {"parent_station": None}, synchronize_session=False
+        )
+        db.query(models.Stop).filter(
+            models.Stop.feed_id == feed_id, models.Stop.location_type == 1, models.Stop.stop_id.startswith(STATION_PREFIX)
+        ).delete(synchronize_session=False)
+        db.bulk_insert_mappings(models.Stop, [
+            {
+                "feed_id": feed_id,
+                "stop_id": station["stop_id"],
+                "stop_name": station["stop_name"],
+                "stop_lat": station["stop_lat"],
+                "stop_lon": station["stop_lon"],
+                "location_type": 1,
+            }
+            for station in stations
+        ])
+        db.bulk_update_mappings(models.Stop, [
+            {"feed_id": feed_id, "stop_id": stop_id, "parent_station": station["stop_id"]}
+            for station in stations for stop_id in station["stop_ids"]
+        ])
+        db.commit()
+    largest = max((len(station["stop_ids"]) for station in stations), default=0)
+    print(f"{len(stations)} stations grouping {clustered} stops (radius {radius:.0f} m, largest has {largest} stops).")
+    return stations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regroupe les arrêts proches et de même nom en stations.")
+    parser.add_argument("--feed", default=DEFAULT_FEED_ID, help="Flux à traiter")
+    parser.add_argument("--radius", type=float, default=DEFAULT_RADIUS, help="Distance maximale entre deux arrêts d'une station, en mètres")
+    parser.add_argument("--similarity", type=float, default=DEFAULT_SIMILARITY, help="Ressemblance minimale des noms (0..1)")
+    parser.add_argument("--dry-run", action="store_true", help="Propose les stations sans modifier la base")
+    parser.add_argument("--json", help="Écrit les stations proposées dans ce fichier JSON")
+    args = parser.parse_args()
+
+    from db import SessionLocal
+    db_session = SessionLocal()
+    try:
+        print("Clustering stops into stations...")
+        stations = build_stations(db_session, args.feed, args.radius, args.similarity, apply=not args.dry_run)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(stations, f, ensure_ascii=False, indent=2)
+        print("Stations built." if not args.dry_run else "Stations proposed (dry run).")
+    except Exception as e:
+        db_session.rollback()
+        print(f"An error occurred while clustering stops: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        db_session.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# subscriptions.py
+# Abonnements aux prochains départs d'un arrêt, poussés en Server-Sent Events. Au lieu de
+# voir chaque écran d'arrêt interroger /departures en boucle, les clients s'abonnent une
+# fois ; un registre pub/sub asyncio (un par processus) recalcule les départs de chaque
+# arrêt suivi une seule fois par rafraîchissement, quel que soit le nombre d'abonnés, et
+# ne pousse que les départs qui ont changé (retard temps réel, départ passé, annulation).
+#
+# La mémoire reste bornée : nombre d'abonnés limité (503 au-delà), file de quelques
+# événements par abonné (un client trop lent reçoit un nouvel état complet au lieu d'un
+# arriéré), et l'état d'un arrêt disparaît avec son dernier abonné.
+#
+# Variables d'environnement :
+#   SSE_REFRESH_SECONDS   intervalle de recalcul des départs suivis (défaut 15)
+#   SSE_MAX_SUBSCRIBERS   abonnés simultanés par processus (défaut 1000)
+
+import asyncio
+import json
+import os
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from pydantic import TypeAdapter
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+import realtime
+import schemas
+from feeds import DEFAULT_FEED_ID
+from timetable import get_timetable
+
+REFRESH_SECONDS = float(os.getenv("SSE_REFRESH_SECONDS", "15"))
+MAX_SUBSCRIBERS = int(os.getenv("SSE_MAX_SUBSCRIBERS", "1000"))
+QUEUE_SIZE = 8  # Événements en attente par abonné
+KEEPALIVE_SECONDS = 20  # Commentaire SSE envoyé sans événement, pour les proxys
+
+TopicKey = Tuple[str, str, int, int]  # (feed_id, stop_id, fenêtre en secondes, nombre de départs)
+_departures_adapter = TypeAdapter(List[schemas.Departure])
+
+
+class HubFull(Exception):
+    """Nombre maximal d'abonnés atteint."""
+
+
+def _departure_key(departure: dict) -> str:
+    return f"{departure['trip_id']}|{departure['service_date']}|{departure['departure_time']}"
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class _Topic:
+    __slots__ = ("subscribers", "departures")
+
+    def __init__(self):
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.departures: Optional[Dict[str, dict]] = None  # Dernier état publié, par clé de départ
+
+
+class DeparturesHub:
+    """Registre pub/sub des abonnements aux départs, par arrêt."""
+
+    def __init__(self, refresh_seconds: float = REFRESH_SECONDS, max_subscribers: int = MAX_SUBSCRIBERS):
+        self.refresh_seconds = refresh_seconds
+        self.max_subscribers = max_subscribers
+        self._topics: Dict[TopicKey, _Topic] = {}
+        self._subscribers = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def stats(self) -> dict:
+        return {"topics": len(self._topics), "subscribers": self._subscribers}
+
+    # --- Calcul ---
+    @staticmethod
+    def _compute(key: TopicKey) -> Dict[str, dict]:
+        feed_id, stop_id, window_secs, limit = key
+        tt = get_timetable(feed_id)
+        # Retards temps réel : le flux GTFS-RT relevé est celui du flux par défaut
+        overlay = realtime.current() if feed_id == DEFAULT_FEED_ID else None
+        departures = tt.departures(stop_id, tt.local_time(), window_secs, limit, overlay=overlay) or []
+        # Forme JSON exacte de l'endpoint /departures (valeurs par défaut comprises)
+        return {_departure_key(d): d for d in _departures_adapter.dump_python(_departures_adapter.validate_python(departures), mode="json")}
+
+    @staticmethod
+    def _push(queue: asyncio.Queue, message: str, snapshot: str) -> None:
+        if queue.full():
+            # Abonné trop lent : on remplace son arriéré par l'état complet
+            while not queue.empty():
+                queue.get_nowait()
+            message = snapshot
+        queue.put_nowait(message)
+
+    # --- Abonnement ---
+    async def subscribe(self, key: TopicKey) -> asyncio.Queue:
+        """Inscrit un abonné et lui envoie l'état courant. Lève HubFull au-delà de la limite."""
+        if self._subscribers >= self.max_subscribers:
+            raise HubFull()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        topic = self._topics.setdefault(key, _Topic())
+        topic.subscribers.add(queue)
+        self._subscribers += 1
+        if topic.departures is None:
+            topic.departures = await run_in_threadpool(self._compute, key)
+        queue.put_nowait(_sse("snapshot", list(topic.departures.values())))
+        return queue
+
+    def unsubscribe(self, key: TopicKey, queue: asyncio.Queue) -> None:
+        topic = self._topics.get(key)
+        if topic is None or queue not in topic.subscribers:
+            return
+        topic.subscribers.discard(queue)
+        self._subscribers -= 1
+        if not topic.subscribers:
+            del self._topics[key]  # Plus d'abonné : l'état de l'arrêt est libéré
+
+    async def stream(self, key: TopicKey, queue: asyncio.Queue, request: Request) -> AsyncIterator[str]:
+        """Corps de la réponse SSE d'un abonné ; le désinscrit à la déconnexion."""
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    message = ": keepalive\n\n"
+                yield message
+        finally:
+            self.unsubscribe(key, queue)
+
+    # --- Publication ---
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            for key in list(self._topics):
+                try:
+                    current = await run_in_threadpool(self._compute, key)
+                except Exception:
+                    continue  # Index en cours de rechargement : on réessaiera au prochain tour
+                topic = self._topics.get(key)
+                if topic is None:
+                    continue  # Dernier abonné parti pendant le calcul
+                previous = topic.departures or {}
+                changed = [d for k, d in current.items() if previous.get(k) != d]
+                removed = [k for k in previous if k not in current]
+                topic.departures = current
+                if not changed and not removed:
+                    continue
+                message = _sse("update", {"changed": changed, "removed": removed})
+                snapshot = _sse("snapshot", list(current.values()))
+                for queue in list(topic.subscribers):
+                    self._push(queue, message, snapshot)
+
+
+departures_hub = DeparturesHub()
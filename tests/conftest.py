@@ -0,0 +1,49 @@
+# Base SQLite minimale pour les tests de l'API : un flux "default" avec feed_version (pour
+# que les ETag soient émis), une agence et un arrêt. L'API la lit comme une base embarquée
+# (DB_SQLITE_PATH), sans PostgreSQL. La fixture `db` donne une base SQLite vide par test,
+# pour les traitements qui écrivent (patterns, correspondances, stations...).
+
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def client(tmp_path_factory):
+    path = tmp_path_factory.mktemp("gtfs") / "gtfs.db"
+    import models
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all([
+            models.Feed(feed_id="default"),
+            models.FeedInfo(feed_id="default", feed_publisher_name="Test", feed_publisher_url="https://example.org",
+                            feed_lang="fr", feed_version="v1"),
+            models.Agency(feed_id="default", agency_id="A", agency_name="Agence", agency_url="https://example.org",
+                          agency_timezone="Europe/Paris"),
+            models.Stop(feed_id="default", stop_id="S1", stop_name="Gare", stop_lat=45.0, stop_lon=5.0),
+        ])
+        session.commit()
+    engine.dispose()
+
+    os.environ["DB_SQLITE_PATH"] = str(path)
+    from fastapi.testclient import TestClient
+    import main
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Session sur une base SQLite vide (schéma complet), propre à chaque test."""
+    import models
+    engine = create_engine(f"sqlite:///{tmp_path / 'feed.db'}")
+    models.Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
@@ -0,0 +1,60 @@
+# Les routes d'un flux (sans préfixe et sous /feeds/{feed_id}) doivent être résolues par les
+# middlewares : ETag et libellé de route des métriques. Les routes servies par l'index horaire
+# (départs, services, itinéraires, isochrones, matrice) existent aussi sous le préfixe.
+
+import io
+
+import numpy as np
+import pytest
+
+FEED_ROUTES = [
+    ("/agencies/", "/agencies/"),
+    ("/feeds/default/agencies/", "/feeds/{feed_id}/agencies/"),
+    ("/stops/S1", "/stops/{stop_id:path}"),
+    ("/feeds/default/stops/S1", "/feeds/{feed_id}/stops/{stop_id:path}"),
+]
+
+
+@pytest.mark.parametrize("path, template", FEED_ROUTES)
+def test_feed_route_has_etag(client, path, template):
+    response = client.get(path)
+    assert response.status_code == 200
+    etag = response.headers.get("etag")
+    assert etag
+    assert client.get(path, headers={"If-None-Match": etag}).status_code == 304
+
+
+@pytest.mark.parametrize("path, template", FEED_ROUTES)
+def test_feed_route_metrics_label(client, path, template):
+    client.get(path)
+    metrics = client.get("/metrics").text
+    assert f'route="{template}"' in metrics
+
+
+@pytest.mark.parametrize("prefix", ["", "/feeds/default"])
+def test_timetable_routes_are_served_per_feed(client, prefix):
+    departures = client.get(f"{prefix}/stops/S1/departures", params={"at": "2024-01-08T08:00:00"})
+    assert departures.status_code == 200 and departures.json() == []
+    assert client.get(f"{prefix}/stops/S9/departures").status_code == 404
+    assert client.get(f"{prefix}/stops/S9/departures/stream").status_code == 404
+    services = client.get(f"{prefix}/services/active", params={"date": "2024-01-08"})
+    assert services.json() == {"date": "2024-01-08", "service_ids": []}
+    assert client.get(f"{prefix}/plan", params={"from": "S1", "to": "S9"}).status_code == 404
+    assert client.get(f"{prefix}/isochrones", params={"from": "S1"}).json()["type"] == "FeatureCollection"
+
+    matrix = client.post(f"{prefix}/matrix", json={"origins": ["S1"], "depart_at": "2024-01-08T08:00:00"})
+    assert matrix.status_code == 200
+    assert matrix.headers["content-type"] == "application/octet-stream"
+    assert np.load(io.BytesIO(matrix.content)).shape == (1, 1)
+
+
+def test_timetable_route_metrics_label(client):
+    client.get("/feeds/default/services/active", params={"date": "2024-01-08"})
+    assert 'route="/feeds/{feed_id}/services/active"' in client.get("/metrics").text
+
+
+@pytest.mark.parametrize("path", ["/agencies/", "/plan?from=S1&to=S1", "/services/active", "/stops/S1/departures"])
+def test_unknown_feed_is_404(client, path):
+    response = client.get(f"/feeds/missing{path}")
+    assert response.status_code == 404 and response.json() == {"detail": "Feed not found"}
+    assert client.post("/feeds/missing/matrix", json={"origins": ["S1"]}).status_code == 404
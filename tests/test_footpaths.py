@@ -0,0 +1,79 @@
+# Correspondances à pied : la grille doit trouver les mêmes paires qu'une comparaison
+# exhaustive en haversine, et generate_transfers ne remplace que les liens générés.
+
+import numpy as np
+import pytest
+
+import models
+from footpaths import generate_transfers, walk_seconds, walking_pairs
+from shapes import haversine
+
+
+def brute_force_pairs(lat, lon, radius):
+    """Toutes les paires (i, j) à moins de `radius` mètres, en haversine, et leurs distances."""
+    i, j = np.meshgrid(np.arange(len(lat)), np.arange(len(lat)), indexing="ij")
+    i, j = i.ravel(), j.ravel()
+    distance = haversine(lat[i], lon[i], lat[j], lon[j])
+    return {(a, b): d for a, b, d in zip(i.tolist(), j.tolist(), distance.tolist()) if a != b}
+
+
+@pytest.mark.parametrize("radius", [150.0, 400.0])
+def test_grid_matches_brute_force_haversine(radius):
+    rng = np.random.default_rng(7)
+    # Arrêts d'une ville de ~6 km, avec des grappes (pôles d'échange) et des doublons exacts
+    lat = 45.75 + rng.uniform(-0.03, 0.03, 600)
+    lon = 4.85 + rng.uniform(-0.04, 0.04, 600)
+    lat[:40] = 45.76 + rng.normal(0, 0.0005, 40)
+    lon[:40] = 4.83 + rng.normal(0, 0.0005, 40)
+    lat[40], lon[40] = lat[41], lon[41]
+
+    i, j, distance = walking_pairs(lat, lon, radius)
+    found = dict(zip(zip(i.tolist(), j.tolist()), distance.tolist()))
+    assert len(found) == len(i)  # Pas de paire en double
+    reference = brute_force_pairs(lat, lon, radius)
+    within = {pair for pair, d in reference.items() if d <= radius}
+
+    # La projection locale s'écarte de la haversine de moins de 0,1 % : seules les paires
+    # à la limite du rayon peuvent différer
+    borderline = {pair for pair, d in reference.items() if abs(d - radius) <= radius * 1e-3}
+    assert set(found) - borderline == within - borderline
+    assert all(abs(found[pair] - reference[pair]) <= 1e-3 * max(reference[pair], 1.0) for pair in found)
+    assert all((b, a) in found for a, b in found)
+    assert found[(40, 41)] == 0.0
+
+
+def test_stops_without_coordinates_are_ignored():
+    lat = np.array([45.0, 45.0, np.nan, 0.0, 45.0])
+    lon = np.array([5.0, 5.001, 5.0, 0.0, 5.0005])
+    i, j, _ = walking_pairs(lat, lon, 200.0)
+    assert set(zip(i.tolist(), j.tolist())) == {(0, 1), (1, 0), (0, 4), (4, 0), (1, 4), (4, 1)}
+    assert [len(a) for a in walking_pairs(lat[:1], lon[:1], 200.0)] == [0, 0, 0]
+    assert [len(a) for a in walking_pairs(lat, lon, 0.0)] == [0, 0, 0]
+
+
+def test_generate_transfers_replaces_only_synthetic_rows(db):
+    db.add_all([
+        models.Stop(feed_id="default", stop_id="A", stop_name="A", stop_lat=45.0, stop_lon=5.0),
+        models.Stop(feed_id="default", stop_id="B", stop_name="B", stop_lat=45.0, stop_lon=5.001),
+        models.Stop(feed_id="default", stop_id="C", stop_name="C", stop_lat=45.0, stop_lon=5.0015),
+        models.Stop(feed_id="default", stop_id="ST", stop_name="Station", stop_lat=45.0, stop_lon=5.0005, location_type=1),
+        models.Stop(feed_id="default", stop_id="FAR", stop_name="Loin", stop_lat=45.1, stop_lon=5.0),
+        models.Stop(feed_id="other", stop_id="O", stop_name="Autre flux", stop_lat=45.0, stop_lon=5.0002),
+        # Correspondance fournie par le flux : conservée telle quelle
+        models.Transfer(feed_id="default", from_stop_id="A", to_stop_id="B", transfer_type=2, min_transfer_time=300),
+        # Ancienne correspondance générée : remplacée
+        models.Transfer(feed_id="default", from_stop_id="A", to_stop_id="FAR", transfer_type=2, min_transfer_time=1,
+                        is_synthetic=1),
+    ])
+    db.commit()
+
+    assert generate_transfers(db, "default", radius=150.0) == 5
+    transfers = {
+        (t.from_stop_id, t.to_stop_id): (t.min_transfer_time, t.is_synthetic)
+        for t in db.query(models.Transfer).filter_by(feed_id="default")
+    }
+    assert transfers.pop(("A", "B")) == (300, 0)
+    ab = float(haversine(45.0, 5.0, 45.0, 5.001))
+    assert transfers[("B", "A")] == (int(walk_seconds(ab)), 1)
+    assert set(transfers) == {("B", "A"), ("B", "C"), ("C", "B"), ("A", "C"), ("C", "A")}
+    assert generate_transfers(db, "default", radius=150.0) == 5  # Idempotent
@@ -0,0 +1,35 @@
+# ETag et négociation de l'encodage : chaque encodage du corps a son propre validateur fort,
+# et Vary: Accept-Encoding accompagne les 200 comme les 304.
+
+from http_cache import accepted_encodings, coded_etag, etag_matches
+
+ETAG = '"abc"'
+
+
+def test_coded_etag_is_distinct_per_coding():
+    assert coded_etag(ETAG, None) == coded_etag(ETAG, "identity") == ETAG
+    assert len({ETAG, coded_etag(ETAG, "gzip"), coded_etag(ETAG, "br")}) == 3
+
+
+def test_accepted_encodings_ignores_q_zero():
+    assert accepted_encodings("gzip;q=0, br;q=0.5, identity") == {"br", "identity"}
+
+
+def test_coded_etag_matches_only_if_coding_is_accepted():
+    gzip_tag = coded_etag(ETAG, "gzip")
+    assert etag_matches(ETAG, gzip_tag, "gzip, br") == gzip_tag
+    assert etag_matches(ETAG, f"W/{gzip_tag}", "gzip") == gzip_tag
+    assert etag_matches(ETAG, gzip_tag, "br") is None
+    assert etag_matches(ETAG, gzip_tag, "") is None
+    assert etag_matches(ETAG, f'"other", {ETAG}', "") == ETAG
+    assert etag_matches(ETAG, "*", "") == ETAG
+
+
+def test_vary_on_200_and_304(client):
+    response = client.get("/agencies/")
+    assert response.status_code == 200
+    assert "accept-encoding" in response.headers["vary"].lower()
+    not_modified = client.get("/agencies/", headers={"If-None-Match": response.headers["etag"]})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == response.headers["etag"]
+    assert "accept-encoding" in not_modified.headers["vary"].lower()
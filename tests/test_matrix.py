@@ -0,0 +1,33 @@
+# POST /matrix : paramètres bornés comme ceux de GET /plan et GET /isochrones, et calcul
+# attendu de façon asynchrone (réponse .npy).
+
+import io
+
+import numpy as np
+import pytest
+
+from schemas import MATRIX_MAX_ORIGINS
+
+
+@pytest.mark.parametrize("body", [
+    {"origins": []},
+    {"origins": ["S1"] * (MATRIX_MAX_ORIGINS + 1)},
+    {"origins": ["S1"], "step": 0},
+    {"origins": ["S1"], "window": -5},
+    {"origins": ["S1"], "window": 181},
+    {"origins": ["S1"], "max_duration": 0},
+    {"origins": ["S1"], "max_transfers": 9},
+])
+def test_matrix_rejects_out_of_bounds_requests(client, body):
+    assert client.post("/matrix", json=body).status_code == 422
+
+
+def test_matrix_returns_npy(client):
+    response = client.post("/matrix", json={"origins": ["S1"], "depart_at": "2023-05-03T08:00:00", "window": 10, "step": 5})
+    assert response.status_code == 200
+    matrix = np.load(io.BytesIO(response.content))
+    assert matrix.shape == (1, 1) and matrix.dtype == np.uint16 and matrix[0, 0] == 0
+
+
+def test_matrix_unknown_stop_is_404(client):
+    assert client.post("/matrix", json={"origins": ["S1"], "destinations": ["nope"]}).status_code == 404
@@ -0,0 +1,42 @@
+# Coût en base par requête : cursor.rowcount vaut -1 pour un SELECT sous SQLite, la requête
+# est alors comptée à part et jamais soustraite des lignes ; une requête en échec ne laisse
+# pas son heure de départ sur la connexion.
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import metrics
+
+
+@pytest.fixture
+def cost():
+    request_cost = metrics.RequestCost("GET /test")
+    token = metrics._current.set(request_cost)
+    yield request_cost
+    metrics._current.reset(token)
+
+
+def test_unreported_row_counts_are_not_summed(db, cost):
+    for _ in range(3):
+        db.execute(text("SELECT stop_id FROM stops")).all()
+    db.execute(text("UPDATE stops SET stop_name = 'x' WHERE 0"))
+    assert cost.statements == 4
+    assert cost.rows == 0 and cost.unreported_rows == 3
+
+
+def test_failed_query_does_not_leak_its_start(db, cost):
+    connection = db.connection()
+    with pytest.raises(OperationalError):
+        connection.execute(text("SELECT * FROM no_such_table"))
+    assert connection.info.get("query_start") == []
+    db.rollback()
+
+
+def test_exposition_labels_rows_as_driver_dependent(client):
+    client.get("/stops/")
+    exposition = client.get("/metrics").text
+    assert "# HELP gtfs_db_rows_total" in exposition and "dépend du pilote" in exposition
+    rows = [line for line in exposition.splitlines() if line.startswith("gtfs_db_rows_total{")]
+    assert rows and all(float(line.rsplit(" ", 1)[1]) >= 0 for line in rows)
+    assert 'gtfs_db_rows_unreported_statements_total{method="GET",route="/stops/"}' in exposition
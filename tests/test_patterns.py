@@ -0,0 +1,76 @@
+# Extraction des patterns : regroupement des trajets par (route, suite d'arrêts), profil de
+# référence et décalages propres, identifiants stables et index arrêt -> routes.
+
+import models
+from patterns import build_patterns, extract_patterns
+
+# trip_id -> (route_id, direction_id, [(stop_id, arrivée, départ)])
+TRIPS = {
+    "T1": ("R1", 0, [("A", "08:00:00", "08:00:00"), ("B", "08:05:00", "08:06:00"), ("C", "08:10:00", "08:10:00")]),
+    "T2": ("R1", 0, [("A", "07:00:00", "07:00:00"), ("B", "07:05:00", "07:06:00"), ("C", "07:10:00", "07:10:00")]),
+    "T3": ("R1", 0, [("A", "09:00:00", "09:00:00"), ("B", "09:08:00", "09:08:00"), ("C", "09:15:00", "09:15:00")]),
+    "T4": ("R1", 1, [("C", "08:00:00", "08:00:00"), ("B", None, None), ("A", "08:12:00", "08:12:00")]),
+    "T5": ("R2", 0, [("A", "25:00:00", "25:00:00"), ("B", "25:04:00", "25:04:00"), ("A", "25:09:00", "25:09:00")]),
+}
+
+
+def _load(db, feed_id="default"):
+    for trip_id, (route_id, direction_id, stop_times) in TRIPS.items():
+        db.add(models.Trip(feed_id=feed_id, trip_id=trip_id, route_id=route_id, service_id="S", direction_id=direction_id))
+        db.add_all(
+            models.StopTime(feed_id=feed_id, trip_id=trip_id, stop_sequence=k + 1, stop_id=stop_id,
+                            arrival_time=arrival, departure_time=departure)
+            for k, (stop_id, arrival, departure) in enumerate(stop_times)
+        )
+    db.commit()
+
+
+def test_trips_are_grouped_by_route_and_stop_sequence(db):
+    _load(db)
+    patterns = {p["pattern_id"]: p for p in extract_patterns(db, "default")}
+    assert sorted(patterns) == ["R1:1", "R1:2", "R2:1"]
+    assert patterns["R1:1"]["stops"] == ("A", "B", "C") and patterns["R1:2"]["stops"] == ("C", "B", "A")
+    # Trajets triés par heure de départ ; le profil de référence est celui du premier
+    assert [(start, trip_id) for start, trip_id, _ in patterns["R1:1"]["trips"]] == [
+        (7 * 3600, "T2"), (8 * 3600, "T1"), (9 * 3600, "T3"),
+    ]
+    assert patterns["R1:1"]["offsets"] == ((0, 0), (300, 360), (600, 600))
+    # Heures manquantes : l'arrêt reprend la dernière heure connue
+    assert patterns["R1:2"]["offsets"] == ((0, 0), (0, 0), (720, 720))
+    assert patterns["R2:1"]["trips"][0][0] == 25 * 3600
+
+
+def test_build_patterns_stores_profiles_and_deviations(db):
+    _load(db)
+    assert build_patterns(db, "default") == 3
+    vectors = {t.trip_id: (t.pattern_id, t.start_time, t.time_vector) for t in db.query(models.PatternTrip)}
+    assert vectors["T1"] == ("R1:1", 8 * 3600, None)
+    assert vectors["T2"] == ("R1:1", 7 * 3600, None)
+    assert vectors["T3"] == ("R1:1", 9 * 3600, "0:0,480:480,900:900")  # S'écarte du profil de référence
+    stops = db.query(models.PatternStop).filter_by(pattern_id="R1:1").order_by(models.PatternStop.stop_sequence)
+    assert [(s.stop_sequence, s.stop_id, s.arrival_offset, s.departure_offset) for s in stops] == [
+        (0, "A", 0, 0), (1, "B", 300, 360), (2, "C", 600, 600),
+    ]
+    pattern = db.get(models.Pattern, ("default", "R1:1"))
+    assert (pattern.stop_count, pattern.trip_count, pattern.direction_id) == (3, 3, 0)
+
+
+def test_stop_routes_count_loops_once(db):
+    _load(db)
+    build_patterns(db, "default")
+    counts = {(r.stop_id, r.route_id): (r.pattern_count, r.trip_count) for r in db.query(models.StopRoute)}
+    assert counts == {
+        ("A", "R1"): (2, 4), ("B", "R1"): (2, 4), ("C", "R1"): (2, 4),
+        ("A", "R2"): (1, 1), ("B", "R2"): (1, 1),
+    }
+
+
+def test_rebuild_is_per_feed_and_idempotent(db):
+    _load(db)
+    _load(db, "other")
+    build_patterns(db, "default")
+    build_patterns(db, "default")
+    assert db.query(models.Pattern).filter_by(feed_id="default").count() == 3
+    assert db.query(models.Pattern).filter_by(feed_id="other").count() == 0
+    assert build_patterns(db, "other") == 3
+    assert db.query(models.PatternTrip).count() == 2 * len(TRIPS)
@@ -0,0 +1,95 @@
+# Cache des lectures crud : tout le cache est invalidé quand feed_version change (ou qu'un
+# flux est ajouté), pas avant la prochaine vérification, et le LRU reste borné en octets.
+
+import pytest
+
+import models
+import query_cache
+from query_cache import QueryCache, cached
+
+calls = []
+
+
+@cached
+def read_agency_names(db, feed_id="default", prefix=""):
+    calls.append((feed_id, prefix))
+    return [prefix + a.agency_name for a in db.query(models.Agency).filter_by(feed_id=feed_id)]
+
+
+@pytest.fixture
+def cache(db, monkeypatch):
+    """Cache neuf (vérification de version à chaque appel) et un flux "default" en v1."""
+    fresh = QueryCache(max_bytes=1024 * 1024, check_interval=0)
+    monkeypatch.setattr(query_cache, "query_cache", fresh)
+    calls.clear()
+    db.add_all([
+        models.FeedInfo(feed_id="default", feed_publisher_name="Test", feed_publisher_url="https://example.org",
+                        feed_lang="fr", feed_version="v1"),
+        models.Agency(feed_id="default", agency_id="A", agency_name="Agence", agency_url="https://example.org",
+                      agency_timezone="Europe/Paris"),
+    ])
+    db.commit()
+    return fresh
+
+
+def test_hits_until_feed_version_changes(db, cache):
+    assert read_agency_names(db) == ["Agence"]
+    assert read_agency_names(db, feed_id="default") == ["Agence"]  # Même entrée, arguments normalisés
+    assert len(calls) == 1 and cache.hits == 1
+
+    db.query(models.Agency).update({"agency_name": "Nouvelle agence"})
+    db.commit()
+    assert read_agency_names(db) == ["Agence"]  # Même version : l'entrée est encore servie
+
+    db.query(models.FeedInfo).update({"feed_version": "v2"})
+    db.commit()
+    assert read_agency_names(db) == ["Nouvelle agence"]
+    assert len(calls) == 2 and cache.invalidations == 1
+    assert cache.stats()["feed_version"] == "default:v2"
+
+
+def test_loading_another_feed_invalidates(db, cache):
+    read_agency_names(db)
+    db.add(models.FeedInfo(feed_id="other", feed_publisher_name="Autre", feed_publisher_url="https://example.org",
+                           feed_lang="fr", feed_version="v1"))
+    db.commit()
+    read_agency_names(db)
+    assert len(calls) == 2 and cache.invalidations == 1
+    assert cache.stats()["feed_version"] == "default:v1,other:v1"
+
+
+def test_version_is_only_reread_after_the_interval(db, cache, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(query_cache.time, "monotonic", lambda: clock[0])
+    cache.check_interval = 30
+    read_agency_names(db)
+    db.query(models.FeedInfo).update({"feed_version": "v2"})
+    db.commit()
+    clock[0] += 10
+    read_agency_names(db)
+    assert len(calls) == 1
+    clock[0] += 30
+    read_agency_names(db)
+    assert len(calls) == 2 and cache.invalidations == 1
+
+
+def test_lru_is_bounded_in_bytes(db, cache):
+    read_agency_names(db, prefix="a")
+    one_entry = cache.current_bytes
+    cache.max_bytes = int(one_entry * 2.5)
+    for prefix in "bcd":
+        read_agency_names(db, prefix=prefix)
+    assert cache.stats()["entries"] == 2 and cache.evictions == 2
+    assert cache.current_bytes <= cache.max_bytes
+    read_agency_names(db, prefix="d")  # La plus récente est toujours là
+    assert len(calls) == 4
+
+    cache.put(("huge",), "x" * cache.max_bytes)  # Plus grosse que le cache : ignorée
+    assert cache.get(("huge",)) == (False, None)
+
+
+def test_disabled_cache_always_reads(db, cache):
+    cache.max_bytes = 0
+    read_agency_names(db)
+    read_agency_names(db)
+    assert len(calls) == 2 and cache.stats()["entries"] == 0
@@ -0,0 +1,235 @@
+# RAPTOR sur un réseau synthétique aléatoire, comparé à une recherche exhaustive par rounds :
+# le front retourné doit être exactement le front de Pareto (arrivée, nombre de trajets en
+# véhicule), et chaque itinéraire doit reproduire l'arrivée et le nombre de correspondances
+# de son label.
+
+import math
+import random
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+from raptor import INF, RaptorRouter
+from service_calendar import ServiceCalendar
+from timetable import SECONDS_PER_DAY, Timetable
+
+DAY = date(2023, 5, 3)
+N_STOPS = 30
+
+
+def synthetic_timetable(seed: int) -> Timetable:
+    """
+    Lignes aléatoires et marches (non transitives) entre arrêts voisins. Un trajet sur deux
+    circule un jour sur deux (pas la veille de DAY), une ligne sur quatre est à fréquence, et
+    des trajets de la veille passent après minuit (heures de 31 h à 34 h).
+    """
+    rng = random.Random(seed)
+    tt = Timetable()
+    tt.stop_ids = [f"S{s}" for s in range(N_STOPS)]
+    tt.stop_index = {stop_id: s for s, stop_id in enumerate(tt.stop_ids)}
+    tt.stop_names = list(tt.stop_ids)
+    tt.route_ids, tt.route_short_names, tt.route_long_names = ["R"], ["R"], ["R"]
+    tt.calendar = ServiceCalendar(["daily", "alternate"], DAY - timedelta(days=2), 8, np.array([[0xFF], [0x55]], dtype=np.uint8))
+
+    trips = []
+    for line in range(12):
+        stops = rng.sample(range(N_STOPS), rng.randint(3, 7))
+        hops = [rng.randint(120, 900) for _ in stops[1:]]
+        for _ in range(1 if line % 4 == 0 else rng.randint(2, 6)):
+            t = rng.randint(7 * 3600, 10 * 3600) + rng.choice((0, SECONDS_PER_DAY))
+            times = [t]
+            for hop in hops:
+                times.append(times[-1] + hop + rng.randint(0, 60))
+            frequency = (t, t + rng.randint(1800, 7200), rng.randint(300, 1200)) if line % 4 == 0 else None
+            trips.append((stops, times, rng.randint(0, 1), frequency))
+    tt.trip_ids = [f"T{i}" for i in range(len(trips))]
+    tt.trip_index = {trip_id: i for i, trip_id in enumerate(tt.trip_ids)}
+    tt.trip_headsigns = [None] * len(trips)
+    tt.trip_route = np.zeros(len(trips), dtype=np.int32)
+    tt.trip_service = np.array([service for _, _, service, _ in trips], dtype=np.int32)
+    tt.trip_st_start = np.cumsum([0] + [len(stops) for stops, _, _, _ in trips]).astype(np.int64)
+    tt.st_stop = np.array([s for stops, _, _, _ in trips for s in stops], dtype=np.int32)
+    tt.st_arrival = np.array([t for _, times, _, _ in trips for t in times], dtype=np.int32)
+    tt.st_departure = tt.st_arrival.copy()
+    frequencies = [frequency for _, _, _, frequency in trips if frequency]
+    tt.trip_freq_start = np.cumsum([0] + [frequency is not None for _, _, _, frequency in trips]).astype(np.int64)
+    tt.freq_start = np.array([f[0] for f in frequencies], dtype=np.int32)
+    tt.freq_end = np.array([f[1] for f in frequencies], dtype=np.int32)
+    tt.freq_headway = np.array([f[2] for f in frequencies], dtype=np.int32)
+
+    pairs = set()
+    for _ in range(40):
+        a, b = rng.sample(range(N_STOPS), 2)
+        secs = rng.randint(60, 600)
+        pairs.update({(a, b, secs), (b, a, secs)})
+    tt.set_footpaths(sorted(pairs))
+    return tt
+
+
+def reference_pareto(tt: Timetable, origin: int, target: int, depart_secs: int, max_rounds: int):
+    """Rounds exhaustifs : chaque round monte dans tout trajet atteignable, puis marche une fois."""
+    footpaths = [[] for _ in range(N_STOPS)]
+    for s in range(N_STOPS):
+        for fp in range(int(tt.stop_fp_start[s]), int(tt.stop_fp_start[s + 1])):
+            footpaths[s].append((int(tt.fp_stop[fp]), int(tt.fp_secs[fp])))
+    # Tous les passages de la veille, du jour et du lendemain, fréquences déroulées
+    trips = []
+    for offset in (-1, 0, 1):
+        active = tt.active_trips(DAY + timedelta(days=offset))
+        for trip_idx in range(len(tt.trip_ids)):
+            if not active[trip_idx]:
+                continue
+            lo, hi = int(tt.trip_st_start[trip_idx]), int(tt.trip_st_start[trip_idx + 1])
+            times = tt.st_departure[lo:hi].tolist()
+            starts = [times[0]]
+            for f in range(int(tt.trip_freq_start[trip_idx]), int(tt.trip_freq_start[trip_idx + 1])):
+                starts = range(int(tt.freq_start[f]), int(tt.freq_end[f]), int(tt.freq_headway[f]))
+            for start in starts:
+                trips.append((tt.st_stop[lo:hi].tolist(), [t - times[0] + start + offset * SECONDS_PER_DAY for t in times]))
+
+    label = [INF] * N_STOPS
+    label[origin] = depart_secs
+    for to_stop, secs in footpaths[origin]:
+        label[to_stop] = min(label[to_stop], depart_secs + secs)
+    pareto = [(0, label[target])] if label[target] < INF and target != origin else []
+    for k in range(1, max_rounds + 1):
+        ride = [INF] * N_STOPS
+        for stops, times in trips:
+            boarded = False
+            for stop, t in zip(stops, times):
+                if boarded:
+                    ride[stop] = min(ride[stop], t)
+                boarded = boarded or label[stop] <= t
+        new_label = [min(a, b) for a, b in zip(label, ride)]
+        for stop in range(N_STOPS):
+            if ride[stop] < INF:
+                for to_stop, secs in footpaths[stop]:
+                    new_label[to_stop] = min(new_label[to_stop], ride[stop] + secs)
+        if new_label[target] < label[target]:
+            pareto.append((k, new_label[target]))
+        label = new_label
+    return pareto
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_pareto_front_matches_exhaustive_search(seed):
+    tt = synthetic_timetable(seed)
+    router = RaptorRouter(tt)
+    rng = random.Random(seed)
+    for _ in range(15):
+        origin, target = rng.sample(range(N_STOPS), 2)
+        depart_secs = rng.randint(7 * 3600, 9 * 3600)
+        _, _, _, pareto, _ = router.route(origin, target, DAY, depart_secs, max_transfers=4)
+        assert pareto == reference_pareto(tt, origin, target, depart_secs, max_rounds=5)
+        arrivals = [arrival for _, arrival in pareto]
+        assert arrivals == sorted(arrivals, reverse=True) and len(set(arrivals)) == len(arrivals)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_itineraries_match_their_labels(seed):
+    tt = synthetic_timetable(seed)
+    router = RaptorRouter(tt)
+    rng = random.Random(seed)
+    midnight = datetime.combine(DAY, datetime.min.time())
+    for _ in range(15):
+        origin, target = rng.sample(range(N_STOPS), 2)
+        depart_at = midnight + timedelta(seconds=rng.randint(7 * 3600, 9 * 3600))
+        depart_secs = int((depart_at - midnight).total_seconds())
+        _, _, _, pareto, _ = router.route(origin, target, DAY, depart_secs)
+        itineraries = router.plan(tt.stop_ids[origin], tt.stop_ids[target], depart_at)
+        assert len(itineraries) == len(pareto)
+        for (k, arrival), itinerary in zip(pareto, itineraries):
+            legs = itinerary["legs"]
+            assert itinerary["arrival"] == midnight + timedelta(seconds=arrival)
+            assert sum(1 for leg in legs if leg["mode"] == "transit") == k
+            assert itinerary["transfers"] == max(0, k - 1)
+            assert legs[0]["from_stop_id"] == tt.stop_ids[origin] and legs[-1]["to_stop_id"] == tt.stop_ids[target]
+            assert legs[0]["departure"] >= depart_at
+            for previous, leg in zip(legs, legs[1:]):
+                assert previous["to_stop_id"] == leg["from_stop_id"]
+                assert previous["arrival"] <= leg["departure"]
+                assert not (previous["mode"] == "walk" and leg["mode"] == "walk")
+
+
+def city_timetable(seed: int = 0, side: int = 70, lines: int = 1000) -> Timetable:
+    """
+    Réseau de la taille d'une ville : grille de side × side arrêts (200 m entre voisins),
+    lignes de 20 à 40 arrêts, moitié à fréquence et moitié en trajets horaires de 5 h à 23 h,
+    marches vers les arrêts à deux mailles au plus.
+    """
+    rng = random.Random(seed)
+    tt = Timetable()
+    n = side * side
+    tt.stop_ids = [f"C{s}" for s in range(n)]
+    tt.stop_index = {stop_id: s for s, stop_id in enumerate(tt.stop_ids)}
+    tt.stop_names = list(tt.stop_ids)
+    tt.route_ids, tt.route_short_names, tt.route_long_names = ["R"], ["R"], ["R"]
+    tt.calendar = ServiceCalendar(["daily"], DAY - timedelta(days=2), 8, np.array([[0xFF]], dtype=np.uint8))
+
+    trips = []
+    for line in range(lines):
+        x, y = rng.randrange(side), rng.randrange(side)
+        dx, dy = rng.choice([(1, 0), (-1, 0), (0, 1), (0, -1)])
+        stops, length = [x * side + y], rng.randint(20, 40)
+        while len(stops) < length:
+            if rng.random() < 0.3:
+                dx, dy = rng.choice([(dy, dx), (-dy, -dx)])
+            if not (0 <= x + dx < side and 0 <= y + dy < side) or (x + dx) * side + y + dy in stops:
+                dx, dy = -dx, -dy
+                if not (0 <= x + dx < side and 0 <= y + dy < side) or (x + dx) * side + y + dy in stops:
+                    break
+            x, y = x + dx, y + dy
+            stops.append(x * side + y)
+        offsets = [0]
+        for _ in stops[1:]:
+            offsets.append(offsets[-1] + rng.randint(60, 180))
+        headway = rng.randint(300, 1200)
+        if line % 2:
+            trips.append((stops, offsets, (5 * 3600, 23 * 3600, headway)))
+        else:
+            for start in range(5 * 3600 + rng.randrange(headway), 23 * 3600, headway):
+                trips.append((stops, [start + offset for offset in offsets], None))
+    tt.trip_ids = [f"T{i}" for i in range(len(trips))]
+    tt.trip_index = {trip_id: i for i, trip_id in enumerate(tt.trip_ids)}
+    tt.trip_headsigns = [None] * len(trips)
+    tt.trip_route = np.zeros(len(trips), dtype=np.int32)
+    tt.trip_service = np.zeros(len(trips), dtype=np.int32)
+    tt.trip_st_start = np.cumsum([0] + [len(stops) for stops, _, _ in trips]).astype(np.int64)
+    tt.st_stop = np.array([s for stops, _, _ in trips for s in stops], dtype=np.int32)
+    tt.st_arrival = np.array([t for _, times, _ in trips for t in times], dtype=np.int32)
+    tt.st_departure = tt.st_arrival.copy()
+    frequencies = [frequency for _, _, frequency in trips if frequency]
+    tt.trip_freq_start = np.cumsum([0] + [frequency is not None for _, _, frequency in trips]).astype(np.int64)
+    tt.freq_start = np.array([f[0] for f in frequencies], dtype=np.int32)
+    tt.freq_end = np.array([f[1] for f in frequencies], dtype=np.int32)
+    tt.freq_headway = np.array([f[2] for f in frequencies], dtype=np.int32)
+
+    pairs = []
+    for s in range(n):
+        x, y = divmod(s, side)
+        for dx in range(-2, 3):
+            for dy in range(-2, 3):
+                if (dx or dy) and 0 <= x + dx < side and 0 <= y + dy < side:
+                    pairs.append((s, (x + dx) * side + y + dy, int(200 * math.hypot(dx, dy) / 1.3)))
+    tt.set_footpaths(pairs)
+    return tt
+
+
+def test_plan_latency_on_a_city_sized_network():
+    """Borne de latence de /plan : p95 sous 100 ms sur un cœur, jusqu'à 4 correspondances."""
+    tt = city_timetable()
+    router = RaptorRouter(tt)
+    rng = random.Random(0)
+    depart_at = datetime.combine(DAY, datetime.min.time()) + timedelta(hours=8)
+    durations, reached = [], 0
+    for _ in range(200):
+        origin, target = rng.sample(tt.stop_ids, 2)
+        started = time.process_time()
+        itineraries = router.plan(origin, target, depart_at)
+        durations.append(time.process_time() - started)
+        reached += bool(itineraries)
+    durations.sort()
+    assert reached > 150  # Le réseau est connexe : la plupart des trajets aboutissent
+    assert durations[int(len(durations) * 0.95)] < 0.100
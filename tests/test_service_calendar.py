@@ -0,0 +1,91 @@
+# Calendrier compilé : les bitsets doivent donner, jour par jour, le même résultat que la
+# lecture directe de calendar + calendar_dates (exceptions comprises), y compris hors période.
+
+from datetime import date, timedelta
+
+import numpy as np
+
+import models
+from service_calendar import WEEKDAY_COLUMNS, ServiceCalendar, parse_gtfs_date
+
+WEEKDAYS = (1, 1, 1, 1, 1, 0, 0)
+WEEKEND = (0, 0, 0, 0, 0, 1, 1)
+
+
+def _calendar(service_id, days, start_date, end_date, feed_id="default"):
+    return models.Calendar(feed_id=feed_id, service_id=service_id, start_date=start_date, end_date=end_date,
+                           **dict(zip(WEEKDAY_COLUMNS, days)))
+
+
+# (service_id, jours, début, fin) et (service_id, date, exception_type)
+CALENDARS = [
+    ("SEM", WEEKDAYS, "20230501", "20230531"),
+    ("WE", WEEKEND, "20230506", "20230604"),
+]
+EXCEPTIONS = [
+    ("SEM", "20230501", 2),  # Jour férié
+    ("SEM", "20230508", 2),
+    ("SEM", "20230513", 1),  # Samedi travaillé
+    ("WE", "20230501", 1),  # Férié desservi comme un dimanche, avant le début du calendrier
+    ("WE", "20230604", 2),  # Dernier jour de validité retiré
+    ("FETE", "20230621", 1),  # Service défini uniquement par calendar_dates
+]
+
+
+def _rows(feed_id="default"):
+    return [_calendar(*spec, feed_id=feed_id) for spec in CALENDARS] + [
+        models.CalendarDate(feed_id=feed_id, service_id=service_id, date=day, exception_type=exception_type)
+        for service_id, day, exception_type in EXCEPTIONS
+    ]
+
+
+def reference_active(service_id: str, day: date) -> bool:
+    """Lecture directe des règles GTFS : l'exception l'emporte sur le calendrier."""
+    for exception_service, exception_day, exception_type in EXCEPTIONS:
+        if exception_service == service_id and parse_gtfs_date(exception_day) == day:
+            return exception_type == 1
+    for calendar_service, days, start_date, end_date in CALENDARS:
+        if calendar_service == service_id and parse_gtfs_date(start_date) <= day <= parse_gtfs_date(end_date):
+            return bool(days[day.weekday()])
+    return False
+
+
+def test_bitsets_match_calendar_and_exceptions(db):
+    db.add_all(_rows())
+    db.commit()
+    calendar = ServiceCalendar.from_db(db, "default")
+
+    assert calendar.start == date(2023, 5, 1) and calendar.end == date(2023, 6, 21)
+    assert calendar.bits.shape == (3, (calendar.n_days + 7) // 8)
+    day = calendar.start - timedelta(days=3)
+    while day <= calendar.end + timedelta(days=3):
+        expected = [reference_active(service_id, day) for service_id in calendar.service_ids]
+        assert calendar.active_mask(day).tolist() == expected, day
+        assert [calendar.is_active(i, day) for i in range(3)] == expected, day
+        assert calendar.active_services(day) == [s for s, on in zip(calendar.service_ids, expected) if on]
+        day += timedelta(days=1)
+
+
+def test_exceptions_override_weekdays(db):
+    db.add_all(_rows())
+    db.commit()
+    calendar = ServiceCalendar.from_db(db, "default")
+    assert calendar.active_services(date(2023, 5, 8)) == []  # Lundi férié, avant le début de WE
+    assert calendar.active_services(date(2023, 5, 13)) == ["SEM", "WE"]
+    assert calendar.active_services(date(2023, 5, 1)) == ["WE"]
+    assert calendar.active_services(date(2023, 6, 4)) == []
+    assert calendar.active_services(date(2023, 6, 21)) == ["FETE"]
+    assert not calendar.is_active(-1, date(2023, 5, 2))  # Service inconnu
+
+
+def test_calendars_are_read_per_feed(db):
+    db.add_all(_rows() + [_calendar("SEM", WEEKEND, "20230501", "20230531", feed_id="other")])
+    db.commit()
+    assert ServiceCalendar.from_db(db, "default").active_services(date(2023, 5, 2)) == ["SEM"]
+    assert ServiceCalendar.from_db(db, "other").active_services(date(2023, 5, 2)) == []
+
+
+def test_empty_feed_has_no_active_service():
+    calendar = ServiceCalendar.compile([], [])
+    assert calendar.n_days == 0 and calendar.active_mask(date(2023, 5, 2)).dtype == np.bool_
+    assert calendar.active_services(date(2023, 5, 2)) == []
@@ -0,0 +1,118 @@
+# Déduplication des tracés : un tracé n'est fusionné que si sa distance de Hausdorff au
+# canonique reste sous la tolérance (et pas s'il est inversé ou plus court), et le tracé
+# canonique est celui qui sert le plus de trajets.
+
+import numpy as np
+import pytest
+
+import models
+from shape_dedup import dedup_shapes, find_duplicates, hausdorff_distance
+from shapes import ShapeIndex, cumulative_distances
+
+METRES_PER_DEGREE = 6371000.0 * np.pi / 180  # Degré de latitude, en mètres
+
+# Couloir est-ouest de ~2,3 km (50 points), à 45° N
+BASE_LAT = np.full(50, 45.0)
+BASE_LON = np.linspace(5.0, 5.03, 50)
+
+
+def shifted(metres):
+    """Le couloir décalé de `metres` vers le nord."""
+    return BASE_LAT + metres / METRES_PER_DEGREE, BASE_LON
+
+
+def with_detour(metres):
+    """Le couloir avec un seul sommet écarté de `metres` en son milieu."""
+    lat = BASE_LAT.copy()
+    lat[25] += metres / METRES_PER_DEGREE
+    return lat, BASE_LON
+
+
+def make_index(shapes):
+    shape_ids = list(shapes)
+    sizes = [len(shapes[s][0]) for s in shape_ids]
+    shape_start = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    lat = np.concatenate([shapes[s][0] for s in shape_ids])
+    lon = np.concatenate([shapes[s][1] for s in shape_ids])
+    sequence = np.concatenate([np.arange(n) for n in sizes])
+    return ShapeIndex(shape_ids, shape_start, lat, lon, sequence, cumulative_distances(shape_start, lat, lon))
+
+
+@pytest.mark.parametrize("metres", [0.0, 3.0, 9.0, 25.0])
+def test_hausdorff_of_a_parallel_shape_is_the_offset(metres):
+    assert hausdorff_distance(BASE_LAT, BASE_LON, *shifted(metres)) == pytest.approx(metres, abs=0.05)
+
+
+def test_hausdorff_is_symmetric_and_vertex_to_segment():
+    # Mêmes rues, points intermédiaires différents : pas d'écart
+    resampled = np.linspace(5.0, 5.03, 17)
+    assert hausdorff_distance(BASE_LAT, BASE_LON, np.full(17, 45.0), resampled) == pytest.approx(0.0, abs=1e-6)
+    a = hausdorff_distance(BASE_LAT, BASE_LON, *with_detour(40.0))
+    b = hausdorff_distance(*with_detour(40.0), BASE_LAT, BASE_LON)
+    assert a == pytest.approx(b) == pytest.approx(40.0, abs=0.05)
+    assert hausdorff_distance(BASE_LAT, BASE_LON, *with_detour(40.0), limit=10.0) > 10.0
+
+
+@pytest.mark.parametrize("tolerance, expected", [
+    (0.0, {"exact"}),
+    (10.0, {"exact", "near_5m", "detour_8m"}),
+    (20.0, {"exact", "near_5m", "detour_8m", "near_15m"}),
+])
+def test_duplicates_follow_the_tolerance(tolerance, expected):
+    repeated_lat = np.insert(BASE_LAT, 10, BASE_LAT[10])  # Point répété : même empreinte
+    repeated_lon = np.insert(BASE_LON, 10, BASE_LON[10])
+    shapes = make_index({
+        "base": (BASE_LAT, BASE_LON),
+        "exact": (repeated_lat, repeated_lon),
+        "near_5m": shifted(5.0),
+        "near_15m": shifted(15.0),
+        "detour_8m": with_detour(8.0),
+        "detour_30m": with_detour(30.0),
+        "reversed": (BASE_LAT[::-1], BASE_LON[::-1]),
+        "shorter": (BASE_LAT[:40], BASE_LON[:40]),
+        "elsewhere": (BASE_LAT + 0.01, BASE_LON),
+    })
+    mapping, exact = find_duplicates(shapes, {"base": 10}, tolerance)
+    assert set(mapping) == expected
+    assert set(mapping.values()) == {"base"}
+    assert exact == 1
+
+
+def test_canonical_is_the_most_used_shape():
+    shapes = make_index({"a": shifted(2.0), "b": (BASE_LAT, BASE_LON), "c": shifted(4.0)})
+    mapping, _ = find_duplicates(shapes, {"a": 1, "b": 5, "c": 2}, 10.0)
+    assert mapping == {"a": "b", "c": "b"}
+
+
+def _load(db):
+    shapes = {"base": (BASE_LAT, BASE_LON), "near": shifted(5.0), "far": shifted(50.0)}
+    for shape_id, (lat, lon) in shapes.items():
+        db.add_all(
+            models.Shape(feed_id="default", shape_id=shape_id, shape_pt_sequence=k, shape_pt_lat=a, shape_pt_lon=o)
+            for k, (a, o) in enumerate(zip(lat.tolist(), lon.tolist()))
+        )
+    db.add_all([
+        models.Trip(feed_id="default", trip_id=f"T{k}", route_id="R", service_id="S", shape_id=shape_id)
+        for k, shape_id in enumerate(["base", "base", "near", "far"])
+    ] + [
+        models.Pattern(feed_id="default", pattern_id="R:1", route_id="R", shape_id="near", stop_count=2, trip_count=1),
+    ])
+    db.commit()
+
+
+def test_dedup_remaps_trips_and_patterns(db):
+    _load(db)
+    report = dedup_shapes(db, "default", tolerance=10.0)
+    assert report["mapping"] == {"near": "base"}
+    assert (report["near_duplicates"], report["trips_remapped"], report["points_removed"]) == (1, 1, 50)
+    assert {t.trip_id: t.shape_id for t in db.query(models.Trip)} == {"T0": "base", "T1": "base", "T2": "base", "T3": "far"}
+    assert db.get(models.Pattern, ("default", "R:1")).shape_id == "base"
+    assert {s for (s,) in db.query(models.Shape.shape_id).distinct()} == {"base", "far"}
+
+
+def test_dry_run_leaves_the_feed_untouched(db):
+    _load(db)
+    report = dedup_shapes(db, "default", tolerance=10.0, apply=False)
+    assert report["mapping"] == {"near": "base"}
+    assert db.query(models.Shape).count() == 150
+    assert db.query(models.Trip).filter_by(shape_id="near").count() == 1
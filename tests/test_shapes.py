@@ -0,0 +1,65 @@
+# Référencement linéaire : arrêts sans coordonnées ignorés par trip_segments, et distances
+# écrites en base par build_shape_distances (chemin SQLite, UPDATE par lot).
+
+import json
+from types import SimpleNamespace
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import models
+from shapes import ShapeIndex, build_shape_distances, trip_segments
+
+STOPS = {
+    "A": SimpleNamespace(stop_lat=45.0, stop_lon=5.0),
+    "B": SimpleNamespace(stop_lat=None, stop_lon=None),  # Zone sans position (flux incomplet)
+    "C": SimpleNamespace(stop_lat=45.0, stop_lon=5.01),
+}
+
+
+def _stop_times(distances=(None, None, None)):
+    return [
+        SimpleNamespace(trip_id="T", stop_id=stop_id, stop_sequence=k + 1, departure_time=None, arrival_time=None,
+                        shape_dist_traveled=dist)
+        for k, (stop_id, dist) in enumerate(zip("ABC", distances))
+    ]
+
+
+def test_straight_segments_skip_stops_without_coordinates():
+    segments = trip_segments(_stop_times(), STOPS, None)
+    assert [(s["from_stop_id"], s["to_stop_id"]) for s in segments] == [("A", "C")]
+    assert 780 < segments[0]["distance"] < 800
+    json.dumps(segments, allow_nan=False)
+
+
+def test_projected_segments_skip_stops_without_coordinates():
+    points = (np.array([45.0, 45.0]), np.array([4.99, 5.02]), np.array([0.0, 2360.0]))
+    segments = trip_segments(_stop_times(), STOPS, points)
+    assert [(s["from_stop_id"], s["to_stop_id"]) for s in segments] == [("A", "C")]
+    assert np.allclose(segments[0]["geometry"]["coordinates"], [[5.0, 45.0], [5.01, 45.0]])
+
+
+def test_build_shape_distances_fills_stop_times(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'shapes.db'}")
+    models.Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.add_all([
+            models.Stop(feed_id="f", stop_id="A", stop_name="A", stop_lat=45.0, stop_lon=5.0),
+            models.Stop(feed_id="f", stop_id="C", stop_name="C", stop_lat=45.0, stop_lon=5.01),
+            models.Trip(feed_id="f", trip_id="T", route_id="R", service_id="S", shape_id="SH"),
+        ] + [
+            models.Shape(feed_id="f", shape_id="SH", shape_pt_sequence=k, shape_pt_lat=45.0, shape_pt_lon=lon)
+            for k, lon in enumerate((5.0, 5.005, 5.01))
+        ] + [
+            models.StopTime(feed_id="f", trip_id="T", stop_id=stop_id, stop_sequence=k)
+            for k, stop_id in enumerate("AC")
+        ])
+        db.commit()
+
+        assert build_shape_distances(db, "f") == 2
+        distances = [st.shape_dist_traveled for st in db.query(models.StopTime).order_by(models.StopTime.stop_sequence)]
+        shape = ShapeIndex.from_db(db, "f")
+    engine.dispose()
+    assert distances[0] == 0.0 and 780 < distances[1] < 800
+    assert np.allclose(shape.dist, [0.0, distances[1] / 2, distances[1]], rtol=1e-3)
@@ -0,0 +1,143 @@
+# Single-flight : les GET identiques simultanés partagent la réponse du premier ; si ce
+# premier échoue ou est annulé, chaque requête en attente exécute la sienne.
+
+import asyncio
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+import singleflight
+from singleflight import SingleFlightMiddleware, exempt
+
+
+class Handler:
+    """Handler qui attend `release` avant de répondre ; le premier appel peut échouer."""
+
+    def __init__(self, fail_first=False):
+        self.calls = 0
+        self.fail_first = fail_first
+        self.release = asyncio.Event()
+
+    async def __call__(self, request):
+        self.calls += 1
+        call = self.calls
+        await self.release.wait()
+        if self.fail_first and call == 1:
+            raise RuntimeError("database went away")
+        return JSONResponse({"call": call})
+
+
+def make_app(handler):
+    async def stops(request):
+        return await handler(request)
+
+    @exempt
+    async def stream(request):
+        return await handler(request)
+
+    inner = Starlette(routes=[Route("/stops", stops), Route("/stream", stream)])
+    return inner, SingleFlightMiddleware(inner)
+
+
+async def get(inner, app, path="/stops", accept_encoding="gzip"):
+    scope = {
+        "type": "http", "method": "GET", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": [(b"accept-encoding", accept_encoding.encode())], "app": inner,
+        "scheme": "http", "server": ("test", 80), "http_version": "1.1",
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages[0]["status"], b"".join(m.get("body", b"") for m in messages[1:])
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.fixture(autouse=True)
+def counters(monkeypatch):
+    monkeypatch.setattr(singleflight, "_counters", {"leaders": 0, "coalesced": 0, "fallbacks": 0})
+    monkeypatch.setattr(singleflight, "_in_flight", {})
+
+
+def test_identical_requests_share_one_execution():
+    async def scenario():
+        handler = Handler()
+        inner, app = make_app(handler)
+        tasks = [asyncio.create_task(get(inner, app)) for _ in range(10)]
+        await settle()
+        handler.release.set()
+        return handler, await asyncio.gather(*tasks)
+
+    handler, responses = asyncio.run(scenario())
+    assert handler.calls == 1
+    assert set(responses) == {(200, b'{"call":1}')}
+    assert singleflight.get_stats() == {"in_flight": 0, "leaders": 1, "coalesced": 9, "fallbacks": 0}
+
+
+def test_followers_fall_back_when_the_leader_fails():
+    async def scenario():
+        handler = Handler(fail_first=True)
+        inner, app = make_app(handler)
+        leader = asyncio.create_task(get(inner, app))
+        await settle()
+        followers = [asyncio.create_task(get(inner, app)) for _ in range(3)]
+        await settle()
+        handler.release.set()
+        with pytest.raises(RuntimeError):
+            await leader
+        return handler, await asyncio.gather(*followers)
+
+    handler, responses = asyncio.run(scenario())
+    # Chaque requête en attente a ré-exécuté le handler, sans nouveau regroupement
+    assert handler.calls == 4
+    assert sorted(responses) == [(200, b'{"call":%d}' % n) for n in (2, 3, 4)]
+    assert singleflight.get_stats() == {"in_flight": 0, "leaders": 1, "coalesced": 0, "fallbacks": 3}
+
+
+def test_followers_fall_back_when_the_leader_is_cancelled():
+    async def scenario():
+        handler = Handler()
+        inner, app = make_app(handler)
+        leader = asyncio.create_task(get(inner, app))
+        await settle()
+        follower = asyncio.create_task(get(inner, app))
+        await settle()
+        leader.cancel()
+        await settle()
+        handler.release.set()
+        return await follower
+
+    assert asyncio.run(scenario()) == (200, b'{"call":2}')
+    assert singleflight.get_stats()["fallbacks"] == 1
+    # La requête annulée ne reste pas en cours : la suivante sera leader
+    assert singleflight.get_stats()["in_flight"] == 0
+
+
+def test_exempt_and_distinct_requests_are_not_coalesced():
+    async def scenario():
+        handler = Handler()
+        inner, app = make_app(handler)
+        tasks = [
+            asyncio.create_task(get(inner, app, "/stream")),
+            asyncio.create_task(get(inner, app, "/stream")),
+            asyncio.create_task(get(inner, app, accept_encoding="gzip")),
+            asyncio.create_task(get(inner, app, accept_encoding="br")),
+        ]
+        await settle()
+        handler.release.set()
+        await asyncio.gather(*tasks)
+        return handler
+
+    assert asyncio.run(scenario()).calls == 4
+    assert singleflight.get_stats()["coalesced"] == 0
@@ -0,0 +1,47 @@
+# Requêtes lentes : plans capturés pour les lectures (SELECT, WITH) seulement, et une
+# requête en échec ne laisse pas son heure de départ sur la connexion.
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+import slow_queries
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    """Enregistreur actif (seuil 0 : tout est lent) le temps du test, tampon vide."""
+    monkeypatch.setattr(slow_queries, "_buffer", slow_queries.deque(maxlen=10))
+    monkeypatch.setattr(slow_queries, "_pending", 0)
+    previous = slow_queries._threshold
+    slow_queries.enable(0)
+    yield
+    if previous is None:
+        event.remove(Engine, "before_cursor_execute", slow_queries._before_cursor_execute)
+        event.remove(Engine, "after_cursor_execute", slow_queries._after_cursor_execute)
+        event.remove(Engine, "handle_error", slow_queries._handle_error)
+    slow_queries._threshold = previous
+
+
+def _plans():
+    slow_queries._explainer.submit(lambda: None).result()  # Attend les EXPLAIN en cours
+    return {" ".join(entry["statement"].split()): entry["plan"] for entry in slow_queries.get_slow_queries()}
+
+
+def test_only_reads_are_explained(db, recorder):
+    db.execute(text("  with s as (select stop_id from stops) select count(*) from s"))
+    db.execute(text("SELECT count(*) FROM agencies"))
+    db.execute(text("UPDATE stops SET stop_name = 'x' WHERE 0"))
+    plans = _plans()
+    assert "SCAN" in plans["with s as (select stop_id from stops) select count(*) from s"]
+    assert "SCAN" in plans["SELECT count(*) FROM agencies"]
+    assert plans["UPDATE stops SET stop_name = 'x' WHERE 0"] is None
+
+
+def test_failed_query_does_not_leak_its_start(db, recorder):
+    connection = db.connection()
+    with pytest.raises(OperationalError):
+        connection.execute(text("SELECT * FROM no_such_table"))
+    assert connection.info.get("slow_query_start") == []
+    db.rollback()
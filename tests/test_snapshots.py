@@ -0,0 +1,79 @@
+# Instantanés statiques : toutes les pages des listes sont exportées, les identifiants
+# contenant "/" restent un seul dossier, et le middleware retrouve la version exportée.
+
+import json
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import models
+import query_cache
+from snapshots import PAGE_SIZE, SnapshotMiddleware, export_snapshots, version_dirname
+
+N_STOPS = 250
+
+
+@pytest.fixture
+def snapshot_client(client, tmp_path, monkeypatch):
+    """Instantané d'un flux de N_STOPS arrêts (même version que la base de l'API), servi par le middleware."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'feed.db'}")
+    models.Base.metadata.create_all(engine)
+    monkeypatch.setattr(query_cache.query_cache, "max_bytes", 0)  # Pas de mélange avec le cache de l'API
+    with Session(engine) as db:
+        db.add_all([
+            models.Feed(feed_id="default"),
+            models.FeedInfo(feed_id="default", feed_publisher_name="Test", feed_publisher_url="https://example.org",
+                            feed_lang="fr", feed_version="v1"),
+            models.Stop(feed_id="default", stop_id="a", stop_name="A", stop_lat=45.0, stop_lon=5.0),
+            models.Stop(feed_id="default", stop_id="a/routes", stop_name="Slash", stop_lat=45.0, stop_lon=5.0),
+            models.Stop(feed_id="default", stop_id="x/y", stop_name="Slash", stop_lat=45.0, stop_lon=5.0),
+        ] + [
+            models.Stop(feed_id="default", stop_id=f"P{i:03d}", stop_name=f"Arrêt {i}", stop_lat=45.0, stop_lon=5.0)
+            for i in range(N_STOPS - 3)
+        ])
+        db.commit()
+        target = export_snapshots(db, str(tmp_path / "www"))
+    engine.dispose()
+    assert os.path.basename(target) == version_dirname(query_cache.feed_version())
+
+    import main
+    middleware = SnapshotMiddleware(main.app, root=str(tmp_path / "www"))
+
+    async def app(scope, receive, send):
+        scope["app"] = main.app  # Posé par l'application englobante dans la vraie pile
+        await middleware(scope, receive, send)
+
+    return TestClient(app)
+
+
+def test_every_page_is_served(snapshot_client):
+    ids = []
+    for skip in range(0, N_STOPS, PAGE_SIZE):
+        response = snapshot_client.get("/stops/", params={"skip": skip, "limit": PAGE_SIZE})
+        assert response.status_code == 200
+        ids += [stop["stop_id"] for stop in response.json()]
+    assert len(ids) == len(set(ids)) == N_STOPS
+    assert snapshot_client.get("/stops/").json() == snapshot_client.get("/stops/?skip=0&limit=100").json()
+
+
+def test_encoded_page_matches_identity(snapshot_client):
+    plain = snapshot_client.get("/stops/?skip=200", headers={"Accept-Encoding": "identity"})
+    gzipped = snapshot_client.get("/stops/?skip=200", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert json.loads(plain.content) == gzipped.json() and len(plain.json()) == N_STOPS - 200
+
+
+def test_ids_with_slash_do_not_collide(snapshot_client):
+    assert snapshot_client.get("/stops/x/y").json()["stop_id"] == "x/y"
+    assert snapshot_client.get("/stops/a").json()["stop_id"] == "a"
+    # Comme dans l'API, /stops/a/routes désigne les routes de "a" : la fiche de l'arrêt
+    # "a/routes" ne doit pas avoir écrasé cette liste
+    assert snapshot_client.get("/stops/a/routes").json() == []
+
+
+def test_other_queries_fall_through_to_the_api(snapshot_client):
+    # Page hors pagination exportée : répondue par l'API (base de conftest, un seul arrêt)
+    assert [stop["stop_id"] for stop in snapshot_client.get("/stops/?limit=50").json()] == ["S1"]
@@ -0,0 +1,103 @@
+# Regroupement des arrêts en stations : rayon, ressemblance des noms et plafond du diamètre
+# (2 x rayon) d'une station, puis écriture des stations générées dans la base.
+
+import math
+
+import numpy as np
+import pytest
+
+import models
+from stations import STATION_PREFIX, build_stations, cluster_stops, name_similarity, normalize_name
+
+METRES_PER_DEGREE = 6371000.0 * math.pi / 180
+
+
+def place(metres_east, metres_north=0.0, lat0=45.0, lon0=5.0):
+    """Coordonnées d'un point à (est, nord) mètres de (lat0, lon0)."""
+    return lat0 + metres_north / METRES_PER_DEGREE, lon0 + metres_east / (METRES_PER_DEGREE * math.cos(math.radians(lat0)))
+
+
+def cluster(stops, radius=100.0, similarity=0.8):
+    """stops : [(stop_id, nom, est, nord)] -> groupes de stop_id."""
+    coords = [place(east, north) for _, _, east, north in stops]
+    groups = cluster_stops([s[0] for s in stops], [s[1] for s in stops],
+                           np.array([c[0] for c in coords]), np.array([c[1] for c in coords]), radius, similarity)
+    return [[stops[k][0] for k in members] for members in groups]
+
+
+def test_names_are_normalized_and_numbers_must_match():
+    assert normalize_name("  Hôtel-de-Ville (Quai A) ") == "hotel de ville quai a"
+    assert name_similarity("gare part dieu", "gare part dieu") == 1.0
+    assert name_similarity("gare part dieu", "gare de part dieu") >= 0.8
+    assert name_similarity("campus 1", "campus 2") == 0.0
+    assert name_similarity("", "gare") == 0.0
+
+
+def test_both_sides_of_a_street_become_one_station():
+    assert cluster([
+        ("A1", "Mairie", 0, 0),
+        ("A2", "Mairie ", 0, 25),
+        ("A3", "MAIRIE", 40, 10),
+        ("B1", "Poste", 10, 0),  # Tout proche, mais autre nom
+        ("C1", "Mairie", 500, 0),  # Même nom, trop loin
+        ("D1", "Campus 1", 0, 60),
+        ("D2", "Campus 2", 5, 60),
+    ]) == [["A1", "A2", "A3"]]
+
+
+@pytest.mark.parametrize("radius", [50.0, 100.0])
+def test_a_street_of_homonyms_is_capped_at_twice_the_radius(radius):
+    # Arrêts homonymes tous les 0,6 x rayon le long d'une avenue de 3 km
+    spacing = 0.6 * radius
+    stops = [(f"S{k:02d}", "Avenue Jean Jaurès", k * spacing, 0) for k in range(int(3000 // spacing))]
+    groups = cluster(stops, radius=radius)
+    grouped = [stop_id for group in groups for stop_id in group]
+    assert len(grouped) == len(set(grouped))
+    assert len(groups) > 1
+    for group in groups:
+        positions = [int(stop_id[1:]) * spacing for stop_id in group]
+        assert max(positions) - min(positions) <= 2 * radius
+        assert len(group) <= 2 * radius // spacing + 1
+
+
+def test_radius_bounds_each_pair():
+    stops = [("A", "Gare", 0, 0), ("B", "Gare", 90, 0)]
+    assert cluster(stops, radius=100.0) == [["A", "B"]]
+    assert cluster(stops, radius=80.0) == []
+
+
+def _stop(stop_id, name, east, north=0.0, **columns):
+    lat, lon = place(east, north)
+    return models.Stop(feed_id="default", stop_id=stop_id, stop_name=name, stop_lat=lat, stop_lon=lon, **columns)
+
+
+def test_build_stations_replaces_generated_stations(db):
+    db.add_all([
+        _stop("A1", "Mairie", 0), _stop("A2", "Mairie", 0, 30),
+        _stop("B1", "Gare", 300), _stop("B2", "Gare", 300, 30, parent_station="GARE"),  # Station du flux : conservée
+        models.Stop(feed_id="default", stop_id="GARE", stop_name="Gare", stop_lat=45.0, stop_lon=5.004, location_type=1),
+        _stop("Z1", "Zoo", 900),
+    ])
+    db.commit()
+
+    stations = build_stations(db, "default", radius=100.0)
+    assert [(s["stop_id"], s["stop_ids"]) for s in stations] == [(f"{STATION_PREFIX}A1", ["A1", "A2"])]
+    station = db.get(models.Stop, ("default", f"{STATION_PREFIX}A1"))
+    assert station.location_type == 1 and station.stop_name == "Mairie"
+    assert station.stop_lat == pytest.approx(place(0, 15)[0], abs=1e-6)
+    parents = {s.stop_id: s.parent_station for s in db.query(models.Stop)}
+    assert parents["A1"] == parents["A2"] == f"{STATION_PREFIX}A1"
+    assert parents["B2"] == "GARE" and parents["B1"] is None
+
+    # Nouveau passage plus strict : l'ancienne station générée disparaît
+    assert build_stations(db, "default", radius=20.0) == []
+    assert db.get(models.Stop, ("default", f"{STATION_PREFIX}A1")) is None
+    assert db.get(models.Stop, ("default", "A1")).parent_station is None
+
+
+def test_dry_run_and_zero_radius(db):
+    db.add_all([_stop("A1", "Mairie", 0), _stop("A2", "Mairie", 0, 30)])
+    db.commit()
+    assert len(build_stations(db, "default", radius=100.0, apply=False)) == 1
+    assert db.query(models.Stop).count() == 2
+    assert build_stations(db, "default", radius=0.0) == []
@@ -0,0 +1,142 @@
+# Validation du flux : un flux volontairement cassé doit produire exactement les constats
+# attendus (contrôle, nombre de lignes, numéros de ligne), et le flux livré aucun.
+
+import os
+
+import pytest
+
+import validate
+from validate import ERROR, WARNING, validate_feed
+
+BROKEN_FEED = {
+    "agency.txt": "agency_id,agency_name\nA,Agence\nB,Autre\n",
+    "stops.txt": (
+        "stop_id,stop_name,stop_lat,stop_lon,location_type,parent_station\n"
+        "S1,Gare,45.0,5.0,,ST\n"
+        "S2,Mairie,95.0,5.0,0,\n"          # Latitude hors plage
+        "S2,Doublon,45.0,5.0,0,\n"         # stop_id en double
+        "S3,Sans position,,5.0,0,\n"       # stop_lat manquante
+        "ST,Station,45.0,5.0,1,S1\n"       # Une station n'a pas de parent_station (qui n'est pas une station)
+        "S4,Quai,45.0,5.0,0,S1\n"          # Parent qui n'est pas une station
+        "E1,Entrée,,,3,ST\n"               # Nœud générique : coordonnées facultatives
+    ),
+    "routes.txt": "route_id,agency_id,route_type\nR1,A,3\nR2,Z,3\nR3,A,42\n",
+    "trips.txt": (
+        "trip_id,route_id,service_id,shape_id,direction_id\n"
+        "T1,R1,SEM,SH1,0\n"
+        "T2,R9,SEM,SH1,2\n"                # Route inconnue, direction_id invalide
+        "T3,R1,NOPE,SH9,1\n"               # Service et tracé inconnus
+        "T4,R1,SEM,,0\n"                   # Aucun horaire
+    ),
+    "stop_times.txt": (
+        "trip_id,stop_id,stop_sequence,arrival_time,departure_time,pickup_type,drop_off_type,shape_dist_traveled\n"
+        "T1,S1,1,08:00:00,08:00:00,0,0,0\n"
+        "T1,S2,2,08:10:00,08:09:00,0,0,500\n"   # Départ avant l'arrivée
+        "T1,S3,3,08:05:00,08:06:00,0,0,400\n"   # Heure et distance qui reculent
+        "T1,S4,3,08:20:00,08:20:00,0,0,900\n"   # stop_sequence en double
+        "T2,S1,1,,,0,0,\n"                      # Premier arrêt sans horaire
+        "T2,SX,2,8h30,08:30:00,9,0,\n"          # Arrêt inconnu, heure illisible, pickup_type hors plage
+        "T2,S2,3,08:40:00,08:40:00,0,0,\n"
+        "TX,S1,1,08:00:00,08:00:00,0,0,\n"      # Trajet inconnu
+        "T3,S1,1,09:00:00,09:00:00,0,0,\n"
+        "T3,S2,2,09:10:00,09:10:00,0,0,\n"
+    ),
+    "calendar.txt": (
+        "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date\n"
+        "SEM,1,1,1,1,1,0,0,20230601,20230501\n"  # Fin avant le début
+        "WE,0,0,0,0,0,1,2,20230501,20231332\n"   # sunday = 2, date impossible
+    ),
+    "calendar_dates.txt": "service_id,date,exception_type\nSEM,20230508,2\nSEM,20230508,1\nWE,20230510,3\n",
+    "shapes.txt": (
+        "shape_id,shape_pt_lat,shape_pt_lon,shape_pt_sequence,shape_dist_traveled\n"
+        "SH1,45.0,5.0,1,0\n"
+        "SH1,45.0,5.1,2,100\n"
+        "SH1,45.0,5.2,3,50\n"               # Distance qui recule
+    ),
+    "frequencies.txt": "trip_id,start_time,end_time,headway_secs\nT1,10:00:00,09:00:00,600\nT9,06:00:00,07:00:00,0\n",
+    "transfers.txt": "from_stop_id,to_stop_id,transfer_type\nS1,S2,2\nS1,S2,2\nS1,SX,7\n",
+}
+
+# contrôle -> (gravité, nombre de lignes, lignes des exemples)
+EXPECTED = {
+    "stops.txt:stop_id:duplicate": (ERROR, 1, [4]),
+    "stops.txt:stop_lat:range": (ERROR, 1, [3]),
+    "stops.txt:stop_lat:missing": (ERROR, 1, [5]),
+    "stops.txt:parent_station:type": (ERROR, 2, [6, 7]),
+    "stops.txt:parent_station:station": (ERROR, 1, [6]),
+    "routes.txt:agency_id:reference": (ERROR, 1, [3]),
+    "routes.txt:route_type:range": (ERROR, 1, [4]),
+    "trips.txt:route_id:reference": (ERROR, 1, [3]),
+    "trips.txt:service_id:reference": (ERROR, 1, [4]),
+    "trips.txt:shape_id:reference": (ERROR, 1, [4]),
+    "trips.txt:direction_id:range": (ERROR, 1, [3]),
+    "stop_times.txt:trip_id:reference": (ERROR, 1, [9]),
+    "stop_times.txt:stop_id:reference": (ERROR, 1, [7]),
+    "stop_times.txt:pickup_type:range": (ERROR, 1, [7]),
+    "stop_times.txt:arrival_time:format": (ERROR, 1, [7]),
+    "stop_times.txt:departure_time:before_arrival": (ERROR, 1, [3]),
+    "stop_times.txt:(trip_id, stop_sequence):duplicate": (ERROR, 1, [5]),
+    "stop_times.txt:time:decreasing": (ERROR, 2, [3, 4]),
+    "stop_times.txt:shape_dist_traveled:decreasing": (ERROR, 1, [4]),
+    "stop_times.txt:time:terminal": (ERROR, 1, [6]),
+    "trips.txt:stop_times:missing": (WARNING, 1, [5]),
+    "calendar.txt:sunday:range": (ERROR, 1, [3]),
+    "calendar.txt:end_date:format": (ERROR, 1, [3]),
+    "calendar.txt:end_date:before_start": (ERROR, 1, [2]),
+    "calendar_dates.txt:exception_type:range": (ERROR, 1, [4]),
+    "calendar_dates.txt:(service_id, date):duplicate": (ERROR, 1, [3]),
+    "shapes.txt:shape_dist_traveled:decreasing": (ERROR, 1, [4]),
+    "frequencies.txt:trip_id:reference": (ERROR, 1, [3]),
+    "frequencies.txt:end_time:before_start": (ERROR, 1, [2]),
+    "frequencies.txt:headway_secs:range": (ERROR, 1, [3]),
+    "transfers.txt:to_stop_id:reference": (ERROR, 1, [4]),
+    "transfers.txt:transfer_type:range": (ERROR, 1, [4]),
+    "transfers.txt:(from_stop_id, to_stop_id):duplicate": (ERROR, 1, [3]),
+}
+
+
+def write_feed(directory, files):
+    for filename, content in files.items():
+        (directory / filename).write_text(content, encoding="utf-8")
+    return str(directory)
+
+
+@pytest.fixture(params=["numpy", "csv"])
+def broken_feed(request, tmp_path, monkeypatch):
+    """Flux cassé, lu par le découpage NumPy ou (guillemets) par csv.reader, en petits blocs."""
+    monkeypatch.setattr(validate, "READ_BLOCK", 64)  # Lignes coupées entre deux blocs
+    files = dict(BROKEN_FEED)
+    if request.param == "csv":
+        files["stops.txt"] = files["stops.txt"].replace("Gare", '"Gare, quai 1"')
+    return write_feed(tmp_path, files)
+
+
+def test_broken_feed_findings(broken_feed):
+    report = validate_feed(broken_feed)
+    findings = {
+        f["check"]: (f["severity"], f["count"], [e["line"] for e in f["examples"]])
+        for f in report.findings
+    }
+    assert findings == EXPECTED
+    assert not report.valid
+    assert report.warnings == 1 and report.errors == sum(c for s, c, _ in EXPECTED.values() if s == ERROR)
+    assert report.rows["stop_times.txt"] == 10
+
+
+def test_examples_carry_the_offending_value(broken_feed):
+    findings = {f["check"]: f for f in validate_feed(broken_feed).findings}
+    assert findings["stop_times.txt:stop_id:reference"]["examples"] == [{"line": 7, "value": "SX"}]
+    assert findings["stop_times.txt:arrival_time:format"]["examples"] == [{"line": 7, "value": "8h30"}]
+
+
+def test_missing_files(tmp_path):
+    report = validate_feed(write_feed(tmp_path, {"agency.txt": BROKEN_FEED["agency.txt"]}))
+    missing = {f["check"] for f in report.findings}
+    assert missing == {f"{name}:missing" for name in ("stops.txt", "routes.txt", "trips.txt", "stop_times.txt", "calendar.txt")}
+    assert all(f["examples"] == [] for f in report.findings)
+
+
+@pytest.mark.skipif(not os.path.isdir(validate.DATA_DIR), reason="flux livré absent")
+def test_shipped_feed_is_valid():
+    report = validate_feed()
+    assert report.valid and report.warnings == 0, report.findings
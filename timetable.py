@@ -0,0 +1,416 @@
+# timetable.py
+# Index des horaires GTFS en mémoire, construit une seule fois depuis la base.
+# Les requêtes "temps réel" (prochains départs, etc.) sont servies depuis ces
+# tableaux sans jamais parcourir la table stop_times.
+
+import os
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+import models
+import query_cache
+from feeds import DEFAULT_FEED_ID
+from footpaths import DEFAULT_RADIUS, walk_seconds, walking_pairs
+from service_calendar import ServiceCalendar
+
+SECONDS_PER_DAY = 24 * 3600
+
+# Dossier des instantanés binaires de l'index (timetable_snapshot.py) : si défini, l'index
+# est écrit une fois par version du flux puis projeté en mémoire par chaque processus
+TIMETABLE_SNAPSHOT_DIR = os.getenv("TIMETABLE_SNAPSHOT_DIR")
+
+
+# --- Fonctions d'aide pour les formats GTFS ---
+def parse_gtfs_time(value: Optional[str]) -> int:
+    """Convertit 'HH:MM:SS' (heures > 24 autorisées) en secondes. -1 si absent."""
+    if not value:
+        return -1
+    hours, minutes, seconds = value.strip().split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def format_gtfs_time(seconds: int) -> str:
+    """Convertit un nombre de secondes depuis minuit en 'HH:MM:SS'."""
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class Timetable:
+    """
+    Horaires du flux GTFS sous forme de tableaux compacts (format CSR).
+
+    - Les stop_times de chaque trajet sont contigus : les lignes du trajet t sont
+      dans [trip_st_start[t], trip_st_start[t + 1]).
+    - L'index inversé arrêt -> (trajet, ligne de stop_times) suit le même principe
+      avec stop_ev_start, ev_trip et ev_row.
+    - Les fréquences de chaque trajet sont dans [trip_freq_start[t], trip_freq_start[t + 1]).
+    - Les correspondances à pied (transfers) depuis l'arrêt s sont dans
+      [stop_fp_start[s], stop_fp_start[s + 1]) : arrêt d'arrivée fp_stop, durée fp_secs.
+    """
+
+    def __init__(self):
+        self.feed_id: str = DEFAULT_FEED_ID
+        self.timezone: Optional[str] = None
+        self.snapshot_path: Optional[str] = None  # Instantané projeté en mémoire, le cas échéant
+
+        self.stop_ids: List[str] = []
+        self.stop_index: Dict[str, int] = {}
+        self.stop_names: List[Optional[str]] = []
+        self.stop_lat = np.zeros(0, dtype=np.float64)
+        self.stop_lon = np.zeros(0, dtype=np.float64)
+
+        self.route_ids: List[str] = []
+        self.route_index: Dict[str, int] = {}
+        self.route_short_names: List[Optional[str]] = []
+        self.route_long_names: List[Optional[str]] = []
+
+        self.calendar = ServiceCalendar([], date.min, 0, np.zeros((0, 0), dtype=np.uint8))
+
+        self.trip_ids: List[str] = []
+        self.trip_index: Dict[str, int] = {}
+        self.trip_headsigns: List[Optional[str]] = []
+        self.trip_route = np.zeros(0, dtype=np.int32)
+        self.trip_service = np.zeros(0, dtype=np.int32)
+
+        self.trip_st_start = np.zeros(1, dtype=np.int64)
+        self.st_stop = np.zeros(0, dtype=np.int32)
+        self.st_sequence = np.zeros(0, dtype=np.int32)
+        self.st_arrival = np.zeros(0, dtype=np.int32)
+        self.st_departure = np.zeros(0, dtype=np.int32)
+        self.st_pickup_type = np.zeros(0, dtype=np.int8)
+
+        self.trip_freq_start = np.zeros(1, dtype=np.int64)
+        self.freq_start = np.zeros(0, dtype=np.int32)
+        self.freq_end = np.zeros(0, dtype=np.int32)
+        self.freq_headway = np.zeros(0, dtype=np.int32)
+
+        self.stop_ev_start = np.zeros(1, dtype=np.int64)
+        self.ev_trip = np.zeros(0, dtype=np.int32)
+        self.ev_row = np.zeros(0, dtype=np.int64)
+
+        self.stop_fp_start = np.zeros(1, dtype=np.int64)
+        self.fp_stop = np.zeros(0, dtype=np.int32)
+        self.fp_secs = np.zeros(0, dtype=np.int32)
+
+    def __reduce_ex__(self, protocol):
+        # Index projeté depuis un instantané : les processus fils (pool de calcul des
+        # matrices) le rouvrent au lieu d'en recevoir une copie
+        if self.snapshot_path is not None:
+            from timetable_snapshot import open_snapshot
+            return open_snapshot, (self.snapshot_path,)
+        return super().__reduce_ex__(protocol)
+
+    # --- Construction ---
+    @classmethod
+    def from_db(cls, db: Session, feed_id: str = DEFAULT_FEED_ID) -> "Timetable":
+        tt = cls()
+        tt.feed_id = feed_id
+
+        agency = db.query(models.Agency.agency_timezone).filter(models.Agency.feed_id == feed_id).first()
+        tt.timezone = agency.agency_timezone if agency else None
+
+        stops = (
+            db.query(models.Stop.stop_id, models.Stop.stop_name, models.Stop.stop_lat, models.Stop.stop_lon)
+            .filter(models.Stop.feed_id == feed_id)
+            .all()
+        )
+        tt.stop_ids = [s.stop_id for s in stops]
+        tt.stop_index = {stop_id: i for i, stop_id in enumerate(tt.stop_ids)}
+        tt.stop_names = [s.stop_name for s in stops]
+        tt.stop_lat = np.array([s.stop_lat or 0.0 for s in stops], dtype=np.float64)
+        tt.stop_lon = np.array([s.stop_lon or 0.0 for s in stops], dtype=np.float64)
+
+        routes = (
+            db.query(models.Route.route_id, models.Route.route_short_name, models.Route.route_long_name)
+            .filter(models.Route.feed_id == feed_id)
+            .all()
+        )
+        tt.route_ids = [r.route_id for r in routes]
+        tt.route_index = {route_id: i for i, route_id in enumerate(tt.route_ids)}
+        tt.route_short_names = [r.route_short_name for r in routes]
+        tt.route_long_names = [r.route_long_name for r in routes]
+
+        tt.calendar = ServiceCalendar.from_db(db, feed_id)
+
+        trips = (
+            db.query(models.Trip.trip_id, models.Trip.route_id, models.Trip.service_id, models.Trip.trip_headsign)
+            .filter(models.Trip.feed_id == feed_id)
+            .all()
+        )
+        tt.trip_ids = [t.trip_id for t in trips]
+        tt.trip_index = {trip_id: i for i, trip_id in enumerate(tt.trip_ids)}
+        tt.trip_headsigns = [t.trip_headsign for t in trips]
+        tt.trip_route = np.array([tt.route_index.get(t.route_id, -1) for t in trips], dtype=np.int32)
+        tt.trip_service = np.array([tt.calendar.service_index.get(t.service_id, -1) for t in trips], dtype=np.int32)
+
+        tt._load_stop_times(db)
+        tt._load_frequencies(db)
+        tt._build_stop_index()
+        tt._load_transfers(db)
+        return tt
+
+    def _load_stop_times(self, db: Session):
+        rows = (
+            db.query(
+                models.StopTime.trip_id,
+                models.StopTime.stop_id,
+                models.StopTime.stop_sequence,
+                models.StopTime.arrival_time,
+                models.StopTime.departure_time,
+                models.StopTime.pickup_type,
+            )
+            .filter(models.StopTime.feed_id == self.feed_id)
+            .order_by(models.StopTime.trip_id, models.StopTime.stop_sequence)
+            .all()
+        )
+        # Les lignes sont regroupées par trajet ; on les range dans l'ordre des trajets.
+        per_trip: Dict[int, list] = {}
+        for row in rows:
+            trip_idx = self.trip_index.get(row.trip_id)
+            stop_idx = self.stop_index.get(row.stop_id)
+            if trip_idx is None or stop_idx is None:
+                continue
+            per_trip.setdefault(trip_idx, []).append(row)
+
+        counts = np.zeros(len(self.trip_ids) + 1, dtype=np.int64)
+        stops, sequences, arrivals, departures, pickups = [], [], [], [], []
+        for trip_idx in range(len(self.trip_ids)):
+            trip_rows = per_trip.get(trip_idx, [])
+            counts[trip_idx + 1] = len(trip_rows)
+            last_time = 0
+            for row in trip_rows:
+                arrival = parse_gtfs_time(row.arrival_time)
+                departure = parse_gtfs_time(row.departure_time)
+                # Heures manquantes (arrêts non "timepoint") : on reprend la dernière heure connue
+                if arrival < 0:
+                    arrival = departure if departure >= 0 else last_time
+                if departure < 0:
+                    departure = arrival
+                last_time = departure
+                stops.append(self.stop_index[row.stop_id])
+                sequences.append(row.stop_sequence)
+                arrivals.append(arrival)
+                departures.append(departure)
+                pickups.append(row.pickup_type or 0)
+
+        self.trip_st_start = np.cumsum(counts)
+        self.st_stop = np.array(stops, dtype=np.int32)
+        self.st_sequence = np.array(sequences, dtype=np.int32)
+        self.st_arrival = np.array(arrivals, dtype=np.int32)
+        self.st_departure = np.array(departures, dtype=np.int32)
+        self.st_pickup_type = np.array(pickups, dtype=np.int8)
+
+    def _load_frequencies(self, db: Session):
+        per_trip: Dict[int, list] = {}
+        frequencies = (
+            db.query(models.Frequency)
+            .filter(models.Frequency.feed_id == self.feed_id)
+            .order_by(models.Frequency.trip_id, models.Frequency.start_time)
+            .all()
+        )
+        for freq in frequencies:
+            trip_idx = self.trip_index.get(freq.trip_id)
+            if trip_idx is None or not freq.headway_secs:
+                continue
+            per_trip.setdefault(trip_idx, []).append(
+                (parse_gtfs_time(freq.start_time), parse_gtfs_time(freq.end_time), freq.headway_secs)
+            )
+
+        counts = np.zeros(len(self.trip_ids) + 1, dtype=np.int64)
+        windows = []
+        for trip_idx in range(len(self.trip_ids)):
+            trip_windows = sorted(per_trip.get(trip_idx, []))
+            counts[trip_idx + 1] = len(trip_windows)
+            windows.extend(trip_windows)
+
+        self.trip_freq_start = np.cumsum(counts)
+        self.freq_start = np.array([w[0] for w in windows], dtype=np.int32)
+        self.freq_end = np.array([w[1] for w in windows], dtype=np.int32)
+        self.freq_headway = np.array([w[2] for w in windows], dtype=np.int32)
+
+    def _build_stop_index(self):
+        # Index inversé arrêt -> lignes de stop_times, trié par arrêt (tri stable)
+        rows = np.argsort(self.st_stop, kind="stable").astype(np.int64)
+        counts = np.bincount(self.st_stop, minlength=len(self.stop_ids))
+        self.stop_ev_start = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.ev_row = rows
+        row_trip = np.repeat(np.arange(len(self.trip_ids), dtype=np.int32), np.diff(self.trip_st_start))
+        self.ev_trip = row_trip[rows] if len(rows) else np.zeros(0, dtype=np.int32)
+
+    def _load_transfers(self, db: Session):
+        transfers = db.query(models.Transfer).filter(models.Transfer.feed_id == self.feed_id).all()
+        if not transfers:
+            # Ni transfers.txt ni correspondances générées : on calcule les marches en mémoire
+            self.set_footpaths(self.walking_footpaths())
+            return
+        pairs = []
+        for tr in transfers:
+            from_idx = self.stop_index.get(tr.from_stop_id)
+            to_idx = self.stop_index.get(tr.to_stop_id)
+            # transfer_type 3 = correspondance impossible
+            if from_idx is None or to_idx is None or from_idx == to_idx or tr.transfer_type == 3:
+                continue
+            pairs.append((from_idx, to_idx, tr.min_transfer_time or 0))
+        self.set_footpaths(pairs)
+
+    def walking_footpaths(self, radius: float = DEFAULT_RADIUS) -> List[tuple]:
+        """Correspondances à pied (arrêt départ, arrêt arrivée, secondes) entre arrêts proches."""
+        i, j, distance = walking_pairs(self.stop_lat, self.stop_lon, radius)
+        return list(zip(i.tolist(), j.tolist(), walk_seconds(distance).tolist()))
+
+    def set_footpaths(self, pairs: List[tuple]):
+        """Remplace les correspondances à pied par la liste (arrêt départ, arrêt arrivée, secondes)."""
+        pairs = sorted(pairs)
+        counts = np.bincount([p[0] for p in pairs], minlength=len(self.stop_ids)) if pairs else np.zeros(len(self.stop_ids), dtype=np.int64)
+        self.stop_fp_start = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.fp_stop = np.array([p[1] for p in pairs], dtype=np.int32)
+        self.fp_secs = np.array([p[2] for p in pairs], dtype=np.int32)
+
+    # --- Calendrier ---
+    def active_trips(self, day: date) -> np.ndarray:
+        """Tableau booléen indexé par trajet : True si le service du trajet circule ce jour-là."""
+        # Un service inconnu (indice -1) tombe sur le False ajouté en fin de masque
+        mask = np.append(self.calendar.active_mask(day), False)
+        return mask[self.trip_service]
+
+    # --- Requêtes ---
+    def local_time(self, at: Optional[datetime] = None) -> datetime:
+        """Ramène `at` (ou maintenant) à l'heure locale naïve du flux (fuseau de l'agence)."""
+        tz = ZoneInfo(self.timezone) if self.timezone else None
+        if at is None:
+            return datetime.now(tz).replace(tzinfo=None)
+        if at.tzinfo is not None and tz is not None:
+            return at.astimezone(tz).replace(tzinfo=None)
+        return at.replace(tzinfo=None)
+
+    def departures(self, stop_id: str, at: datetime, window_secs: int, limit: int, overlay=None) -> Optional[List[dict]]:
+        """
+        Prochains départs à un arrêt entre `at` et `at + window_secs`.
+        Les trajets à fréquence sont déroulés selon leurs intervalles de passage.
+        `overlay` (realtime.DelayOverlay) ajoute les retards annoncés en temps réel.
+        Retourne None si l'arrêt est inconnu.
+        """
+        stop_idx = self.stop_index.get(stop_id)
+        if stop_idx is None:
+            return None
+
+        at_secs = at.hour * 3600 + at.minute * 60 + at.second
+        results = []
+        # Un jour de service peut déborder après minuit (heures GTFS > 24:00:00)
+        for day_offset in (-1, 0, 1):
+            service_day = at.date() + timedelta(days=day_offset)
+            lo = at_secs - day_offset * SECONDS_PER_DAY
+            hi = lo + window_secs
+            if hi < 0:
+                continue
+            midnight = datetime.combine(service_day, datetime.min.time())
+            active = self.active_trips(service_day)
+            for ev in range(self.stop_ev_start[stop_idx], self.stop_ev_start[stop_idx + 1]):
+                trip_idx = int(self.ev_trip[ev])
+                row = int(self.ev_row[ev])
+                first_row = int(self.trip_st_start[trip_idx])
+                if row == int(self.trip_st_start[trip_idx + 1]) - 1 or self.st_pickup_type[row] == 1:
+                    continue  # Terminus ou montée interdite
+                if not active[trip_idx]:
+                    continue
+                for departure, frequency_based in self._trip_departures(trip_idx, row, first_row, lo, hi):
+                    results.append((departure, day_offset, trip_idx, row, frequency_based, midnight))
+
+        results.sort(key=lambda r: (r[1] * SECONDS_PER_DAY + r[0], r[2]))
+        return [self._departure_dict(*r, overlay=overlay) for r in results[:limit]]
+
+    def _trip_departures(self, trip_idx: int, row: int, first_row: int, lo: int, hi: int):
+        freq_lo, freq_hi = int(self.trip_freq_start[trip_idx]), int(self.trip_freq_start[trip_idx + 1])
+        if freq_lo == freq_hi:
+            departure = int(self.st_departure[row])
+            if lo <= departure <= hi:
+                yield departure, False
+            return
+        offset = int(self.st_departure[row]) - int(self.st_departure[first_row])
+        for f in range(freq_lo, freq_hi):
+            start, end, headway = int(self.freq_start[f]), int(self.freq_end[f]), int(self.freq_headway[f])
+            k = max(0, -(-(lo - offset - start) // headway))  # ceil
+            trip_start = start + k * headway
+            while trip_start < end and trip_start + offset <= hi:
+                yield trip_start + offset, True
+                trip_start += headway
+
+    def _departure_dict(self, departure: int, day_offset: int, trip_idx: int, row: int, frequency_based: bool, midnight: datetime, overlay=None) -> dict:
+        route_idx = int(self.trip_route[trip_idx])
+        result = {
+            "trip_id": self.trip_ids[trip_idx],
+            "route_id": self.route_ids[route_idx] if route_idx >= 0 else None,
+            "route_short_name": self.route_short_names[route_idx] if route_idx >= 0 else None,
+            "route_long_name": self.route_long_names[route_idx] if route_idx >= 0 else None,
+            "trip_headsign": self.trip_headsigns[trip_idx],
+            "service_date": midnight.date(),
+            "departure_time": format_gtfs_time(departure),
+            "departure": midnight + timedelta(seconds=departure),
+            "frequency_based": frequency_based,
+        }
+        # Les trajets à fréquence sont identifiés par leur heure de départ en GTFS-RT : non couverts
+        trip_delays = overlay.trip_delays(self.trip_ids[trip_idx], midnight.date()) if overlay is not None and not frequency_based else None
+        if trip_delays is not None:
+            position = row - int(self.trip_st_start[trip_idx])
+            delay = trip_delays.departure_delay(position)
+            result["canceled"] = trip_delays.is_canceled(position)
+            result["delay"] = delay
+            if delay is not None:
+                result["realtime_departure"] = result["departure"] + timedelta(seconds=delay)
+        return result
+
+
+# --- Instances partagées par l'application, une par flux servi ---
+_timetables: Dict[str, Timetable] = {}
+_timetable_lock = threading.Lock()
+
+
+def load_timetable(db: Session, feed_id: str = DEFAULT_FEED_ID) -> Timetable:
+    """(Re)construit l'index en mémoire d'un flux depuis la base et le rend disponible à l'API."""
+    tt = Timetable.from_db(db, feed_id)
+    with _timetable_lock:
+        _timetables[feed_id] = tt
+    query_cache.invalidate()  # Rechargement terminé : les lectures mémoïsées sont périmées
+    return tt
+
+
+def get_timetable(feed_id: str = DEFAULT_FEED_ID) -> Timetable:
+    """Index d'un flux, construit au premier appel pour ce flux."""
+    tt = _timetables.get(feed_id)
+    if tt is None:
+        from db import ReadSessionLocal # Import tardif : ce module est aussi utilisé hors de l'API (scripts de chargement)
+        with _timetable_lock:
+            tt = _timetables.get(feed_id)
+            if tt is None:
+                db = ReadSessionLocal()
+                try:
+                    tt = _load_shared(db, feed_id) if TIMETABLE_SNAPSHOT_DIR else Timetable.from_db(db, feed_id)
+                finally:
+                    db.close()
+                _timetables[feed_id] = tt
+    return tt
+
+
+def _load_shared(db: Session, feed_id: str) -> Timetable:
+    """
+    Index de la version courante depuis son instantané. Le premier processus qui ne le
+    trouve pas le construit et l'écrit, sous verrou : les autres attendent puis le projettent.
+    """
+    import fcntl
+    from timetable_snapshot import is_current, open_snapshot, snapshot_path, write_snapshot
+
+    version = query_cache.feed_version()
+    if version is None:
+        return Timetable.from_db(db, feed_id)  # Sans feed_version, rien ne distingue deux flux : pas d'instantané
+    path = snapshot_path(TIMETABLE_SNAPSHOT_DIR, version, feed_id)
+    if not is_current(path):
+        os.makedirs(TIMETABLE_SNAPSHOT_DIR, exist_ok=True)
+        with open(path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not is_current(path):
+                write_snapshot(Timetable.from_db(db, feed_id), path)
+    return open_snapshot(path)
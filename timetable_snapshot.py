@@ -0,0 +1,242 @@
+# timetable_snapshot.py
+# Instantané binaire de l'index horaire (Timetable), partagé entre les processus de l'API.
+# Avec plusieurs workers uvicorn, chaque processus construisait sa propre copie des
+# tableaux depuis la base. L'instantané est écrit une fois par version du flux, puis
+# chaque worker le projette en mémoire (mmap, lecture seule) : les pages du cache
+# système sont partagées entre processus et le démarrage se réduit à un mmap.
+#
+# Format : en-tête "GTFSTT03" + longueur (uint64) + JSON (flux, fuseau, calendrier et, pour
+# chaque tableau, dtype / forme / position), puis les tableaux, alignés sur 64 octets.
+# Une liste de chaînes est stockée en tableau d'octets UTF-8 + positions (int64) + marque
+# des valeurs nulles ; les identifiants ont en plus une permutation triée, pour retrouver
+# leur indice par dichotomie sans construire de dict dans chaque processus.
+#
+# Utilisation : python timetable_snapshot.py --out /var/cache/gtfs-timetable
+
+import argparse
+import json
+import mmap
+import os
+from collections.abc import Mapping, Sequence
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from feeds import DEFAULT_FEED_ID
+from service_calendar import ServiceCalendar
+from snapshots import version_dirname
+from timetable import Timetable
+
+MAGIC = b"GTFSTT03"  # Change avec le format : un ancien instantané est réécrit
+ALIGNMENT = 64
+
+# Tableaux NumPy de Timetable, écrits tels quels
+ARRAY_FIELDS = (
+    "stop_lat", "stop_lon",
+    "trip_route", "trip_service",
+    "trip_st_start", "st_stop", "st_sequence", "st_arrival", "st_departure", "st_pickup_type",
+    "trip_freq_start", "freq_start", "freq_end", "freq_headway",
+    "stop_ev_start", "ev_trip", "ev_row",
+    "stop_fp_start", "fp_stop", "fp_secs",
+)
+# Listes de chaînes ; celles qui servent de clé ont un index (nom de l'attribut dict)
+STRING_FIELDS = {
+    "stop_ids": "stop_index",
+    "stop_names": None,
+    "route_ids": "route_index",
+    "route_short_names": None,
+    "route_long_names": None,
+    "trip_ids": "trip_index",
+    "trip_headsigns": None,
+}
+
+
+class StringTable(Sequence):
+    """Liste de chaînes en lecture seule, lue directement dans l'instantané."""
+
+    def __init__(self, buffer: mmap.mmap, base: int, offsets: np.ndarray, nulls: np.ndarray):
+        self._buffer = buffer
+        self._base = base  # Position des octets UTF-8 dans le fichier
+        self._offsets = offsets
+        self._nulls = nulls
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def raw(self, i: int) -> bytes:
+        return self._buffer[self._base + int(self._offsets[i]):self._base + int(self._offsets[i + 1])]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return None if self._nulls[i] else self.raw(i).decode("utf-8")
+
+
+class StringIndex(Mapping):
+    """Chaîne -> indice dans une StringTable, par dichotomie sur une permutation triée."""
+
+    def __init__(self, table: StringTable, order: np.ndarray):
+        self._table = table
+        self._order = order
+
+    def __getitem__(self, key: str) -> int:
+        if not isinstance(key, str):
+            raise KeyError(key)
+        target = key.encode("utf-8")
+        lo, hi = 0, len(self._order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._table.raw(int(self._order[mid])) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._order) and self._table.raw(int(self._order[lo])) == target:
+            return int(self._order[lo])
+        raise KeyError(key)
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._table)
+
+
+# --- Écriture ---
+def _encode_strings(values: List[Optional[str]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[bytes]]:
+    encoded = [value.encode("utf-8") if value is not None else b"" for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    nulls = np.array([value is None for value in values], dtype=np.uint8)
+    return data, offsets, nulls, encoded
+
+
+def write_snapshot(tt: Timetable, path: str) -> str:
+    """Écrit l'instantané de `tt` dans `path` (remplacement atomique). Retourne le chemin."""
+    arrays: Dict[str, np.ndarray] = {name: getattr(tt, name) for name in ARRAY_FIELDS}
+    arrays["calendar.bits"] = tt.calendar.bits
+    string_fields = dict(STRING_FIELDS, **{"calendar.service_ids": None})
+    for name, index in string_fields.items():
+        values = tt.calendar.service_ids if name == "calendar.service_ids" else getattr(tt, name)
+        data, offsets, nulls, encoded = _encode_strings(list(values))
+        arrays[f"{name}.data"] = data
+        arrays[f"{name}.offsets"] = offsets
+        arrays[f"{name}.nulls"] = nulls
+        if index is not None:
+            arrays[f"{name}.order"] = np.array(sorted(range(len(encoded)), key=encoded.__getitem__), dtype=np.int64)
+
+    layout = {}
+    position = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": position}
+        position += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps({
+        "feed_id": tt.feed_id,
+        "timezone": tt.timezone,
+        "calendar": {"start": tt.calendar.start.isoformat(), "n_days": tt.calendar.n_days},
+        "arrays": layout,
+    }).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    staging = f"{path}.{os.getpid()}.tmp"
+    with open(staging, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + position)
+    os.replace(staging, path)
+    return path
+
+
+# --- Lecture ---
+def is_current(path: str) -> bool:
+    """True si `path` existe et a été écrit dans le format actuel."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except FileNotFoundError:
+        return False
+
+
+def open_snapshot(path: str) -> Timetable:
+    """Projette l'instantané en mémoire (lecture seule) et retourne un Timetable qui s'appuie dessus."""
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} n'est pas un instantané d'index horaire")
+    header_length = int.from_bytes(buffer[len(MAGIC):len(MAGIC) + 8], "little")
+    header = json.loads(buffer[len(MAGIC) + 8:len(MAGIC) + 8 + header_length])
+    data_start = -(-(len(MAGIC) + 8 + header_length) // ALIGNMENT) * ALIGNMENT
+
+    def array(name: str) -> np.ndarray:
+        spec = header["arrays"][name]
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"]))
+        return np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + spec["offset"]).reshape(spec["shape"])
+
+    def strings(name: str) -> StringTable:
+        base = data_start + header["arrays"][f"{name}.data"]["offset"]
+        return StringTable(buffer, base, array(f"{name}.offsets"), array(f"{name}.nulls"))
+
+    tt = Timetable()
+    tt.feed_id = header["feed_id"]
+    tt.timezone = header["timezone"]
+    for name in ARRAY_FIELDS:
+        setattr(tt, name, array(name))
+    for name, index in STRING_FIELDS.items():
+        table = strings(name)
+        setattr(tt, name, table)
+        if index is not None:
+            setattr(tt, index, StringIndex(table, array(f"{name}.order")))
+    calendar = header["calendar"]
+    tt.calendar = ServiceCalendar(
+        strings("calendar.service_ids"), date.fromisoformat(calendar["start"]), calendar["n_days"], array("calendar.bits"),
+    )
+    tt.snapshot_path = path
+    return tt
+
+
+def snapshot_path(directory: str, version: str, feed_id: str = DEFAULT_FEED_ID) -> str:
+    # Un instantané par flux servi et par version des flux chargés
+    return os.path.join(directory, f"timetable-{version_dirname(f'{feed_id}@{version}')}.bin")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Écrit l'instantané binaire de l'index horaire, partagé par les workers de l'API.")
+    parser.add_argument("--out", default=os.getenv("TIMETABLE_SNAPSHOT_DIR"), required=os.getenv("TIMETABLE_SNAPSHOT_DIR") is None,
+                        help="Dossier des instantanés (TIMETABLE_SNAPSHOT_DIR)")
+    parser.add_argument("--version", help="Nom de version (par défaut feed_info.feed_version)")
+    args = parser.parse_args()
+
+    from db import ReadSessionLocal
+    import query_cache
+    db_session = ReadSessionLocal()
+    try:
+        version = args.version or query_cache.feed_version()
+        if not version:
+            raise ValueError("feed_info.feed_version est vide : indiquez --version")
+        print("Building timetable...")
+        tt = Timetable.from_db(db_session)
+        os.makedirs(args.out, exist_ok=True)
+        path = write_snapshot(tt, snapshot_path(args.out, version))
+        print(f"Timetable snapshot written to {path} ({os.path.getsize(path)} bytes).")
+    except Exception as e:
+        print(f"An error occurred while writing the timetable snapshot: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        db_session.close()
+
+
+if __name__ == "__main__":
+    main()
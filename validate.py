@@ -0,0 +1,476 @@
+# validate.py
+# Validation du flux GTFS avant chargement. Sans elle, une référence cassée n'apparaît
+# qu'au moment où PostgreSQL rejette une ligne, en plein seeding. Les fichiers sont lus
+# en colonnes (tableaux NumPy), puis chaque contrôle est une opération vectorisée :
+# appartenance d'ensembles (np.isin) pour les références, masques pour les plages de
+# valeurs, tri (trip_id, stop_sequence) puis différences pour la monotonie des horaires.
+#
+# Le rapport liste, par contrôle, le nombre de lignes fautives et quelques exemples
+# (numéro de ligne dans le fichier, valeur). Une erreur bloque le chargement (seed.py),
+# un avertissement non.
+#
+# Utilisation : python validate.py [--data data/] [--json rapport.json]
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+MAX_EXAMPLES = 5
+READ_BLOCK = 16 * 1024 * 1024  # Octets lus et découpés à la fois
+_SEPARATOR_TO_NUL = np.arange(256, dtype=np.uint8)
+_SEPARATOR_TO_NUL[[ord(","), ord("\n")]] = 0
+
+ERROR = "error"
+WARNING = "warning"
+
+# Colonnes lues dans chaque fichier (les autres ne sont pas contrôlées)
+COLUMNS = {
+    "agency.txt": ("agency_id",),
+    "stops.txt": ("stop_id", "stop_lat", "stop_lon", "location_type", "parent_station"),
+    "routes.txt": ("route_id", "agency_id", "route_type"),
+    "trips.txt": ("trip_id", "route_id", "service_id", "shape_id", "direction_id"),
+    "stop_times.txt": ("trip_id", "stop_id", "stop_sequence", "arrival_time", "departure_time",
+                       "pickup_type", "drop_off_type", "shape_dist_traveled"),
+    "calendar.txt": ("service_id", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+                     "start_date", "end_date"),
+    "calendar_dates.txt": ("service_id", "date", "exception_type"),
+    "shapes.txt": ("shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence", "shape_dist_traveled"),
+    "frequencies.txt": ("trip_id", "start_time", "end_time", "headway_secs"),
+    "transfers.txt": ("from_stop_id", "to_stop_id", "transfer_type"),
+}
+DAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+# route_type de base (0-7, 11, 12) et types étendus (100-1702)
+BASIC_ROUTE_TYPES = np.array([0, 1, 2, 3, 4, 5, 6, 7, 11, 12])
+
+
+class ValidationReport:
+    """Résultats des contrôles : un enregistrement par contrôle en échec."""
+
+    def __init__(self):
+        self.findings: List[dict] = []
+        self.rows: Dict[str, int] = {}  # Lignes lues par fichier
+
+    def add(self, check: str, filename: str, severity: str, message: str, rows: np.ndarray, values: Optional[np.ndarray] = None) -> None:
+        """Enregistre `rows` (indices des lignes fautives, 0 = première ligne de données)."""
+        if len(rows) == 0:
+            return
+        examples = []
+        for i, row in enumerate(rows[:MAX_EXAMPLES]):
+            if row < 0:
+                continue  # Fichier entier en cause, pas de ligne
+            example = {"line": int(row) + 2}  # + en-tête, numérotation à partir de 1
+            if values is not None:
+                value = values[i]
+                example["value"] = value.decode("utf-8", "replace") if isinstance(value, bytes) else str(value)
+            examples.append(example)
+        self.findings.append({
+            "check": check, "file": filename, "severity": severity, "message": message,
+            "count": int(len(rows)), "examples": examples,
+        })
+
+    @property
+    def errors(self) -> int:
+        return sum(finding["count"] for finding in self.findings if finding["severity"] == ERROR)
+
+    @property
+    def warnings(self) -> int:
+        return sum(finding["count"] for finding in self.findings if finding["severity"] == WARNING)
+
+    @property
+    def valid(self) -> bool:
+        return self.errors == 0
+
+    def to_dict(self) -> dict:
+        return {"valid": self.valid, "errors": self.errors, "warnings": self.warnings, "rows": self.rows, "findings": self.findings}
+
+    def print_summary(self) -> None:
+        print(f"Validation: {self.errors} errors, {self.warnings} warnings over {sum(self.rows.values())} rows.")
+        for finding in self.findings:
+            examples = ", ".join(
+                f"line {e['line']}" + (f" ({e['value']})" if "value" in e else "") for e in finding["examples"]
+            )
+            print(f"  [{finding['severity']}] {finding['file']}: {finding['message']} - {finding['count']} rows (e.g. {examples})")
+
+
+# --- Lecture en colonnes ---
+def _fixed_width(data: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Champs data[starts:ends] en tableau d'octets de largeur fixe (dtype S)."""
+    width = max(int((ends - starts).max(initial=0)), 1)
+    offsets = np.arange(width, dtype=np.int32)  # Blocs de READ_BLOCK octets : int32 suffit
+    # Au-delà de sa fin, un champ répète son séparateur, remplacé par l'octet nul de bourrage
+    index = np.minimum(starts.astype(np.int32)[:, None] + offsets, ends.astype(np.int32)[:, None])
+    chars = _SEPARATOR_TO_NUL[data[index]]
+    fields = chars.view(f"S{width}").ravel()
+    if (chars == ord(" ")).any():  # Espaces rares : on ne nettoie que si besoin
+        fields = np.char.strip(fields)
+    return fields
+
+
+def _split_block(block: bytes, positions: Dict[str, int], width: int) -> Dict[str, np.ndarray]:
+    """Découpe un bloc de lignes complètes ; csv.reader si guillemets ou lignes irrégulières."""
+    data = np.frombuffer(block, dtype=np.uint8)
+    separators = np.flatnonzero((data == ord(",")) | (data == ord("\n")))
+    if b'"' not in block and len(separators) % width == 0:
+        ends = separators.reshape(-1, width)
+        starts = np.empty_like(ends)
+        starts[0, 0] = 0
+        starts[1:, 0] = ends[:-1, -1] + 1
+        starts[:, 1:] = ends[:, :-1] + 1
+        return {name: _fixed_width(data, starts[:, k], ends[:, k]) for name, k in positions.items()}
+    values: Dict[str, list] = {name: [] for name in positions}
+    for row in csv.reader(io.StringIO(block.decode("utf-8"))):
+        if not row:
+            continue
+        for name, k in positions.items():
+            values[name].append(row[k].strip().encode("utf-8") if k < len(row) else b"")
+    return {name: np.array(column, dtype=bytes) if column else np.zeros(0, dtype="S1") for name, column in values.items()}
+
+
+def read_columns(path: str, columns: Iterable[str]) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Colonnes demandées d'un fichier GTFS, en tableaux d'octets UTF-8 (b"" si absente ou
+    vide). Le fichier est lu par blocs de lignes entières, découpés par NumPy.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        header_line = f.readline().decode("utf-8-sig")
+        header = [name.strip() for name in next(csv.reader([header_line]), [])]
+        positions = {name: header.index(name) for name in columns if name in header}
+        chunks: Dict[str, List[np.ndarray]] = {name: [] for name in positions}
+        n_rows = 0
+        rest = b""  # Début de ligne coupé par la fin du bloc précédent
+        while True:
+            block = f.read(READ_BLOCK)
+            if block:
+                block = rest + block
+                cut = block.rfind(b"\n") + 1
+                block, rest = block[:cut], block[cut:]
+            elif rest:
+                block, rest = rest + b"\n", b""  # Dernière ligne sans fin de ligne
+            else:
+                break
+            block = block.replace(b"\r", b"")
+            if block.startswith(b"\n") or b"\n\n" in block:
+                block = b"".join(line + b"\n" for line in block.split(b"\n") if line.strip())
+            if not block:
+                continue
+            split = _split_block(block, positions, len(header))
+            for name in positions:
+                chunks[name].append(split[name])
+            n_rows += len(split[next(iter(positions))]) if positions else block.count(b"\n")
+    table = {name: np.concatenate(parts) if parts else np.zeros(0, dtype="S1") for name, parts in chunks.items()}
+    for name in columns:
+        table.setdefault(name, np.zeros(n_rows, dtype="S1"))
+    return table
+
+
+def parse_numbers(column: np.ndarray, dtype) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(valeurs, présentes, invalides) d'une colonne numérique ; les cases vides valent 0."""
+    present = column != b""
+    values = np.zeros(len(column), dtype=dtype)
+    invalid = np.zeros(len(column), dtype=bool)
+    try:
+        values[present] = column[present].astype(dtype)
+    except ValueError:
+        # Au moins une valeur illisible : conversion case par case pour la repérer
+        for i in np.flatnonzero(present):
+            try:
+                values[i] = dtype(column[i])
+            except ValueError:
+                invalid[i] = True
+    return values, present & ~invalid, invalid
+
+
+def parse_times(column: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(secondes depuis minuit, présentes, invalides) d'une colonne HH:MM:SS (heures > 24 admises)."""
+    present = column != b""
+    well_sized = np.ones(len(column), dtype=bool) if column.itemsize <= 8 else np.char.str_len(column) <= 8
+    codes = column.astype("S8").view(np.uint8).reshape(-1, 8).astype(np.int16) - ord("0")
+    short = codes[:, 7] == -ord("0")  # 7 caractères au plus : "7:05:00" -> "07:05:00"
+    if short.any():
+        codes[short, 1:] = codes[short, :7]
+        codes[short, 0] = 0
+    separators = (codes[:, 2] == ord(":") - ord("0")) & (codes[:, 5] == ord(":") - ord("0"))
+    digits = np.all((codes[:, [0, 1, 3, 4, 6, 7]] >= 0) & (codes[:, [0, 1, 3, 4, 6, 7]] <= 9), axis=1)
+    minutes = codes[:, 3] * 10 + codes[:, 4]
+    seconds = codes[:, 6] * 10 + codes[:, 7]
+    ok = well_sized & separators & digits & (minutes < 60) & (seconds < 60)
+    hours = codes[:, 0].astype(np.int64) * 10 + codes[:, 1]
+    values = np.where(ok, hours * 3600 + minutes * 60 + seconds, 0)
+    return values, present & ok, present & ~ok
+
+
+def parse_dates(column: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(dates datetime64[D], invalides) d'une colonne YYYYMMDD."""
+    well_sized = np.char.str_len(column) == 8
+    digits = column.astype("S8").view(np.uint8).reshape(-1, 8).astype(np.int64) - ord("0")
+    ok = well_sized & np.all((digits >= 0) & (digits <= 9), axis=1)
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 4] * 10 + digits[:, 5]
+    day = digits[:, 6] * 10 + digits[:, 7]
+    ok &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+    months = np.where(ok, (year - 1970) * 12 + month - 1, 0).astype("datetime64[M]")
+    dates = months.astype("datetime64[D]") + np.where(ok, day - 1, 0)
+    ok &= dates.astype("datetime64[M]") == months  # 31 avril, 29 février hors année bissextile...
+    return dates, ~ok
+
+
+def factorize(column: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(valeurs distinctes triées, code de chaque ligne) ; np.unique sans tri des lignes."""
+    if len(column) > 1:
+        # Fichiers groupés par identifiant (stop_times par trajet, shapes par tracé) : une
+        # valeur par suite de lignes identiques suffit
+        starts = np.flatnonzero(column[1:] != column[:-1]) + 1
+        if len(starts) < len(column) // 4:
+            starts = np.concatenate([[0], starts])
+            uniques, run_codes = factorize(column[starts])
+            return uniques, np.repeat(run_codes, np.diff(np.append(starts, len(column))))
+    uniques = np.unique(column)
+    return uniques, np.searchsorted(uniques, column)
+
+
+# --- Contrôles ---
+def _check_reference(report: ValidationReport, filename: str, column: str, values: np.ndarray,
+                     targets: np.ndarray, target_name: str, required: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """Chaque valeur non vide doit figurer dans `targets` ; retourne la factorisation de `values`."""
+    present = values != b""
+    if required:
+        report.add(f"{filename}:{column}:missing", filename, ERROR, f"{column} is empty", np.flatnonzero(~present))
+    uniques, codes = factorize(values)
+    found = np.isin(uniques, targets)  # Sur les valeurs distinctes seulement
+    rows = np.flatnonzero(present & ~found[codes])
+    report.add(f"{filename}:{column}:reference", filename, ERROR, f"{column} not found in {target_name}", rows, values[rows])
+    return uniques, codes
+
+
+def _check_unique(report: ValidationReport, filename: str, label: str, *keys: np.ndarray, order: Optional[np.ndarray] = None) -> None:
+    """Doublons de la clé `keys` ; `order` : tri des lignes par cette clé, s'il est déjà calculé."""
+    if order is None:
+        order = np.lexsort(keys[::-1])
+    same = np.ones(max(len(order) - 1, 0), dtype=bool)
+    for key in keys:
+        same &= key[order[1:]] == key[order[:-1]]
+    rows = np.sort(order[1:][same])
+    report.add(f"{filename}:{label}:duplicate", filename, ERROR, f"duplicate {label}", rows, keys[0][rows])
+
+
+def _check_range(report: ValidationReport, filename: str, column: str, raw: np.ndarray, dtype,
+                 valid, required: bool = False, severity: str = ERROR) -> Tuple[np.ndarray, np.ndarray]:
+    """Contrôle format et plage d'une colonne numérique ; retourne (valeurs, présentes)."""
+    values, present, invalid = parse_numbers(raw, dtype)
+    rows = np.flatnonzero(invalid)
+    report.add(f"{filename}:{column}:format", filename, ERROR, f"{column} is not a number", rows, raw[rows])
+    if required:
+        report.add(f"{filename}:{column}:missing", filename, ERROR, f"{column} is empty", np.flatnonzero(~present & ~invalid))
+    rows = np.flatnonzero(present & ~valid(values))
+    report.add(f"{filename}:{column}:range", filename, severity, f"{column} out of range", rows, raw[rows])
+    return values, present
+
+
+def _check_times(report: ValidationReport, filename: str, column: str, raw: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    values, present, invalid = parse_times(raw)
+    rows = np.flatnonzero(invalid)
+    report.add(f"{filename}:{column}:format", filename, ERROR, f"{column} is not HH:MM:SS", rows, raw[rows])
+    return values, present
+
+
+def _check_sequences(report: ValidationReport, filename: str, group: np.ndarray, order: np.ndarray,
+                     measures: Iterable[Tuple[str, np.ndarray, np.ndarray]]) -> None:
+    """
+    Monotonie le long de chaque groupe (trajet, tracé), lignes triées par `order` : chaque
+    mesure (nom, valeurs, présentes) ne doit pas décroître d'une valeur présente à la suivante.
+    """
+    along = "trip" if filename == "stop_times.txt" else "shape"
+    for name, values, present in measures:
+        kept = order[present[order]]  # Valeurs présentes seulement, toujours dans l'ordre
+        same = group[kept[1:]] == group[kept[:-1]]
+        rows = np.sort(kept[1:][same & (values[kept[1:]] < values[kept[:-1]])])
+        report.add(f"{filename}:{name}:decreasing", filename, ERROR, f"{name} decreases along {along}", rows, values[rows])
+
+
+def validate_feed(data_dir: str = DATA_DIR) -> ValidationReport:
+    """Lit le flux de `data_dir` et exécute tous les contrôles, sans toucher à la base."""
+    report = ValidationReport()
+    feed = {}
+    for filename, columns in COLUMNS.items():
+        table = read_columns(os.path.join(data_dir, filename), columns)
+        if table is not None:
+            feed[filename] = table
+            report.rows[filename] = len(table[columns[0]])
+    for filename in ("agency.txt", "stops.txt", "routes.txt", "trips.txt", "stop_times.txt"):
+        if filename not in feed:
+            report.add(f"{filename}:missing", filename, ERROR, "required file is missing", np.array([-1]))
+    if "calendar.txt" not in feed and "calendar_dates.txt" not in feed:
+        report.add("calendar.txt:missing", "calendar.txt", ERROR, "calendar.txt and calendar_dates.txt are both missing", np.array([-1]))
+
+    empty = {name: np.zeros(0, dtype="S1") for name in ("agency_id", "stop_id", "route_id", "trip_id", "service_id", "shape_id")}
+    agency_ids = feed.get("agency.txt", empty)["agency_id"]
+    stop_ids = feed.get("stops.txt", empty)["stop_id"]
+    route_ids = feed.get("routes.txt", empty)["route_id"]
+    trip_ids = feed.get("trips.txt", empty)["trip_id"]
+    service_ids = np.concatenate([feed.get("calendar.txt", empty)["service_id"], feed.get("calendar_dates.txt", empty)["service_id"]])
+    shape_ids = feed.get("shapes.txt", empty)["shape_id"]
+
+    # Arrêts : unicité, coordonnées, hiérarchie des stations
+    stops = feed.get("stops.txt")
+    if stops is not None:
+        _check_unique(report, "stops.txt", "stop_id", stops["stop_id"])
+        location_type, has_type = _check_range(report, "stops.txt", "location_type", stops["location_type"], np.int64,
+                                               lambda v: (v >= 0) & (v <= 4))
+        located = ~has_type | (location_type <= 2)  # Coordonnées obligatoires pour 0, 1 et 2
+        for column, bound in (("stop_lat", 90), ("stop_lon", 180)):
+            values, present = _check_range(report, "stops.txt", column, stops[column], np.float64, lambda v, b=bound: np.abs(v) <= b)
+            rows = np.flatnonzero(located & ~present & (stops[column] == b""))
+            report.add(f"stops.txt:{column}:missing", "stops.txt", ERROR, f"{column} is empty", rows)
+        parent = stops["parent_station"]
+        _check_reference(report, "stops.txt", "parent_station", parent, stop_ids, "stops.txt", required=False)
+        stations = stop_ids[has_type & (location_type == 1)]
+        rows = np.flatnonzero((parent != b"") & np.isin(parent, stop_ids) & ~np.isin(parent, stations))
+        report.add("stops.txt:parent_station:type", "stops.txt", ERROR, "parent_station is not a station (location_type=1)", rows, parent[rows])
+        rows = np.flatnonzero(has_type & (location_type == 1) & (parent != b""))
+        report.add("stops.txt:parent_station:station", "stops.txt", ERROR, "a station cannot have a parent_station", rows, stop_ids[rows])
+
+    # Routes
+    routes = feed.get("routes.txt")
+    if routes is not None:
+        _check_unique(report, "routes.txt", "route_id", routes["route_id"])
+        _check_reference(report, "routes.txt", "agency_id", routes["agency_id"], agency_ids, "agency.txt", required=len(agency_ids) > 1)
+        _check_range(report, "routes.txt", "route_type", routes["route_type"], np.int64,
+                     lambda v: np.isin(v, BASIC_ROUTE_TYPES) | ((v >= 100) & (v <= 1702)), required=True)
+
+    # Trajets : route, service, tracé
+    trips = feed.get("trips.txt")
+    if trips is not None:
+        _check_unique(report, "trips.txt", "trip_id", trips["trip_id"])
+        _check_reference(report, "trips.txt", "route_id", trips["route_id"], route_ids, "routes.txt")
+        _check_reference(report, "trips.txt", "service_id", trips["service_id"], service_ids, "calendar.txt / calendar_dates.txt")
+        if "shapes.txt" in feed:
+            _check_reference(report, "trips.txt", "shape_id", trips["shape_id"], shape_ids, "shapes.txt", required=False)
+        _check_range(report, "trips.txt", "direction_id", trips["direction_id"], np.int64, lambda v: (v == 0) | (v == 1))
+
+    # Horaires : références, plages, monotonie le long de chaque trajet
+    stop_times = feed.get("stop_times.txt")
+    if stop_times is not None:
+        st_trip_ids, trip_codes = _check_reference(report, "stop_times.txt", "trip_id", stop_times["trip_id"], trip_ids, "trips.txt")
+        _check_reference(report, "stop_times.txt", "stop_id", stop_times["stop_id"], stop_ids, "stops.txt")
+        sequence, has_sequence = _check_range(report, "stop_times.txt", "stop_sequence", stop_times["stop_sequence"], np.int64,
+                                              lambda v: v >= 0, required=True)
+        for column in ("pickup_type", "drop_off_type"):
+            _check_range(report, "stop_times.txt", column, stop_times[column], np.int64, lambda v: (v >= 0) & (v <= 3))
+        dist, has_dist = _check_range(report, "stop_times.txt", "shape_dist_traveled", stop_times["shape_dist_traveled"],
+                                      np.float64, lambda v: v >= 0)
+        arrival, has_arrival = _check_times(report, "stop_times.txt", "arrival_time", stop_times["arrival_time"])
+        departure, has_departure = _check_times(report, "stop_times.txt", "departure_time", stop_times["departure_time"])
+        rows = np.flatnonzero(has_arrival & has_departure & (departure < arrival))
+        report.add("stop_times.txt:departure_time:before_arrival", "stop_times.txt", ERROR, "departure_time before arrival_time", rows,
+                   stop_times["departure_time"][rows])
+
+        # Un seul tri des lignes par (trajet, stop_sequence), partagé par les contrôles suivants
+        order = np.lexsort((sequence, trip_codes))
+        _check_unique(report, "stop_times.txt", "(trip_id, stop_sequence)", trip_codes, sequence, order=order)
+        # Sans stop_sequence lisible, la position dans le trajet est inconnue : ligne ignorée
+        has_arrival &= has_sequence
+        has_departure &= has_sequence
+        # Arrivée puis départ de chaque arrêt, dans l'ordre du trajet : une seule suite croissante
+        events = np.column_stack([arrival[order], departure[order]]).ravel()
+        kept = np.flatnonzero(np.column_stack([has_arrival[order], has_departure[order]]).ravel())
+        event_rows = order[kept // 2]
+        same = trip_codes[event_rows[1:]] == trip_codes[event_rows[:-1]]
+        rows = np.unique(event_rows[1:][same & (events[kept[1:]] < events[kept[:-1]])])
+        report.add("stop_times.txt:time:decreasing", "stop_times.txt", ERROR, "times decrease along the trip", rows,
+                   stop_times["arrival_time"][rows])
+        _check_sequences(report, "stop_times.txt", trip_codes, order, [("shape_dist_traveled", dist, has_dist & has_sequence)])
+        # Premier et dernier arrêt de chaque trajet : horaires obligatoires
+        boundaries = np.flatnonzero(np.diff(trip_codes[order]))
+        ends = np.unique(np.concatenate([order[:1], order[boundaries], order[boundaries + 1], order[-1:]]))
+        rows = ends[~(has_arrival[ends] & has_departure[ends])]
+        report.add("stop_times.txt:time:terminal", "stop_times.txt", ERROR, "first or last stop of a trip has no time", rows,
+                   stop_times["trip_id"][rows])
+        rows = np.flatnonzero(~np.isin(trip_ids, st_trip_ids))
+        report.add("trips.txt:stop_times:missing", "trips.txt", WARNING, "trip has no stop_times", rows, trip_ids[rows])
+
+    # Calendrier
+    calendar = feed.get("calendar.txt")
+    if calendar is not None:
+        _check_unique(report, "calendar.txt", "service_id", calendar["service_id"])
+        for day in DAYS:
+            _check_range(report, "calendar.txt", day, calendar[day], np.int64, lambda v: (v == 0) | (v == 1), required=True)
+        start, bad_start = parse_dates(calendar["start_date"])
+        end, bad_end = parse_dates(calendar["end_date"])
+        for column, bad in (("start_date", bad_start), ("end_date", bad_end)):
+            rows = np.flatnonzero(bad)
+            report.add(f"calendar.txt:{column}:format", "calendar.txt", ERROR, f"{column} is not a valid YYYYMMDD date", rows, calendar[column][rows])
+        rows = np.flatnonzero(~bad_start & ~bad_end & (end < start))
+        report.add("calendar.txt:end_date:before_start", "calendar.txt", ERROR, "end_date before start_date", rows, calendar["end_date"][rows])
+    calendar_dates = feed.get("calendar_dates.txt")
+    if calendar_dates is not None:
+        _, bad = parse_dates(calendar_dates["date"])
+        rows = np.flatnonzero(bad)
+        report.add("calendar_dates.txt:date:format", "calendar_dates.txt", ERROR, "date is not a valid YYYYMMDD date", rows, calendar_dates["date"][rows])
+        _check_range(report, "calendar_dates.txt", "exception_type", calendar_dates["exception_type"], np.int64,
+                     lambda v: (v == 1) | (v == 2), required=True)
+        _check_unique(report, "calendar_dates.txt", "(service_id, date)", calendar_dates["service_id"], calendar_dates["date"])
+
+    # Tracés : coordonnées, unicité et monotonie des points
+    shapes = feed.get("shapes.txt")
+    if shapes is not None:
+        for column, bound in (("shape_pt_lat", 90), ("shape_pt_lon", 180)):
+            _check_range(report, "shapes.txt", column, shapes[column], np.float64, lambda v, b=bound: np.abs(v) <= b, required=True)
+        sequence, _ = _check_range(report, "shapes.txt", "shape_pt_sequence", shapes["shape_pt_sequence"], np.int64,
+                                   lambda v: v >= 0, required=True)
+        dist, has_dist = _check_range(report, "shapes.txt", "shape_dist_traveled", shapes["shape_dist_traveled"],
+                                      np.float64, lambda v: v >= 0)
+        _, shape_codes = factorize(shapes["shape_id"])
+        order = np.lexsort((sequence, shape_codes))
+        _check_unique(report, "shapes.txt", "(shape_id, shape_pt_sequence)", shape_codes, sequence, order=order)
+        _check_sequences(report, "shapes.txt", shape_codes, order, [("shape_dist_traveled", dist, has_dist)])
+
+    # Fréquences
+    frequencies = feed.get("frequencies.txt")
+    if frequencies is not None:
+        _check_reference(report, "frequencies.txt", "trip_id", frequencies["trip_id"], trip_ids, "trips.txt")
+        start, has_start = _check_times(report, "frequencies.txt", "start_time", frequencies["start_time"])
+        end, has_end = _check_times(report, "frequencies.txt", "end_time", frequencies["end_time"])
+        rows = np.flatnonzero(has_start & has_end & (end <= start))
+        report.add("frequencies.txt:end_time:before_start", "frequencies.txt", ERROR, "end_time not after start_time", rows,
+                   frequencies["end_time"][rows])
+        _check_range(report, "frequencies.txt", "headway_secs", frequencies["headway_secs"], np.int64, lambda v: v > 0, required=True)
+        _check_unique(report, "frequencies.txt", "(trip_id, start_time)", frequencies["trip_id"], frequencies["start_time"])
+
+    # Correspondances
+    transfers = feed.get("transfers.txt")
+    if transfers is not None:
+        for column in ("from_stop_id", "to_stop_id"):
+            _check_reference(report, "transfers.txt", column, transfers[column], stop_ids, "stops.txt")
+        _check_range(report, "transfers.txt", "transfer_type", transfers["transfer_type"], np.int64, lambda v: (v >= 0) & (v <= 5))
+        _check_unique(report, "transfers.txt", "(from_stop_id, to_stop_id)", transfers["from_stop_id"], transfers["to_stop_id"])
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Valide le flux GTFS avant chargement (références, plages, monotonie).")
+    parser.add_argument("--data", default=DATA_DIR, help="Dossier du flux GTFS")
+    parser.add_argument("--json", help="Écrit le rapport complet dans ce fichier JSON")
+    args = parser.parse_args()
+
+    print("Validating GTFS feed...")
+    report = validate_feed(args.data)
+    report.print_summary()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report.to_dict(), f, ensure_ascii=False, indent=2)
+    sys.exit(0 if report.valid else 1)
+
+
+if __name__ == "__main__":
+    main()